@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Persistent summary tables shared by the questions.
+
+geo_year_summary is a rollup cube of the geo hierarchy (zip -> city -> county -> metro ->
+state) by year: one row per state, metro, county and city and year, holding the SUM, COUNT,
+MIN and MAX of yearlyindex and the number of distinct children in the group (metros,
+counties and cities, where they nest below the level; count_index counts the zips). It is
+built in one GROUPING SETS scan of the zip-level table, versioned by the fingerprint of the
+data it was computed from (in ingest_metadata under its own table_name), and merged
+incrementally when the ingest only appended rows: sums, counts, minima and maxima are folded
+in from the appended delta, and the distinct counts, which do not add up, are recounted for
+the years the delta touches only.
+
+state_year_summary is the cube's state level as a view, so Q1, Q2, Q4, the Excel workbooks
+and growth.py's dense geo x year matrices all read a few thousand pre-aggregated rows
+instead of re-scanning the zip-level table.
+"""
+import duckdb
+
+SOURCE_TABLE = "home_values_yearly_clean"
+SUMMARY_TABLE = "state_year_summary"
+GEO_SUMMARY_TABLE = "geo_year_summary"
+META_TABLE = "ingest_metadata"
+DELTA_TABLE = "ingest_delta"
+
+GEO_KEY = ("level", "statename", "geo", "year")
+# Distinct children counted per level (NULL in the cube for levels they do not nest below).
+# Zips need no column: with one row per zip and year, count_index is the number of zips.
+CHILD_COUNTS = {
+    "n_metros": ("metro", ("state",)),
+    "n_counties": ("countyname", ("state", "metro")),
+    "n_cities": ("city", ("state", "metro", "county")),
+}
+GEO_SUMMARY_COLUMNS = ("level", "statename", "geo", "year", "sum_index", "count_index", "min_index",
+                       "max_index", *CHILD_COUNTS)
+
+# The level of each grouping set; metros can span states, so they are keyed by name alone
+# (statename = '')
+_LEVEL = """CASE WHEN GROUPING(city) = 0 THEN 'city'
+                 WHEN GROUPING(countyname) = 0 THEN 'county'
+                 WHEN GROUPING(metro) = 0 THEN 'metro'
+                 ELSE 'state' END"""
+_GEO = """CASE WHEN GROUPING(city) = 0 THEN city
+               WHEN GROUPING(countyname) = 0 THEN countyname
+               WHEN GROUPING(metro) = 0 THEN metro
+               ELSE statename END"""
+
+def _child_counts_sql() -> str:
+    # Children are told apart with their state, as county and city names repeat across states
+    return ",".join(f"""
+            CASE WHEN ({_LEVEL}) IN ({', '.join(repr(lv) for lv in levels)})
+                 THEN COUNT(DISTINCT CASE WHEN {column} IS NOT NULL THEN (statename, {column}) END)
+            END AS {name}""" for name, (column, levels) in CHILD_COUNTS.items())
+
+def _geo_summary_select(source: str, measures: bool = True, where: str = "") -> str:
+    """
+    The cube's rows from source (measures=False: keys and child counts only). The scan first
+    aggregates to the leaves of the hierarchy, so the DISTINCT counts of the grouping sets
+    run over one row per (state, metro, county, city, year) instead of one per zip.
+    """
+    values = """
+            SUM(sum_index) AS sum_index,
+            SUM(count_index) AS count_index,
+            MIN(min_index) AS min_index,
+            MAX(max_index) AS max_index,""" if measures else ""
+    return f"""
+        WITH leaves AS (
+            SELECT statename, metro, countyname, city, year,
+                   SUM(yearlyindex) AS sum_index,
+                   COUNT(yearlyindex) AS count_index,
+                   MIN(yearlyindex) AS min_index,
+                   MAX(yearlyindex) AS max_index
+            FROM {source}
+            WHERE yearlyindex IS NOT NULL AND statename IS NOT NULL{where}
+            GROUP BY statename, metro, countyname, city, year
+        )
+        SELECT
+            {_LEVEL} AS level,
+            CASE WHEN GROUPING(metro) = 0 THEN '' ELSE statename END AS statename,
+            {_GEO} AS geo,
+            year,{values}{_child_counts_sql()}
+        FROM leaves
+        GROUP BY GROUPING SETS (
+            (statename, year),
+            (metro, year),
+            (statename, countyname, year),
+            (statename, city, year)
+        )
+        HAVING {_GEO} IS NOT NULL
+    """
+
+def build_geo_year_summary(con: duckdb.DuckDBPyConnection, source: str = SOURCE_TABLE,
+                           table: str = GEO_SUMMARY_TABLE):
+    """Full rebuild of every level from the zip-level table (one scan) into table."""
+    counts = ", ".join(f"{name} BIGINT" for name in CHILD_COUNTS)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} (
+            level VARCHAR,
+            statename VARCHAR,
+            geo VARCHAR,
+            year SMALLINT,
+            sum_index DOUBLE,
+            count_index BIGINT,
+            min_index DOUBLE,
+            max_index DOUBLE,
+            {counts},
+            PRIMARY KEY (level, statename, geo, year)
+        );
+    """)
+    con.execute(f"INSERT INTO {table} {_geo_summary_select(source)};")
+
+def merge_geo_year_summary(con: duckdb.DuckDBPyConnection, delta: str = DELTA_TABLE,
+                           source: str = SOURCE_TABLE):
+    """Fold newly appended rows into every level's measures, then recount the touched years."""
+    key = ", ".join(GEO_KEY)
+    con.execute(f"""
+        INSERT INTO {GEO_SUMMARY_TABLE} {_geo_summary_select(delta)}
+        ON CONFLICT ({key}) DO UPDATE SET
+            sum_index = sum_index + EXCLUDED.sum_index,
+            count_index = count_index + EXCLUDED.count_index,
+            min_index = LEAST(min_index, EXCLUDED.min_index),
+            max_index = GREATEST(max_index, EXCLUDED.max_index);
+    """)
+    # Distinct children are not additive: recount them from source, for the delta's years only
+    touched = f" AND year IN (SELECT DISTINCT year FROM {delta})"
+    assignments = ", ".join(f"{name} = recount.{name}" for name in CHILD_COUNTS)
+    match = " AND ".join(f"{GEO_SUMMARY_TABLE}.{k} = recount.{k}" for k in GEO_KEY)
+    con.execute(f"""
+        UPDATE {GEO_SUMMARY_TABLE} SET {assignments}
+        FROM ({_geo_summary_select(source, measures=False, where=touched)}) AS recount
+        WHERE {match};
+    """)
+
+def ensure_state_year_view(con: duckdb.DuckDBPyConnection):
+    """(Re)create state_year_summary as the cube's state level (replacing the old table)."""
+    if _table_exists(con, SUMMARY_TABLE):
+        con.execute(f"DROP TABLE {SUMMARY_TABLE};")
+        con.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?;", [SUMMARY_TABLE])
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {SUMMARY_TABLE} AS
+        SELECT statename, year, sum_index, count_index, min_index, max_index
+        FROM {GEO_SUMMARY_TABLE}
+        WHERE level = 'state';
+    """)
+
+def _version(con: duckdb.DuckDBPyConnection, table: str):
+    return con.execute(
+        f"SELECT sha256, parent_sha256 FROM {META_TABLE} WHERE table_name = ?;", [table]
+    ).fetchone()
+
+# Only main: quality.py keeps a geo_year_summary of the cleaned data in its own schema
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str, temporary: bool = False) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = ? AND temporary = ?;",
+        [table, temporary],
+    ).fetchone()[0] > 0
+
+def _columns(con: duckdb.DuckDBPyConnection, table: str) -> list:
+    return [row[0] for row in con.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE schema_name = 'main' AND table_name = ? AND NOT internal "
+        "ORDER BY column_index;", [table]).fetchall()]
+
+def refresh_summary(con: duckdb.DuckDBPyConnection, table: str, build, merge,
+                    source: str = SOURCE_TABLE, columns=None) -> str:
+    """
+    Bring a summary table up to date with source. Returns "skip" when it already matches
+    the ingested data version, "merge" when only the appended delta had to be folded in,
+    and "build" after a full rebuild.
+    """
+    base = _version(con, source)
+    current = _version(con, table)
+    # A table from an older layout (other columns) is rebuilt rather than merged into
+    exists = _table_exists(con, table) and (columns is None or _columns(con, table) == list(columns))
+    if base and current and exists and current[0] == base[0]:
+        print(f"[skip] {table} is up to date")
+        return "skip"
+    if (base and current and exists and base[1] == current[0]
+            and _table_exists(con, DELTA_TABLE, temporary=True)):
+        merge(con)
+        action = "merge"
+    else:
+        build(con, source)
+        action = "build"
+
+    record_version(con, table, source, parent=current[0] if current else None)
+    print(f"[ok] {table}: {action}")
+    return action
+
+def record_version(con: duckdb.DuckDBPyConnection, table: str, source: str = SOURCE_TABLE, parent: str = None):
+    """Version table (in ingest_metadata) with the fingerprint of the source data it was computed from."""
+    con.execute(f"""
+        INSERT OR REPLACE INTO {META_TABLE}
+            (table_name, source_path, size_bytes, mtime, sha256, schema_json, row_count,
+             ingested_at, parent_sha256)
+        SELECT ?, source_path, size_bytes, mtime, sha256, NULL,
+               (SELECT COUNT(*) FROM {table}), now()::TIMESTAMP, ?
+        FROM {META_TABLE} WHERE table_name = ?;
+    """, [table, parent, source])
+
+def refresh_geo_year_summary(con: duckdb.DuckDBPyConnection, source: str = SOURCE_TABLE) -> str:
+    """Bring geo_year_summary (and its state_year_summary view) up to date (see refresh_summary)."""
+    action = refresh_summary(con, GEO_SUMMARY_TABLE, build_geo_year_summary,
+                             lambda c: merge_geo_year_summary(c, source=source), source, GEO_SUMMARY_COLUMNS)
+    ensure_state_year_view(con)
+    return action
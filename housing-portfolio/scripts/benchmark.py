@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Benchmark the pipeline on synthetic data of increasing size.
+
+For each --sizes entry (default 1M, 10M and 100M rows) a deterministic dataset is generated
+once (scripts/generate_synthetic_data.py) into its own work directory, then every step is
+timed in a fresh process so its peak memory can be read from the OS:
+
+    ingest, parquet, summary              CSV import, Parquet staging, geo x year rollup cube
+    q1, q2, city_growth, q4               the report queries (city_growth = Q3A + Q3B)
+    figures                               all five report figures
+    excel_q1 .. excel_q4                  each Excel workbook
+
+Results (wall and CPU seconds, peak RSS, rows) are printed and saved as JSON under
+reports/benchmarks/ together with the git commit, library versions and machine, so runs on
+different commits can be compared with --compare.
+
+Usage:
+    python scripts/benchmark.py --sizes 1M 10M
+    python scripts/benchmark.py --sizes 1M --steps 'q*' --repeat 3 --compare reports/benchmarks/<old>.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+import execution
+from generate_synthetic_data import format_count, generate, parse_count
+from profiling import peak_rss_mb, reset_peak_rss
+
+REPO = Path(__file__).resolve().parents[1]
+WORK_DIR = REPO / "data" / "benchmark"
+RESULTS_DIR = REPO / "reports" / "benchmarks"
+RESULTS_VERSION = 1
+
+STEPS = ["ingest", "parquet", "summary", "q1", "q2", "city_growth", "q4", "figures",
+         "excel_q1", "excel_q2", "excel_q3", "excel_q4"]
+DEFAULT_SIZES = ["1M", "10M", "100M"]
+
+# -- steps (run inside a fresh worker process, with cwd = the size's work directory) ------
+
+def _use_workdir(workdir: Path):
+    """Point the pipeline modules at workdir instead of the repository's data/ and reports/."""
+    os.chdir(workdir)
+    for sub in ("data", "reports/figures", "excel"):
+        (workdir / sub).mkdir(parents=True, exist_ok=True)
+    import run_analysis
+    import create_excel_workbooks  # noqa: F401  (imported here so steps don't time it)
+    run_analysis.DATA = workdir / "data"
+    run_analysis.REPORTS = workdir / "reports"
+    run_analysis.FIGS = workdir / "reports" / "figures"
+    run_analysis.CACHE = workdir / "data" / "pipeline_cache"
+    return run_analysis
+
+def _connect(workdir: Path, source: str, read_only: bool = True):
+    import execution
+    from staging import use_parquet_source
+    con = execution.connect(str(workdir / "data" / "housing.duckdb"), read_only=read_only)
+    if source == "parquet":
+        use_parquet_source(con)
+    return con
+
+def _save_frame(workdir: Path, name: str, df):
+    # Query results are handed to the figures step through small pickles
+    df.to_pickle(workdir / "reports" / f"bench_{name}.pkl")
+    return len(df)
+
+def _load_frame(workdir: Path, name: str):
+    import pandas as pd
+    return pd.read_pickle(workdir / "reports" / f"bench_{name}.pkl")
+
+def _step_ingest(ra, workdir, csv_path, options):
+    con = ra.load_into_duckdb(Path(csv_path), reingest=True)
+    rows = con.execute(f"SELECT COUNT(*) FROM {ra.TABLE}").fetchone()[0]
+    con.close()
+    return rows
+
+def _step_parquet(ra, workdir, csv_path, options):
+    from staging import MANIFEST, stage_parquet
+    out_dir = workdir / "data" / "parquet" / ra.TABLE
+    (out_dir / MANIFEST).unlink(missing_ok=True)      # always rewrite
+    con = _connect(workdir, "table", read_only=False)
+    stage_parquet(con, out_dir=out_dir, partition_by_year=options["partition_year"])
+    con.close()
+    return sum(1 for _ in out_dir.rglob("*.parquet"))
+
+def _step_summary(ra, workdir, csv_path, options):
+    from aggregates import GEO_SUMMARY_TABLE, META_TABLE, refresh_geo_year_summary
+    con = _connect(workdir, "table", read_only=False)
+    # Forget the cube's version so refresh does a full (recorded) rebuild
+    con.execute(f"DELETE FROM {META_TABLE} WHERE table_name = ?;", [GEO_SUMMARY_TABLE])
+    refresh_geo_year_summary(con)
+    rows = con.execute(f"SELECT COUNT(*) FROM {GEO_SUMMARY_TABLE}").fetchone()[0]
+    con.close()
+    return rows
+
+def _query_step(name, query):
+    def step(ra, workdir, csv_path, options):
+        con = _connect(workdir, options["source"])
+        result = getattr(ra, query)(con)
+        con.close()
+        if isinstance(result, tuple):
+            return sum(_save_frame(workdir, f"{name}_{i}", df) for i, df in enumerate(result))
+        return _save_frame(workdir, name, result)
+    return step
+
+def _step_figures(ra, workdir, csv_path, options):
+    from charts import (render, q1_trend_chart, q2_growth_chart, q3a_absolute_growth_chart,
+                        q3b_pct_growth_chart, q4_volatility_chart)
+    figs = ra.FIGS
+    jobs = [
+        ("q1", q1_trend_chart, figs / "Q1_Top10_States_Average_Values.png", {}),
+        ("q2", q2_growth_chart, figs / "Q2_Top5_Home_Values_Growth.png", {}),
+        ("city_growth_0", q3a_absolute_growth_chart, figs / "Q3A_Top5_Cities_Absolute_Growth.png", {}),
+        ("city_growth_1", q3b_pct_growth_chart, figs / "Q3B_Top5_Cities_Percentage_Growth.png", {}),
+        ("q4", q4_volatility_chart, figs / "Q4_Top5_States_Highest_Volatility.png", {}),
+    ]
+    return sum(render(_load_frame(workdir, name), builder, out, **opts) is not None
+               for name, builder, out, opts in jobs)
+
+def _step_excel(question):
+    def step(ra, workdir, csv_path, options):
+        import create_excel_workbooks as cew
+        cew.EXCEL_DIR.mkdir(exist_ok=True)
+        if question == 1:
+            cew.create_q1_workbook(cew.load_state_yearly(), raw_rows=options["raw_rows"])
+        elif question == 2:
+            cew.create_q2_workbook(cew.load_state_yearly())
+        elif question == 3:
+            cew.create_q3_workbook(cew.load_city_growth(), cew.load_top_city_per_state())
+        else:
+            cew.create_q4_workbook(cew.load_state_coverage())
+        return None
+    return step
+
+STEP_FUNCS = {
+    "ingest": _step_ingest,
+    "parquet": _step_parquet,
+    "summary": _step_summary,
+    "q1": _query_step("q1", "query_q1"),
+    "q2": _query_step("q2", "query_q2"),
+    "city_growth": _query_step("city_growth", "city_growth"),
+    "q4": _query_step("q4", "query_q4"),
+    "figures": _step_figures,
+    "excel_q1": _step_excel(1),
+    "excel_q2": _step_excel(2),
+    "excel_q3": _step_excel(3),
+    "excel_q4": _step_excel(4),
+}
+
+def _prepare(ra, workdir: Path, csv_path: str, step: str, options: dict):
+    """Bring the inputs of step up to date (untimed; a no-op when they already are)."""
+    if step == "ingest":
+        return
+    from aggregates import refresh_geo_year_summary
+    from snapshots import publish
+    from staging import stage_parquet
+    con = ra.load_into_duckdb(Path(csv_path))
+    if step != "summary":
+        refresh_geo_year_summary(con)
+    if step.startswith("excel"):
+        # The workbooks read the published snapshot, as they do after run_analysis.py
+        publish(con, workdir / "data", ra.read_ingest_metadata(con)["sha256"])
+    if step != "parquet" and options["source"] == "parquet":
+        stage_parquet(con, out_dir=workdir / "data" / "parquet" / ra.TABLE,
+                      partition_by_year=options["partition_year"])
+    con.close()
+
+def measure(step: str, workdir: str, csv_path: str, options: dict) -> dict:
+    """Worker entry point: run one step and report its cost (imports and inputs are not timed)."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    workdir = Path(workdir)
+    ra = _use_workdir(workdir)
+    _prepare(ra, workdir, csv_path, step, options)
+    reset_peak_rss()
+    base_rss = peak_rss_mb()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    rows = STEP_FUNCS[step](ra, workdir, csv_path, options)
+    seconds, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    return {
+        "seconds": round(seconds, 4),
+        "cpu_seconds": round(cpu, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "import_rss_mb": round(base_rss, 1),
+        "rows": rows,
+    }
+
+def run_step(step: str, workdir: Path, csv_path: Path, options: dict) -> dict:
+    # One process per step: peak RSS is a high-water mark and never goes down in-process
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(measure, step, str(workdir), str(csv_path), options).result()
+
+# -- results ------------------------------------------------------------------------------
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=REPO, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> dict:
+    import duckdb, matplotlib, numpy, openpyxl, pandas
+    return {
+        "git_commit": _git("rev-parse", "HEAD"),
+        "git_dirty": bool(_git("status", "--porcelain", "--", "scripts", "sql")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "versions": {m.__name__: m.__version__ for m in (duckdb, pandas, numpy, matplotlib, openpyxl)},
+    }
+
+def summarize(results: list) -> dict:
+    """{(rows, step): {"seconds": median, "peak_rss_mb": max, "step_rss_mb": max}} over the repeats."""
+    grouped = {}
+    for r in results:
+        grouped.setdefault((r["size"], r["step"]), []).append(r)
+    return {key: {"seconds": statistics.median(r["seconds"] for r in runs),
+                  "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+                  "step_rss_mb": max(r["peak_rss_mb"] - r["import_rss_mb"] for r in runs)}
+            for key, runs in grouped.items()}
+
+def print_table(results: list):
+    # step MB: growth of the peak over the process after imports (the step's own footprint)
+    print(f"\n{'rows':>8}  {'step':<12} {'seconds':>9} {'peak MB':>9} {'step MB':>9}")
+    for (size, step), s in summarize(results).items():
+        print(f"{format_count(size):>8}  {step:<12} {s['seconds']:>9.3f} "
+              f"{s['peak_rss_mb']:>9.1f} {s['step_rss_mb']:>9.1f}")
+
+def compare(results: list, baseline_path: Path, threshold: float) -> int:
+    """Print time/memory ratios against a previous results file; returns regression count."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    before, after = summarize(baseline["results"]), summarize(results)
+    commit = (baseline["environment"].get("git_commit") or "?")[:10]
+    print(f"\nCompared with {baseline_path} (commit {commit}):")
+    print(f"{'rows':>8}  {'step':<12} {'time x':>8} {'memory x':>9}")
+    regressions = 0
+    for key in after:
+        if key not in before:
+            continue
+        t = after[key]["seconds"] / max(before[key]["seconds"], 1e-9)
+        m = after[key]["peak_rss_mb"] / max(before[key]["peak_rss_mb"], 1e-9)
+        flag = ""
+        if t > threshold or m > threshold:
+            flag = "  <- regression"
+            regressions += 1
+        print(f"{format_count(key[0]):>8}  {key[1]:<12} {t:>8.2f} {m:>9.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, type=parse_count,
+                        help="Dataset sizes in rows (e.g. 1M 10M 100M).")
+    parser.add_argument("--steps", nargs="+", default=["*"], metavar="STEP",
+                        help=f"Steps to time (glob patterns). Steps: {', '.join(STEPS)}.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per step (the median is reported).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data.")
+    parser.add_argument("--source", choices=["table", "parquet"], default="table",
+                        help="Run the query steps against the DuckDB table or the Parquet staging layer.")
+    parser.add_argument("--partition-year", action="store_true",
+                        help="Partition the Parquet staging layer by statename and year.")
+    parser.add_argument("--raw-rows", type=int, default=1_048_575,
+                        help="Rows streamed into the Q1 Raw_Data sheet (default: one full sheet; 0 = all).")
+    parser.add_argument("--workdir", type=str, default=str(WORK_DIR),
+                        help="Where synthetic data and per-size databases are kept between runs.")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Results JSON (default: reports/benchmarks/bench-<time>-<commit>.json).")
+    parser.add_argument("--compare", type=str, default=None, metavar="RESULTS_JSON",
+                        help="Previous results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="Time or memory ratio above which --compare reports a regression.")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    # Step workers inherit the profile through the environment
+    execution.configure_from_args(args)
+
+    steps = [s for s in STEPS if any(fnmatch.fnmatchcase(s, p) for p in args.steps)]
+    if not steps:
+        parser.error(f"no step matches {', '.join(args.steps)}; steps: {', '.join(STEPS)}")
+    options = {"source": args.source, "partition_year": args.partition_year,
+               "raw_rows": args.raw_rows or None, "execution": execution.settings()}
+
+    results = []
+    for size in args.sizes:
+        label = format_count(size)
+        workdir = Path(args.workdir).resolve() / label
+        csv_path = workdir / "data" / f"synthetic_{label}_seed{args.seed}.csv"
+        if not csv_path.exists():
+            t0 = time.perf_counter()
+            generate(csv_path, size, args.seed)
+            print(f"[ok] generated {label} rows in {time.perf_counter() - t0:.1f}s")
+        for step in steps:
+            for run in range(1, args.repeat + 1):
+                r = run_step(step, workdir, csv_path, options)
+                results.append({"size": size, "step": step, "run": run, **r})
+                print(f"[ok] {label} {step} run {run}: {r['seconds']:.3f}s, "
+                      f"{r['peak_rss_mb']:.0f} MB peak")
+
+    env = environment()
+    stamp = datetime.now(timezone.utc)
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        f"bench-{stamp:%Y%m%d-%H%M%S}-{(env['git_commit'] or 'nogit')[:10]}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "version": RESULTS_VERSION,
+        "created_at": stamp.isoformat(timespec="seconds"),
+        "environment": env,
+        "options": {**options, "seed": args.seed, "repeat": args.repeat},
+        "results": results,
+    }, indent=2), encoding="utf-8")
+    print_table(results)
+    print(f"[ok] wrote {out}")
+    if args.compare and compare(results, Path(args.compare), args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
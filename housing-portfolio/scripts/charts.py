@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Figure builders for the portfolio reports and a process-pool renderer.
+
+Every builder is a pure function of (DataFrame, output path, options): it draws on its own
+Figure, saves it and closes it, so builders can run concurrently in worker processes.
+ChartRenderer submits each figure as soon as its data is ready and waits for all of them
+at the end; with workers=1 it renders serially in the calling process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")  # headless: no display needed in workers or on CI
+import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from matplotlib.ticker import FuncFormatter
+import numpy as np
+import pandas as pd
+
+DPI = 200
+PALETTE = ['#2E7D32', '#1976D2', '#D32F2F', '#F57C00', '#7B1FA2', '#388E3C', '#303F9F', '#C2185B', '#FBC02D', '#5D4037']
+
+def _save(fig, out: Path) -> Path:
+    fig.tight_layout()
+    fig.savefig(out, dpi=DPI, bbox_inches="tight")
+    plt.close(fig)
+    return out
+
+def bar_chart(df: pd.DataFrame, out: Path, x: str, y: str, title: str, top_n: int = 10) -> Path:
+    if top_n and len(df) > top_n:
+        df = df.nlargest(top_n, y)
+
+    # Sort with highest values on the left (ascending=False)
+    df = df.sort_values(y, ascending=False)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bars = ax.bar(df[x], df[y], color="#2E7D32", alpha=0.8, edgecolor='white', linewidth=1)
+    ax.set_title(title, fontsize=16, fontweight="bold", pad=20)
+    ax.set_xlabel("State", fontsize=12, fontweight="bold")
+    ax.set_ylabel("Growth Percentage (%)", fontsize=12, fontweight="bold")
+    ax.tick_params(axis='x', labelrotation=45, labelsize=10)
+    ax.tick_params(axis='y', labelsize=10)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+
+    # Add value labels on top of bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
+                f'{height:.1f}%', ha='center', va='bottom', fontsize=10, fontweight="bold")
+
+    # Add subtle grid
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+    return _save(fig, out)
+
+def q1_trend_chart(df1: pd.DataFrame, out: Path, states: list = None, series: str = 'statename',
+                   title: str = 'Top 10 States by Yearly Average Values Index (2000-2025)') -> Path:
+    """Line chart of yearly averages, one line per value of series in the given order (default: df1's)."""
+    if states is None:
+        states = list(dict.fromkeys(df1[series]))
+    fig, ax = plt.subplots(figsize=(14, 8))
+    for i, state in enumerate(states):
+        state_data = df1[df1[series] == state]
+        ax.plot(state_data['year'], state_data['avg_yearly_index'], marker='o', label=state, linewidth=2, color=PALETTE[i % len(PALETTE)])
+
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_xlabel('Year', fontsize=12)
+    ax.set_ylabel('Average Home Value Index', fontsize=12)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.grid(True, alpha=0.3)
+    return _save(fig, out)
+
+def q2_growth_chart(df2: pd.DataFrame, out: Path, x: str = 'statename', xlabel: str = 'States',
+                    title: str = 'Top 5 States: Home Value Growth (2000-2025)') -> Path:
+    """Combo chart: absolute growth bars (left axis) and % growth line (right axis)."""
+    absolute_growth = df2['value_2025'] - df2['value_2000']
+
+    # Create combo chart with bars and line
+    fig, ax1 = plt.subplots(figsize=(12, 8))
+
+    # Create bars for absolute growth (left y-axis) - Dark blue
+    bars = ax1.bar(df2[x], absolute_growth, color='#1f4e79', alpha=0.8, width=0.6)
+    ax1.set_xlabel(xlabel, fontsize=12, fontweight='bold')
+    ax1.set_ylabel('Increase in Home Values ($)', fontsize=12, fontweight='bold', color='black')
+    # Fixed $0-700k scale, widened only for growth outside it (e.g. smaller geographies)
+    if 0 <= absolute_growth.min() and absolute_growth.max() <= 700000:
+        ax1.set_ylim(0, 700000)
+        ax1.set_yticks(range(0, 700001, 100000))
+    else:
+        ax1.set_ylim(min(0, absolute_growth.min() * 1.15), max(700000, absolute_growth.max() * 1.15))
+    ax1.tick_params(axis='y', labelcolor='black')
+
+    # Format left Y-axis tick labels with commas
+    ax1.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x:,.0f}'))
+
+    # Add value labels on bars
+    for bar in bars:
+        height = bar.get_height()
+        ax1.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
+                f'${height:,.0f}', ha='center', va='bottom', fontsize=10, fontweight='bold', color='black')
+
+    # Create second y-axis for percentage growth
+    ax2 = ax1.twinx()
+    ax2.plot(df2[x], df2['pct_growth'], color='#FFD700', marker='o',
+             linewidth=3, markersize=8, label='% Growth')
+    ax2.set_ylabel('% Growth (2000-2025)', fontsize=12, fontweight='bold', color='black')
+    if 0 <= df2['pct_growth'].min() and df2['pct_growth'].max() <= 400:
+        ax2.set_ylim(0, 400)
+        ax2.set_yticks(range(0, 401, 50))
+    else:
+        ax2.set_ylim(min(0, df2['pct_growth'].min() * 1.15), max(400, df2['pct_growth'].max() * 1.15))
+    ax2.tick_params(axis='y', labelcolor='black')
+
+    # Format right Y-axis tick labels with % symbol
+    ax2.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x:.0f}%'))
+
+    # Add percentage labels on line points
+    for i, pct in enumerate(df2['pct_growth']):
+        ax2.text(i, pct + 10, f'{pct:.2f}%', ha='center', va='bottom',
+                fontsize=10, fontweight='bold', color='black')
+
+    ax1.set_title(title, fontsize=16, fontweight='bold', pad=20)
+
+    # Create custom legend
+    legend_elements = [Patch(facecolor='#1f4e79', label='Absolute Growth'),
+                      Line2D([0], [0], color='#FFD700', linewidth=3, marker='o', label='% Growth')]
+    ax1.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=2)
+
+    ax1.grid(True, alpha=0.3, axis='y')
+    return _save(fig, out)
+
+def q3a_absolute_growth_chart(df3a: pd.DataFrame, out: Path,
+                              title: str = 'Top 5 Cities by Absolute Home Values Growth (2000-2025)') -> Path:
+    """Clustered 2000/2025 bars for the top cities by absolute growth."""
+    # Sort by absolute growth descending (highest first)
+    df3a = df3a.sort_values('absolute_growth', ascending=False)
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    # Create clustered bar chart: 2000 and 2025 values
+    x = np.arange(len(df3a))
+    width = 0.35
+
+    # Light blue bars for 2000 values, dark blue bars for 2025 values
+    ax.bar(x - width/2, df3a['value_2000'], width, label='2000', color='#87CEEB', alpha=0.8)
+    bars_2025 = ax.bar(x + width/2, df3a['value_2025'], width, label='2025', color='#1f4e79', alpha=0.8)
+
+    ax.set_xlabel('Cities', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Home Values Index ($)', fontsize=12, fontweight='bold')
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xticks(x)
+    ax.set_xticklabels(df3a['city'], fontsize=10)
+
+    # Leave headroom above the tallest bar for the growth labels
+    ax.set_ylim(0, df3a['value_2025'].max() * 1.15)
+
+    # Format y-axis with commas and dollar signs
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'${x:,.0f}'))
+
+    # Add red text labels for absolute growth above bars
+    for bar_2025, growth in zip(bars_2025, df3a['absolute_growth']):
+        height_2025 = bar_2025.get_height()
+        ax.text(bar_2025.get_x() + bar_2025.get_width()/2., height_2025 + height_2025*0.01,
+               f'+${growth:,.0f}', ha='center', va='bottom', fontsize=10, fontweight='bold', color='red')
+
+    ax.legend(loc='upper left')
+    ax.grid(True, alpha=0.3, axis='y')
+    return _save(fig, out)
+
+def q3b_pct_growth_chart(df3b: pd.DataFrame, out: Path,
+                         title: str = 'Top 5 Cities by % Growth in Home Values (2000-2025)') -> Path:
+    """Clustered 2000/2025 bars plus a % growth line for the top cities by % growth."""
+    # Sort by percentage growth descending (highest first)
+    df3b = df3b.sort_values('pct_growth', ascending=False)
+
+    fig, ax1 = plt.subplots(figsize=(12, 8))
+
+    # Create clustered bar chart: 2000 and 2025 values
+    x = np.arange(len(df3b))
+    width = 0.35
+    ax1.bar(x - width/2, df3b['value_2000'], width, label='2000', color='#87CEEB', alpha=0.8)
+    ax1.bar(x + width/2, df3b['value_2025'], width, label='2025', color='#1f4e79', alpha=0.8)
+
+    ax1.set_xlabel('Cities', fontsize=12, fontweight='bold')
+    ax1.set_ylabel('Home Value Index ($)', fontsize=12, fontweight='bold')
+    ax1.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(df3b['city'], fontsize=10)
+
+    # Leave headroom above the tallest bar
+    ax1.set_ylim(0, df3b[['value_2000', 'value_2025']].max().max() * 1.15)
+
+    # Format y-axis with commas and dollar signs
+    ax1.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'${x:,.0f}'))
+
+    # Create second y-axis for percentage growth
+    ax2 = ax1.twinx()
+    ax2.set_ylabel('% Growth (2000-2025)', fontsize=12, fontweight='bold')
+
+    # Right y-axis scaled to the largest percentage growth plus room for its label
+    ax2.set_ylim(0, df3b['pct_growth'].max() * 1.2)
+
+    # Yellow line with data points for percentage growth
+    ax2.plot(x, df3b['pct_growth'], color='#FFD700', marker='o', linewidth=3, markersize=8, label='% Growth')
+
+    # Add percentage labels on the line points
+    for i, pct in enumerate(df3b['pct_growth']):
+        ax2.text(i, pct + pct*0.05, f'{pct:.2f}%', ha='center', va='bottom',
+                fontsize=10, fontweight='bold', color='black')
+
+    lines1, labels1 = ax1.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
+
+    ax1.grid(True, alpha=0.3, axis='y')
+    return _save(fig, out)
+
+def q4_volatility_chart(df4: pd.DataFrame, out: Path, y: str = 'state', ylabel: str = 'State',
+                        title: str = 'Top 5 States with Highest Housing Value Volatility (Year-over-Year)') -> Path:
+    """Horizontal bars of YoY volatility, highest at the top."""
+    df4 = df4.sort_values('volatility_pct', ascending=True)
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    bars = ax.barh(df4[y], df4['volatility_pct'], color="#D32F2F", alpha=0.8, edgecolor='white', linewidth=1)
+
+    ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel('Volatility (Standard Deviation of YoY Changes)', fontsize=12, fontweight='bold')
+    ax.set_ylabel(ylabel, fontsize=12, fontweight='bold')
+    ax.tick_params(labelsize=10)
+
+    # Add value labels on the right side of bars
+    for bar in bars:
+        width = bar.get_width()
+        ax.text(width + width*0.01, bar.get_y() + bar.get_height()/2,
+                f'{width:.2f}%', ha='left', va='center', fontsize=10, fontweight='bold')
+
+    ax.grid(axis='x', alpha=0.3, linestyle='--')
+    return _save(fig, out)
+
+def render(df: pd.DataFrame, builder, out: Path, **options):
+    """
+    Run builder unless there is nothing to plot; returns the written path or None.
+    df may be an Arrow table (the pipeline's query stages); it is converted here, in the worker.
+    """
+    if df is not None and hasattr(df, "to_pandas"):
+        df = df.to_pandas()
+    if df is None or df.empty:
+        print(f"[warn] no data for {Path(out).name}; figure skipped")
+        return None
+    return builder(df, out, **options)
+
+def default_workers() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+class ChartRenderer:
+    """
+    Render figures concurrently in a pool of worker processes.
+
+    Use as a context manager: submit() a builder as soon as its data is ready; leaving the
+    block waits for every figure and reports it. workers=1 renders serially, inline.
+    """
+    def __init__(self, workers: int = None):
+        self.workers = default_workers() if workers is None else max(1, workers)
+        self._pool = None
+        self._pending = []
+
+    def __enter__(self):
+        if self.workers > 1:
+            # spawn: never fork a process that holds DuckDB's threads and locks
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        return self
+
+    def submit(self, builder, df: pd.DataFrame, out: Path, **options):
+        if self._pool is None:
+            self._report(render(df, builder, out, **options))
+        else:
+            self._pending.append(self._pool.submit(render, df, builder, out, **options))
+
+    def wait(self):
+        for future in self._pending:
+            self._report(future.result())
+        self._pending = []
+
+    @staticmethod
+    def _report(out):
+        if out is not None:
+            print(f"[ok] wrote {out}")
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=exc_type is not None)
+        return False
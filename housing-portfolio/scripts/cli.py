@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+One command line for the portfolio, with a subcommand per step:
+
+    ingest    refresh the table, the summaries and the read-only snapshot
+    q1 .. q4  print one question's result (CSV or JSON) from the current snapshot, or write
+              it as Parquet or an Arrow IPC file
+    charts    build the report figures (the pipeline's *_figure stages)
+    excel     build the Excel workbooks
+    summary   build reports/summary.txt
+
+pandas, matplotlib and openpyxl are imported only by the subcommands that need them: --help,
+ingest and q1-q4 run on DuckDB and NumPy alone (results are written with the csv and json
+modules), and only charts, excel and summary load the plotting and spreadsheet stack. That
+keeps short scheduled jobs from paying for libraries they never use; pyarrow is loaded only
+for --format parquet / arrow.
+
+Usage:
+    python scripts/cli.py ingest --data data/home_values_yearly_clean.csv
+    python scripts/cli.py q2 --start-year 2010 --top-n 10 --format json
+    python scripts/cli.py charts
+"""
+import argparse
+import csv
+import json
+import math
+import sys
+from pathlib import Path
+import execution
+import run_analysis
+import snapshots
+
+REPO = Path(__file__).resolve().parents[1]
+DATA = REPO / "data"
+
+# -- output -------------------------------------------------------------------------------
+
+def _plain(value):
+    """A NumPy or DuckDB scalar as a JSON/CSV value (NaN -> None)."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def emit(table: dict, fmt: str = "csv", out: str = None):
+    """
+    Write a table of columns (name -> array) as CSV or JSON records to out (default: stdout),
+    or as Parquet / an Arrow IPC file (out required).
+    """
+    if fmt in ("parquet", "arrow"):
+        from report_tables import arrow_table, write_ipc, write_parquet
+        write = write_parquet if fmt == "parquet" else write_ipc
+        write(arrow_table(table), Path(out))
+        return
+    names = list(table)
+    rows = [[_plain(v) for v in row] for row in zip(*(table[name] for name in names))]
+    f = open(out, "w", newline="", encoding="utf-8") if out else sys.stdout
+    try:
+        if fmt == "json":
+            json.dump([dict(zip(names, row)) for row in rows], f, indent=2)
+            f.write("\n")
+        else:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(names)
+            writer.writerows(rows)
+    finally:
+        if out:
+            f.close()
+
+# -- subcommands --------------------------------------------------------------------------
+
+def cmd_ingest(args):
+    db = run_analysis.ingest(args.data, reingest=args.reingest, partition_year=args.partition_year,
+                             source=args.source)
+    print(f"[ok] data version {str(db.version)[:12]}: {db.rows:,} rows")
+    db.con.close()
+
+def _query(args, build):
+    if args.format in ("parquet", "arrow") and not args.out:
+        raise SystemExit(f"[error] --format {args.format} needs --out")
+    con = snapshots.connect(DATA, args.db)
+    try:
+        table = build(con)
+    finally:
+        con.close()
+    emit(table, args.format, args.out)
+
+def cmd_q1(args):
+    _query(args, lambda con: run_analysis.q1_table(con, args.states, args.top_n, args.by))
+
+def cmd_q2(args):
+    _query(args, lambda con: run_analysis.q2_table(con, args.start_year, args.end_year, args.top_n))
+
+def cmd_q3(args):
+    which = 0 if args.by == "absolute_growth" else 1
+    _query(args, lambda con: run_analysis.city_growth_tables(con, args.start_year, args.end_year, args.top_n)[which])
+
+def cmd_q4(args):
+    _query(args, lambda con: run_analysis.q4_table(con, args.top_n, args.min_years))
+
+def _run_stages(args, patterns):
+    # The pipeline (and with it charts.py) is only built by the subcommands that run it
+    pipeline = run_analysis.build_pipeline(args)
+    run_analysis.ensure_dirs()
+    pipeline.run(only=patterns, force=args.force)
+
+def cmd_charts(args):
+    _run_stages(args, ["*_figure"])
+
+def cmd_summary(args):
+    _run_stages(args, ["summary"])
+
+def cmd_excel(args):
+    import create_excel_workbooks
+    create_excel_workbooks.build_workbooks(args.raw_rows)
+
+# -- arguments ----------------------------------------------------------------------------
+
+def _add_query_arguments(parser):
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by ingest).")
+    parser.add_argument("--format", choices=["csv", "json", "parquet", "arrow"], default="csv")
+    parser.add_argument("--out", type=str, default=None, help="Output file (default: stdout).")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Housing portfolio analysis.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    def command(name, func, help):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(func=func)
+        execution.add_arguments(sub)
+        return sub
+
+    run_analysis.add_ingest_arguments(command("ingest", cmd_ingest, "Refresh the table, summaries and snapshot."))
+
+    q1 = command("q1", cmd_q1, "Yearly average index of the top states.")
+    q1.add_argument("--top-n", type=int, default=run_analysis.Q1_TOP_N)
+    q1.add_argument("--by", choices=run_analysis.STATE_METRICS, default=run_analysis.Q1_METRIC,
+                    help="Metric that picks the states.")
+    q1.add_argument("--states", nargs="+", default=None, help="Report these states instead of the top N.")
+    _add_query_arguments(q1)
+
+    for name, func, help in (("q2", cmd_q2, "Top states by %% growth."),
+                             ("q3", cmd_q3, "Top cities by absolute or %% growth.")):
+        sub = command(name, func, help)
+        sub.add_argument("--start-year", type=int, default=2000)
+        sub.add_argument("--end-year", type=int, default=2025)
+        sub.add_argument("--top-n", type=int, default=5)
+        if name == "q3":
+            sub.add_argument("--by", choices=["absolute_growth", "pct_growth"], default="pct_growth",
+                             help="absolute_growth: Q3A, pct_growth: Q3B.")
+        _add_query_arguments(sub)
+
+    q4 = command("q4", cmd_q4, "Top states by year-over-year volatility.")
+    q4.add_argument("--top-n", type=int, default=5)
+    q4.add_argument("--min-years", type=int, default=10)
+    _add_query_arguments(q4)
+
+    for name, func, help in (("charts", cmd_charts, "Build the report figures."),
+                             ("summary", cmd_summary, "Build reports/summary.txt.")):
+        sub = command(name, func, help)
+        run_analysis.add_pipeline_arguments(sub)
+        sub.add_argument("--force", nargs="*", metavar="STAGE",
+                         help="Rebuild these stages even if cached (no pattern: rebuild everything).")
+
+    excel = command("excel", cmd_excel, "Build the Excel workbooks.")
+    excel.add_argument("--raw-rows", type=int, default=None,
+                       help="Rows to export to the Q1 Raw_Data sheet(s) (default: the full table).")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    execution.configure_from_args(args)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
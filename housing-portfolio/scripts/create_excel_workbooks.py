@@ -2,48 +2,116 @@
 """
 Create Excel workbooks to showcase Excel skills for the housing portfolio.
 Each workbook demonstrates different Excel capabilities with real data.
+
+All aggregation happens in DuckDB: only the per-sheet results (a few thousand rows at most)
+are loaded into pandas, and the raw rows are streamed straight into the Q1 workbook.
+
+The data is read from the current read-only snapshot published by run_analysis.py (see
+snapshots.py), resolved once per run, so every workbook shows the same version and the
+script can run while the next ingest does.
 """
 
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import duckdb
+import execution
+import profiling
+import queries
+import snapshots
+from excel_stream import StreamingWorkbook
+from growth import load_matrix
+from ranking import rank
 
 # Set up paths
 DATA_DIR = Path("data")
 EXCEL_DIR = Path("excel")
-EXCEL_DIR.mkdir(exist_ok=True)
 
-def load_data():
-    """Load the housing data from DuckDB."""
-    con = duckdb.connect(str(DATA_DIR / "housing.duckdb"))
-    df = con.execute("SELECT * FROM home_values_yearly_clean WHERE yearlyindex IS NOT NULL").df()
-    con.close()
-    return df
+_snapshot = None
+
+def connect():
+    """Read-only connection to the snapshot this run reads (resolved on first use)."""
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = snapshots.resolve(DATA_DIR)
+    return snapshots.connect(DATA_DIR, _snapshot)
+
+# The registry queries the workbooks run (sql/loaders.sql, sql/analysis.sql)
+WORKBOOK_QUERIES = ("record_count", "q1_state_averages", "state_coverage")
+
+def _query(con, name: str, **params) -> pd.DataFrame:
+    """Registry query name as a DataFrame, on con or (con=None) a connection of its own."""
+    own = con is None
+    con = connect() if own else con
+    try:
+        return queries.execute(con, name, **params).df()
+    finally:
+        if own:
+            con.close()
+
+def count_records(con=None):
+    """Count the rows the workbooks are built from (from the rollup cube's state level)."""
+    return int(_query(con, "record_count")["records"].iloc[0])
 
-def create_q1_workbook(df):
+def load_state_yearly(con=None):
+    """Load yearly state averages from the shared state x year summary table (Q1 over every state)."""
+    state_yearly = _query(con, "q1_state_averages", states=None)
+    return state_yearly.rename(columns={"avg_yearly_index": "yearlyindex"})
+
+def load_city_growth(con=None):
+    """City growth 2000-2025 for every city, from the dense city x year matrix (one row per city)."""
+    own = con is None
+    con = connect() if own else con
+    growth = load_matrix(con, "city").growth(2000, 2025)
+    if own:
+        con.close()
+    growth_data = growth.drop(columns="absolute_growth")
+    growth_data.columns = ['City', 'State', 'Value_2000', 'Value_2025', 'Growth_Percentage']
+    return growth_data.sort_values(['Growth_Percentage', 'City', 'State'],
+                                   ascending=[False, True, True]).reset_index(drop=True)
+
+def load_top_city_per_state(con=None):
+    """The city with the highest growth 2000-2025 in each state (one ranking grouped by state)."""
+    own = con is None
+    con = connect() if own else con
+    top = rank(con, "city", "pct_growth", 2000, 2025, top_n=1, group_by="state")
+    if own:
+        con.close()
+    top = top[['statename', 'city', 'value_2000', 'value_2025', 'pct_growth']]
+    top.columns = ['State', 'City', 'Value_2000', 'Value_2025', 'Growth_Percentage']
+    return top
+
+def load_state_coverage(con=None):
+    """Distinct cities and counties per state (over all years), from the rollup cube's rows."""
+    return _query(con, "state_coverage")
+
+def create_q1_workbook(state_yearly, raw_rows=None):
     """Create Q1 Excel workbook: Yearly Average Home Value Index by State."""
     
-    # Calculate yearly averages by state (same as SQL Q1)
-    q1_data = df.groupby(['statename', 'year'])['yearlyindex'].mean().round(2).reset_index()
+    # Yearly averages by state (same as SQL Q1, read from the shared summary)
+    q1_data = state_yearly.copy()
     q1_data.columns = ['State', 'Year', 'Avg_Yearly_Index']
     
     # Create Excel workbook with multiple sheets
-    with pd.ExcelWriter(EXCEL_DIR / "Q1_Yearly_Average_Home_Values.xlsx", engine='openpyxl') as writer:
+    with StreamingWorkbook(EXCEL_DIR / "Q1_Yearly_Average_Home_Values.xlsx") as wb:
         
-        # Sheet 1: Raw Data
-        df_sample = df.head(1000)  # Sample for Excel performance
-        df_sample.to_excel(writer, sheet_name='Raw_Data', index=False)
+        # Sheet 1: Raw Data, streamed from DuckDB in batches (continues on "Raw_Data (2)"...
+        # past Excel's row limit), so the full table can be exported in constant memory
+        con = connect()
+        limit = "" if raw_rows is None else f" LIMIT {int(raw_rows)}"
+        written = wb.add_query(con, f"SELECT * FROM home_values_yearly_clean WHERE yearlyindex IS NOT NULL{limit}", 'Raw_Data')
+        con.close()
+        print(f"[ok] streamed {written:,} raw rows")
         
         # Sheet 2: Pivot Data (Yearly Averages)
-        q1_data.to_excel(writer, sheet_name='Yearly_Averages', index=False)
+        wb.add_frame(q1_data, 'Yearly_Averages')
         
         # Sheet 3: Summary Statistics
         summary_stats = q1_data.groupby('State')['Avg_Yearly_Index'].agg([
             'count', 'mean', 'min', 'max', 'std'
         ]).round(2)
         summary_stats.columns = ['Years_Tracked', 'Avg_Index', 'Min_Index', 'Max_Index', 'Std_Dev']
-        summary_stats.to_excel(writer, sheet_name='Summary_Stats')
+        wb.add_frame(summary_stats, 'Summary_Stats', index=True)
         
         # Sheet 4: Top 10 States by Average
         top_states = q1_data.groupby('State')['Avg_Yearly_Index'].mean().sort_values(ascending=False).head(10)
@@ -51,16 +119,13 @@ def create_q1_workbook(df):
             'State': top_states.index,
             'Average_Index': top_states.values
         })
-        top_states_df.to_excel(writer, sheet_name='Top_10_States', index=False)
+        wb.add_frame(top_states_df, 'Top_10_States')
     
     print(f"[ok] Created Q1 Excel workbook: {EXCEL_DIR / 'Q1_Yearly_Average_Home_Values.xlsx'}")
 
-def create_q2_workbook(df):
+def create_q2_workbook(state_yearly):
     """Create Q2 Excel workbook: Top 5 States with Highest Growth (2000-2025)."""
     
-    # Calculate state averages by year
-    state_yearly = df.groupby(['statename', 'year'])['yearlyindex'].mean().round(2).reset_index()
-    
     # Get 2000 and 2025 values
     state_2000 = state_yearly[state_yearly['year'] == 2000].set_index('statename')['yearlyindex']
     state_2025 = state_yearly[state_yearly['year'] == 2025].set_index('statename')['yearlyindex']
@@ -74,19 +139,19 @@ def create_q2_workbook(df):
     growth_data['Growth_Percentage'] = ((growth_data['Value_2025'] - growth_data['Value_2000']) / growth_data['Value_2000'] * 100).round(2)
     growth_data = growth_data.dropna().sort_values('Growth_Percentage', ascending=False)
     
-    with pd.ExcelWriter(EXCEL_DIR / "Q2_State_Growth_Analysis.xlsx", engine='openpyxl') as writer:
+    with StreamingWorkbook(EXCEL_DIR / "Q2_State_Growth_Analysis.xlsx") as wb:
         
         # Sheet 1: Growth Analysis
-        growth_data.to_excel(writer, sheet_name='Growth_Analysis', index=False)
+        wb.add_frame(growth_data, 'Growth_Analysis')
         
         # Sheet 2: Top 5 States
         top_5 = growth_data.head(5)
-        top_5.to_excel(writer, sheet_name='Top_5_States', index=False)
+        wb.add_frame(top_5, 'Top_5_States')
         
         # Sheet 3: All States Ranked
         all_states = growth_data.copy()
         all_states['Rank'] = range(1, len(all_states) + 1)
-        all_states.to_excel(writer, sheet_name='All_States_Ranked', index=False)
+        wb.add_frame(all_states, 'All_States_Ranked')
         
         # Sheet 4: Growth Categories
         growth_data['Growth_Category'] = pd.cut(growth_data['Growth_Percentage'], 
@@ -94,38 +159,21 @@ def create_q2_workbook(df):
                                               labels=['Decline', 'Low Growth', 'Moderate Growth', 'High Growth', 'Very High Growth'])
         category_summary = growth_data.groupby('Growth_Category').size().reset_index()
         category_summary.columns = ['Growth_Category', 'Number_of_States']
-        category_summary.to_excel(writer, sheet_name='Growth_Categories', index=False)
+        wb.add_frame(category_summary, 'Growth_Categories')
     
     print(f"[ok] Created Q2 Excel workbook: {EXCEL_DIR / 'Q2_State_Growth_Analysis.xlsx'}")
 
-def create_q3_workbook(df):
+def create_q3_workbook(growth_data, top_city_per_state):
     """Create Q3 Excel workbook: Top 5 Cities with Highest Growth (2000-2025)."""
     
-    # Calculate city averages by year
-    city_yearly = df.groupby(['city', 'statename', 'year'])['yearlyindex'].mean().round(2).reset_index()
-    
-    # Get 2000 and 2025 values
-    city_2000 = city_yearly[city_yearly['year'] == 2000].set_index(['city', 'statename'])['yearlyindex']
-    city_2025 = city_yearly[city_yearly['year'] == 2025].set_index(['city', 'statename'])['yearlyindex']
-    
-    # Calculate growth
-    growth_data = pd.DataFrame({
-        'City': [idx[0] for idx in city_2000.index],
-        'State': [idx[1] for idx in city_2000.index],
-        'Value_2000': city_2000.values,
-        'Value_2025': city_2025.reindex(city_2000.index).values
-    })
-    growth_data['Growth_Percentage'] = ((growth_data['Value_2025'] - growth_data['Value_2000']) / growth_data['Value_2000'] * 100).round(2)
-    growth_data = growth_data.dropna().sort_values('Growth_Percentage', ascending=False)
-    
-    with pd.ExcelWriter(EXCEL_DIR / "Q3_City_Growth_Analysis.xlsx", engine='openpyxl') as writer:
+    with StreamingWorkbook(EXCEL_DIR / "Q3_City_Growth_Analysis.xlsx") as wb:
         
         # Sheet 1: City Growth Analysis
-        growth_data.to_excel(writer, sheet_name='City_Growth_Analysis', index=False)
+        wb.add_frame(growth_data, 'City_Growth_Analysis')
         
         # Sheet 2: Top 5 Cities
         top_5_cities = growth_data.head(5)
-        top_5_cities.to_excel(writer, sheet_name='Top_5_Cities', index=False)
+        wb.add_frame(top_5_cities, 'Top_5_Cities')
         
         # Sheet 3: Cities by State
         cities_by_state = growth_data.groupby('State').agg({
@@ -133,33 +181,24 @@ def create_q3_workbook(df):
             'Growth_Percentage': ['mean', 'max', 'min']
         }).round(2)
         cities_by_state.columns = ['City_Count', 'Avg_Growth', 'Max_Growth', 'Min_Growth']
-        cities_by_state.to_excel(writer, sheet_name='Cities_by_State')
+        wb.add_frame(cities_by_state, 'Cities_by_State', index=True)
         
         # Sheet 4: Top Cities per State
-        top_city_per_state = growth_data.groupby('State').first().reset_index()
-        top_city_per_state.to_excel(writer, sheet_name='Top_City_per_State', index=False)
+        wb.add_frame(top_city_per_state, 'Top_City_per_State')
     
     print(f"[ok] Created Q3 Excel workbook: {EXCEL_DIR / 'Q3_City_Growth_Analysis.xlsx'}")
 
-def create_q4_workbook(df):
+def create_q4_workbook(state_counts):
     """Create Q4 Excel workbook: Cities & Counties Count by State."""
     
-    # Calculate unique cities and counties by state
-    state_counts = df.groupby('statename').agg({
-        'city': 'nunique',
-        'countyname': 'nunique'
-    }).reset_index()
-    state_counts.columns = ['State', 'Unique_Cities', 'Unique_Counties']
-    state_counts = state_counts.sort_values('Unique_Cities', ascending=False)
-    
-    with pd.ExcelWriter(EXCEL_DIR / "Q4_State_Coverage_Analysis.xlsx", engine='openpyxl') as writer:
+    with StreamingWorkbook(EXCEL_DIR / "Q4_State_Coverage_Analysis.xlsx") as wb:
         
         # Sheet 1: State Coverage
-        state_counts.to_excel(writer, sheet_name='State_Coverage', index=False)
+        wb.add_frame(state_counts, 'State_Coverage')
         
         # Sheet 2: Top 10 States
         top_10 = state_counts.head(10)
-        top_10.to_excel(writer, sheet_name='Top_10_States', index=False)
+        wb.add_frame(top_10, 'Top_10_States')
         
         # Sheet 3: Coverage Statistics
         coverage_stats = pd.DataFrame({
@@ -172,7 +211,7 @@ def create_q4_workbook(df):
                 state_counts['Unique_Counties'].mean().round(1)
             ]
         })
-        coverage_stats.to_excel(writer, sheet_name='Coverage_Statistics', index=False)
+        wb.add_frame(coverage_stats, 'Coverage_Statistics')
         
         # Sheet 4: Coverage Categories
         state_counts['Coverage_Level'] = pd.cut(state_counts['Unique_Cities'],
@@ -180,23 +219,50 @@ def create_q4_workbook(df):
                                                labels=['Very Low', 'Low', 'Medium', 'High', 'Very High'])
         coverage_summary = state_counts.groupby('Coverage_Level').size().reset_index()
         coverage_summary.columns = ['Coverage_Level', 'Number_of_States']
-        coverage_summary.to_excel(writer, sheet_name='Coverage_Categories', index=False)
+        wb.add_frame(coverage_summary, 'Coverage_Categories')
     
     print(f"[ok] Created Q4 Excel workbook: {EXCEL_DIR / 'Q4_State_Coverage_Analysis.xlsx'}")
 
+def build_workbooks(raw_rows=None):
+    """Create the four workbooks; each load and workbook is a profiling stage (--profile)."""
+    EXCEL_DIR.mkdir(exist_ok=True)
+    # Aggregate in DuckDB; only the small per-sheet results are loaded into pandas. The loads
+    # share one connection whose queries are all prepared in a single round trip up front.
+    con = connect()
+    profiling.call("prepare_queries", queries.prepare, con, WORKBOOK_QUERIES)
+    print(f"Source table: {profiling.call('count_records', count_records, con):,} records")
+    state_yearly = profiling.call("load_state_yearly", load_state_yearly, con)
+    city_growth = profiling.call("load_city_growth", load_city_growth, con)
+    top_city_per_state = profiling.call("load_top_city_per_state", load_top_city_per_state, con)
+    state_counts = profiling.call("load_state_coverage", load_state_coverage, con)
+    con.close()
+    
+    # Create workbooks
+    profiling.call("q1_workbook", create_q1_workbook, state_yearly, raw_rows=raw_rows)
+    profiling.call("q2_workbook", create_q2_workbook, state_yearly)
+    profiling.call("q3_workbook", create_q3_workbook, city_growth, top_city_per_state)
+    profiling.call("q4_workbook", create_q4_workbook, state_counts)
+
 def main():
     """Create all Excel workbooks."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-rows", type=int, default=None,
+                        help="Rows to export to the Q1 Raw_Data sheet(s) (default: the full table).")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="TRACE_JSON",
+                        help="Record time, CPU, memory and rows per step and DuckDB's profile of every "
+                             "SQL statement (default trace: reports/profiles/create_excel_workbooks-<time>.json).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
     print("Creating Excel workbooks to showcase Excel skills...")
     
-    # Load data
-    df = load_data()
-    print(f"Loaded {len(df):,} records")
-    
-    # Create workbooks
-    create_q1_workbook(df)
-    create_q2_workbook(df)
-    create_q3_workbook(df)
-    create_q4_workbook(df)
+    if args.profile is None:
+        build_workbooks(args.raw_rows)
+    else:
+        with profiling.Profiler("create_excel_workbooks") as profiler:
+            build_workbooks(args.raw_rows)
+        profiler.write(Path(args.profile) if args.profile
+                       else profiling.default_trace_path(Path("reports"), "create_excel_workbooks"))
     
     print(f"\n[done] All Excel workbooks created in {EXCEL_DIR}/")
     print("\nExcel Skills Demonstrated:")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Periodic data drops: a directory or glob of CSV/Parquet extracts that overlap on (regionname, year).
+
+Drops are applied one file at a time, in file-name order (name extracts so they sort by date,
+e.g. 2025-01.csv, 2025-02.parquet), straight from DuckDB's readers into the table, so nothing
+is concatenated in memory and the execution profile's memory limit bounds every step:
+
+1. the file is read with every column as text and cast to the schema types with TRY_CAST,
+2. rows with a missing key, a value that does not parse, a year outside MIN_YEAR..MAX_YEAR
+   or a yearlyindex that is missing or not positive are rejected into ingest_rejects (with the reason
+   and the raw values) instead of failing the load,
+3. duplicates of a key within the file keep their last row,
+4. the remaining rows are upserted on (regionname, year): rows of earlier drops with the same
+   key are replaced, so the latest drop wins.
+
+Every applied file is recorded in ingest_files (path, fingerprint, row counts), which lets
+run_analysis.load_into_duckdb apply only drops added since the last run.
+"""
+import glob
+from datetime import date
+from pathlib import Path
+import duckdb
+from staging import SCHEMA
+
+FILES_TABLE = "ingest_files"
+REJECTS_TABLE = "ingest_rejects"
+DROP_SUFFIXES = (".csv", ".parquet")
+MIN_YEAR = 1996                   # first year of the home value index
+MAX_YEAR = date.today().year
+KEY = ("regionname", "year")
+
+def is_drop_source(data) -> bool:
+    """Whether --data names a directory or glob of drops rather than one CSV file."""
+    text = str(data)
+    return Path(text).is_dir() or any(ch in text for ch in "*?[")
+
+def list_drop_files(data) -> list:
+    """The CSV and Parquet files of a drop directory or glob, in the order they are applied."""
+    text = str(data)
+    paths = Path(text).iterdir() if Path(text).is_dir() else map(Path, glob.glob(text))
+    return sorted(p for p in paths if p.is_file() and p.suffix.lower() in DROP_SUFFIXES)
+
+def ensure_drop_tables(con: duckdb.DuckDBPyConnection):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FILES_TABLE} (
+            path VARCHAR PRIMARY KEY,
+            seq INTEGER,
+            size_bytes BIGINT,
+            mtime DOUBLE,
+            sha256 VARCHAR,
+            rows_read BIGINT,
+            rows_rejected BIGINT,
+            rows_upserted BIGINT,
+            rows_replaced BIGINT,
+            ingested_at TIMESTAMP
+        );
+    """)
+    raw_columns = ", ".join(f"{name} VARCHAR" for name in SCHEMA)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {REJECTS_TABLE} (
+            source_file VARCHAR,
+            reason VARCHAR,
+            {raw_columns}
+        );
+    """)
+
+def read_ingested_files(con: duckdb.DuckDBPyConnection) -> list:
+    """Applied drops as dicts (path, size_bytes, mtime, sha256), in the order they were applied."""
+    ensure_drop_tables(con)
+    rows = con.execute(f"SELECT path, size_bytes, mtime, sha256 FROM {FILES_TABLE} ORDER BY seq;").fetchall()
+    return [dict(zip(("path", "size_bytes", "mtime", "sha256"), row)) for row in rows]
+
+def reset_drops(con: duckdb.DuckDBPyConnection, table: str):
+    """Empty table (recreated with the explicit schema) and forget every applied drop."""
+    ensure_drop_tables(con)
+    columns = ", ".join(f"{name} {dtype}" for name, dtype in SCHEMA.items())
+    con.execute(f"DROP TABLE IF EXISTS {table};")
+    con.execute(f"CREATE TABLE {table} ({columns});")
+    con.execute(f"DELETE FROM {FILES_TABLE};")
+    con.execute(f"DELETE FROM {REJECTS_TABLE};")
+
+def refresh_file_stats(con: duckdb.DuckDBPyConnection, files: list):
+    """Store the current size and mtime of drops whose content is unchanged (touched files)."""
+    con.executemany(f"UPDATE {FILES_TABLE} SET size_bytes = ?, mtime = ? WHERE path = ?;",
+                    [[f["size_bytes"], f["mtime"], f["path"]] for f in files])
+
+def drops_changed(con: duckdb.DuckDBPyConnection, data) -> bool:
+    """Cheap check (names, sizes, mtimes) of whether the drop files differ from those applied."""
+    current = []
+    for p in list_drop_files(data):
+        st = p.stat()
+        current.append((str(p), st.st_size, st.st_mtime))
+    applied = [(f["path"], f["size_bytes"], f["mtime"]) for f in read_ingested_files(con)]
+    return current != applied
+
+def _reader(path: Path) -> tuple:
+    """(table function reading path, expression giving each row's position in the file)."""
+    if path.suffix.lower() == ".parquet":
+        return f"read_parquet('{path.as_posix()}', file_row_number=true)", "file_row_number"
+    # The CSV reader has no row ordinal: a single-threaded scan feeds rows to the (streaming)
+    # row_number() in file order, which a parallel scan does not guarantee
+    return f"read_csv('{path.as_posix()}', header=true, all_varchar=true, parallel=false)", "row_number() OVER ()"
+
+def _stage_file(con: duckdb.DuckDBPyConnection, path: Path):
+    """Validate path into the temp table drop_valid; returns (rows read, rows rejected) or None."""
+    reader, ordinal = _reader(path)
+    columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {reader};").fetchall()]
+    missing = [name for name in SCHEMA if name not in columns]
+    if missing:
+        print(f"[warn] {path.name}: missing column(s) {', '.join(missing)}; drop skipped")
+        return None
+
+    raw = ", ".join(f"CAST({name} AS VARCHAR) AS {name}" for name in SCHEMA)
+    typed = ", ".join(f"TRY_CAST({name} AS {dtype}) AS {name}" for name, dtype in SCHEMA.items())
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE drop_raw AS
+        SELECT {ordinal} AS file_row, {raw} FROM {reader};
+    """)
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE drop_checked AS
+        SELECT *,
+            CASE
+                WHEN regionname IS NULL OR year_raw IS NULL THEN 'missing_key'
+                WHEN index_raw IS NULL THEN 'missing_index'
+                WHEN year IS NULL OR (index_raw IS NOT NULL AND yearlyindex IS NULL)
+                  OR NOT isfinite(yearlyindex) THEN 'bad_type'
+                WHEN year NOT BETWEEN $min_year AND $max_year THEN 'year_out_of_range'
+                WHEN yearlyindex <= 0 THEN 'index_not_positive'
+            END AS reason
+        FROM (SELECT file_row, year AS year_raw, yearlyindex AS index_raw, {typed} FROM drop_raw);
+    """, {"min_year": MIN_YEAR, "max_year": MAX_YEAR})
+    rejected = con.execute(f"""
+        INSERT INTO {REJECTS_TABLE}
+        SELECT ?, c.reason, r.* EXCLUDE (file_row)
+        FROM drop_checked c JOIN drop_raw r USING (file_row)
+        WHERE c.reason IS NOT NULL;
+    """, [str(path)]).fetchone()[0]
+    # The last row of a key repeated within one file wins, like a later file would
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE drop_valid AS
+        SELECT {", ".join(SCHEMA)}
+        FROM drop_checked
+        WHERE reason IS NULL
+        QUALIFY row_number() OVER (PARTITION BY {", ".join(KEY)} ORDER BY file_row DESC) = 1;
+    """)
+    read = con.execute("SELECT COUNT(*) FROM drop_raw;").fetchone()[0]
+    con.execute("DROP TABLE drop_raw; DROP TABLE drop_checked;")
+    return read, rejected
+
+def apply_drop(con: duckdb.DuckDBPyConnection, path: Path, fingerprint: dict, seq: int, table: str,
+               delta: str = None) -> dict:
+    """
+    Validate one drop and upsert it into table, in one transaction; returns its row counts.
+    delta, when given, is a table that collects the upserted rows (for incremental summaries).
+    """
+    con.begin()
+    try:
+        staged = _stage_file(con, path)
+        read, rejected = staged if staged else (0, 0)
+        upserted = replaced = 0
+        if staged:
+            on_key = " AND ".join(f"{table}.{k} = drop_valid.{k}" for k in KEY)
+            replaced = con.execute(f"DELETE FROM {table} USING drop_valid WHERE {on_key};").fetchone()[0]
+            upserted = con.execute(f"INSERT INTO {table} SELECT * FROM drop_valid;").fetchone()[0]
+            if delta:
+                con.execute(f"INSERT INTO {delta} SELECT * FROM drop_valid;")
+            con.execute("DROP TABLE drop_valid;")
+        con.execute(f"""
+            INSERT OR REPLACE INTO {FILES_TABLE}
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP);
+        """, [str(path), seq, fingerprint["size_bytes"], fingerprint["mtime"], fingerprint["sha256"],
+              read, rejected, upserted, replaced])
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return {"read": read, "rejected": rejected, "upserted": upserted, "replaced": replaced}
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Constant-memory Excel output built on openpyxl's write-only mode.
+
+Rows are appended to the sheet as they arrive (from DuckDB result batches or a small
+DataFrame) and flushed to disk by openpyxl, so the workbook is never held in memory.
+Query results longer than Excel's row limit continue on numbered sheets
+("Raw_Data", "Raw_Data (2)", ...).
+"""
+import math
+from pathlib import Path
+import duckdb
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+EXCEL_MAX_ROWS = 1_048_576  # including the header row
+SHEET_NAME_MAX = 31
+BATCH_ROWS = 10_000
+
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(*(Side(style="thin"),) * 4)
+_HEADER_ALIGN = Alignment(horizontal="center", vertical="top")
+
+def _cell_value(value):
+    # openpyxl cannot store NaN/NA; numpy scalars become plain Python numbers
+    if value is None:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return value
+
+class StreamingWorkbook:
+    """Write-only workbook; use as a context manager so it is saved on success."""
+    def __init__(self, path: Path, max_rows: int = EXCEL_MAX_ROWS):
+        self.path = Path(path)
+        self.max_rows = max_rows
+        self.wb = Workbook(write_only=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.save()
+        return False
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.wb.save(self.path)
+
+    def _new_sheet(self, name: str, columns: list):
+        ws = self.wb.create_sheet(title=name[:SHEET_NAME_MAX])
+        header = []
+        for col in columns:
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.font, cell.border, cell.alignment = _HEADER_FONT, _HEADER_BORDER, _HEADER_ALIGN
+            header.append(cell)
+        ws.append(header)
+        return ws
+
+    def _sheet_name(self, base: str, part: int) -> str:
+        if part == 1:
+            return base[:SHEET_NAME_MAX]
+        suffix = f" ({part})"
+        return base[:SHEET_NAME_MAX - len(suffix)] + suffix
+
+    def write_rows(self, sheet_name: str, columns: list, batches) -> int:
+        """Append rows from an iterable of row batches, splitting sheets at the row limit."""
+        per_sheet = self.max_rows - 1
+        part, in_sheet, total = 1, 0, 0
+        ws = self._new_sheet(self._sheet_name(sheet_name, part), columns)
+        for batch in batches:
+            for row in batch:
+                if in_sheet == per_sheet:
+                    part += 1
+                    ws = self._new_sheet(self._sheet_name(sheet_name, part), columns)
+                    in_sheet = 0
+                ws.append([_cell_value(v) for v in row])
+                in_sheet += 1
+                total += 1
+        return total
+
+    def add_query(self, con: duckdb.DuckDBPyConnection, sql: str, sheet_name: str,
+                  params=None, batch_rows: int = BATCH_ROWS) -> int:
+        """Stream a query result into sheet_name in fetchmany() batches; returns rows written."""
+        cur = con.execute(sql, params) if params is not None else con.execute(sql)
+        columns = [d[0] for d in cur.description]
+        def batches():
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    return
+                yield rows
+        return self.write_rows(sheet_name, columns, batches())
+
+    def add_frame(self, df: pd.DataFrame, sheet_name: str, index: bool = False) -> int:
+        """Write a (small, already aggregated) DataFrame like DataFrame.to_excel would."""
+        if index:
+            df = df.reset_index()
+        return self.write_rows(sheet_name, list(df.columns),
+                               [df.astype(object).itertuples(index=False, name=None)])
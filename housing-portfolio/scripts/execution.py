@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Execution profile shared by every DuckDB connection the scripts open.
+
+--memory-limit, --threads and --temp-dir (see add_arguments) cap what a run may use: DuckDB
+gets them as its memory_limit, threads and temp_directory settings, so joins, aggregations
+and sorts that outgrow the limit spill to the temp directory instead of failing. The same
+memory limit is the budget for the few steps that build large in-memory arrays (the zip-level
+matrix): those switch to state-by-state chunks when their estimate exceeds it.
+
+The profile is kept in environment variables (HOUSING_MEMORY_LIMIT, HOUSING_THREADS,
+HOUSING_TEMP_DIR), so it can also be set without flags and is inherited by the spawned
+worker processes of the pipeline and the benchmark.
+"""
+import os
+import re
+from pathlib import Path
+import duckdb
+
+ENV = {"memory_limit": "HOUSING_MEMORY_LIMIT", "threads": "HOUSING_THREADS", "temp_dir": "HOUSING_TEMP_DIR"}
+
+_UNITS = {"": 1, "b": 1, "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+          "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4}
+
+def parse_size(text: str) -> int:
+    """'512MB', '4GB', '2GiB' (DuckDB's units) -> bytes."""
+    m = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*", str(text))
+    if not m or m.group(2).lower() not in _UNITS:
+        raise ValueError(f"not a memory size: {text!r} (use e.g. 512MB, 4GB, 2GiB)")
+    return int(float(m.group(1)) * _UNITS[m.group(2).lower()])
+
+def add_arguments(parser):
+    group = parser.add_argument_group("execution profile")
+    group.add_argument("--memory-limit", type=str, default=None,
+                       help="Memory budget, e.g. 2GB: DuckDB spills to --temp-dir beyond it and "
+                            "large in-memory steps run in chunks.")
+    group.add_argument("--threads", type=int, default=None, help="DuckDB worker threads per database.")
+    group.add_argument("--temp-dir", type=str, default=None,
+                       help="Where DuckDB spills intermediate results (default: next to the database).")
+
+def configure(memory_limit: str = None, threads: int = None, temp_dir: str = None):
+    """Set the profile for this process and the worker processes it starts (None: keep as is)."""
+    if memory_limit is not None:
+        parse_size(memory_limit)
+    if threads is not None and threads < 1:
+        raise ValueError("threads must be at least 1")
+    for key, value in (("memory_limit", memory_limit), ("threads", threads), ("temp_dir", temp_dir)):
+        if value is not None:
+            os.environ[ENV[key]] = str(value)
+
+def configure_from_args(args):
+    try:
+        configure(args.memory_limit, args.threads, args.temp_dir)
+    except ValueError as e:
+        raise SystemExit(f"[error] {e}")
+
+def settings() -> dict:
+    """The profile in effect: {"memory_limit", "threads", "temp_dir"}, None where unset."""
+    values = {key: os.environ.get(name) or None for key, name in ENV.items()}
+    if values["threads"] is not None:
+        values["threads"] = int(values["threads"])
+    return values
+
+def memory_budget():
+    """The memory limit in bytes, or None when unlimited."""
+    limit = settings()["memory_limit"]
+    return None if limit is None else parse_size(limit)
+
+def fits(estimated_bytes: int) -> bool:
+    """Whether an in-memory step of about estimated_bytes stays within the budget."""
+    budget = memory_budget()
+    return budget is None or estimated_bytes <= budget
+
+def apply(con: duckdb.DuckDBPyConnection):
+    """Apply the profile to con (the settings are database-wide, so cursors share them)."""
+    profile = settings()
+    if profile["memory_limit"] is not None:
+        con.execute(f"SET memory_limit = '{profile['memory_limit']}';")
+    if profile["threads"] is not None:
+        con.execute(f"SET threads = {profile['threads']};")
+    if profile["temp_dir"] is not None:
+        Path(profile["temp_dir"]).mkdir(parents=True, exist_ok=True)
+        con.execute(f"SET temp_directory = '{Path(profile['temp_dir']).as_posix()}';")
+    return con
+
+def connect(database: str = ":memory:", **kwargs) -> duckdb.DuckDBPyConnection:
+    """duckdb.connect() with the execution profile applied."""
+    return apply(duckdb.connect(database, **kwargs))
+
+def describe() -> str:
+    profile = settings()
+    parts = [f"{key}={value}" for key, value in profile.items() if value is not None]
+    return ", ".join(parts) if parts else "DuckDB defaults"
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Per-state and per-metro report bundles: the Q1-Q4 tables and figures for every geography.
+
+Inside a geography the questions move one level down: Q1, Q2 and Q4 rank its counties (as the
+national reports rank states) and Q3A/Q3B its cities. Every bundle is computed from one
+intermediate, built in one GROUPING SETS scan of the current snapshot: the average index of
+each county and city of each state and selected metro, per year, written once as Parquet
+(data/fanout/<data version>/geo_year.parquet) sorted by geography, so a reader of a few
+geographies only touches their row groups.
+
+The geographies are spread over a pool of spawned worker processes in batches, largest first.
+Each worker reads its batch's rows from the shared read-only Parquet file with its own
+single-threaded in-memory DuckDB, ranks them with ranking.rank_matrix and renders the figures
+itself, so workers share nothing but that file and scale with the cores. A bundle
+(reports/geo/<level>/<geography>/) is complete once its bundle.json is written, last; a run
+skips the bundles whose bundle.json matches the data version and options, so an interrupted
+run resumes where it stopped.
+
+Usage:
+    python scripts/fanout.py --levels state metro --metros 300 --workers 8
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+import duckdb
+import numpy as np
+import pandas as pd
+import execution
+import snapshots
+from aggregates import GEO_SUMMARY_TABLE, META_TABLE, SOURCE_TABLE
+
+REPO = Path(__file__).resolve().parents[1]
+DATA = REPO / "data"
+FANOUT_DIR = DATA / "fanout"
+OUT_DIR = REPO / "reports" / "geo"
+INTERMEDIATE = "geo_year.parquet"
+MANIFEST = "bundle.json"
+
+LEVELS = ("state", "metro")
+METROS = 300                   # largest metros by zip count
+START_YEAR, END_YEAR = 2000, 2025
+Q1_TOP_N = 10
+TOP_N = 5
+MIN_YEARS = 10
+BATCHES_PER_WORKER = 4         # smaller batches balance the pool; larger ones read fewer times
+ROW_GROUP_SIZE = 16384
+
+INTERMEDIATE_SQL = f"""
+COPY (
+    WITH leaves AS (
+        SELECT statename, metro, countyname, city, year,
+               SUM(yearlyindex) AS sum_index,
+               COUNT(yearlyindex) AS count_index
+        FROM {SOURCE_TABLE}
+        WHERE yearlyindex IS NOT NULL AND statename IS NOT NULL
+        GROUP BY statename, metro, countyname, city, year
+    )
+    SELECT
+        CASE WHEN GROUPING(metro) = 0 THEN 'metro' ELSE 'state' END AS parent_level,
+        CASE WHEN GROUPING(metro) = 0 THEN metro ELSE statename END AS parent,
+        CASE WHEN GROUPING(city) = 0 THEN 'city' ELSE 'county' END AS child_level,
+        statename,
+        CASE WHEN GROUPING(city) = 0 THEN city ELSE countyname END AS geo,
+        year,
+        SUM(sum_index) / SUM(count_index) AS avg_index
+    FROM leaves
+    WHERE metro IS NULL OR list_contains($metros, metro) OR $all_states
+    GROUP BY GROUPING SETS (
+        (statename, countyname, year),
+        (statename, city, year),
+        (metro, statename, countyname, year),
+        (metro, statename, city, year)
+    )
+    HAVING geo IS NOT NULL
+       AND (parent_level = 'state' AND $all_states OR parent_level = 'metro' AND list_contains($metros, parent))
+    ORDER BY parent_level, parent, child_level, statename, geo, year
+) TO '{{path}}' (FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_SIZE});
+"""
+
+BATCH_SQL = """
+SELECT parent, child_level, statename, geo, year, avg_index
+FROM read_parquet($path)
+WHERE parent_level = $level AND list_contains($parents, parent)
+ORDER BY parent, child_level, statename, geo, year;
+"""
+
+# -- geographies and the shared intermediate ------------------------------------------
+
+def data_version(con: duckdb.DuckDBPyConnection):
+    row = con.execute(f"SELECT sha256 FROM {META_TABLE} WHERE table_name = ?;", [SOURCE_TABLE]).fetchone()
+    return row[0] if row else None
+
+def select_geographies(con: duckdb.DuckDBPyConnection, levels=LEVELS, metros: int = METROS) -> list:
+    """(level, name, zips) of every state and the top metros by zip count, largest first."""
+    geos = []
+    if "state" in levels:
+        geos += [("state", name, zips) for name, zips in con.execute(f"""
+            SELECT geo, MAX(count_index) FROM {GEO_SUMMARY_TABLE}
+            WHERE level = 'state' GROUP BY geo ORDER BY geo;
+        """).fetchall()]
+    if "metro" in levels and metros > 0:
+        geos += [("metro", name, zips) for name, zips in con.execute(f"""
+            SELECT geo, MAX(count_index) AS zips FROM {GEO_SUMMARY_TABLE}
+            WHERE level = 'metro' GROUP BY geo ORDER BY zips DESC, geo LIMIT ?;
+        """, [metros]).fetchall()]
+    return sorted(geos, key=lambda g: -g[2])
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def build_intermediate(con: duckdb.DuckDBPyConnection, version: str, geos: list) -> Path:
+    """Write (or reuse) the per-geography county and city x year averages; returns the Parquet file."""
+    metros = sorted(name for level, name, _ in geos if level == "metro")
+    all_states = any(level == "state" for level, _, _ in geos)
+    directory = FANOUT_DIR / f"{version[:16]}-{_digest(metros, all_states)[:8]}"
+    path = directory / INTERMEDIATE
+    if path.exists():
+        print(f"[skip] {path} is up to date")
+        return path
+    directory.mkdir(parents=True, exist_ok=True)
+    # Written under a temporary name, so an interrupted build is never mistaken for a whole one
+    tmp = directory / f"{INTERMEDIATE}.tmp"
+    con.execute(INTERMEDIATE_SQL.format(path=tmp.as_posix()), {"metros": metros, "all_states": all_states})
+    os.replace(tmp, path)
+    # Intermediates of older data versions or other metro selections are not read again
+    for old in FANOUT_DIR.iterdir():
+        if old != directory and old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+    print(f"[ok] wrote {path}")
+    return path
+
+# -- one bundle ---------------------------------------------------------------------------
+
+def slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(name)).strip("_") or "unnamed"
+
+def bundle_dir(out_dir: Path, level: str, name: str) -> Path:
+    return Path(out_dir) / level / slug(name)
+
+def _label(df: pd.DataFrame, column: str, level: str) -> pd.Series:
+    """Geo names for tables and figures; metros span states, so their children carry the state."""
+    if level == "metro":
+        return df[column] + ", " + df["statename"]
+    return df[column]
+
+def bundle_frames(level: str, matrices: dict) -> dict:
+    """The Q1-Q4 tables of one geography from its county and city x year matrices."""
+    from growth import top_indices
+    from ranking import VOLATILITY_COLUMNS, rank_matrix
+
+    counties, cities, exact = matrices["county"], matrices["city"], matrices["county_exact"]
+    frames = {}
+
+    # Q1: yearly averages of the top counties by their mean yearly average, in name order
+    with warnings.catch_warnings():
+        # Counties without data get a NaN mean (never picked)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(counties.values, axis=1) if counties.values.size else np.full(len(counties), np.nan)
+    rows = top_indices(mean, np.isfinite(mean), Q1_TOP_N, counties.geos, counties.states)
+    names = pd.Series(counties.geos[rows], dtype=object)
+    if level == "metro":
+        names = names + ", " + pd.Series(counties.states[rows], dtype=object)
+    order = np.argsort(names.to_numpy(dtype=str), kind="stable")
+    pivot = pd.DataFrame(counties.values[rows[order]].T, columns=names.iloc[order].tolist())
+    pivot.insert(0, "year", counties.years)
+    frames["Q1"] = pivot.dropna(how="all", subset=pivot.columns[1:]) if len(rows) else pivot
+
+    growth = ["countyname", "statename", f"value_{START_YEAR}", f"value_{END_YEAR}", "absolute_growth", "pct_growth"]
+    q2 = rank_matrix(counties, "pct_growth", START_YEAR, END_YEAR, TOP_N)
+    frames["Q2"] = q2[["rank", *growth]]
+
+    growth = ["city", "statename", f"value_{START_YEAR}", f"value_{END_YEAR}", "absolute_growth", "pct_growth"]
+    frames["Q3A"] = rank_matrix(cities, "absolute_growth", START_YEAR, END_YEAR, TOP_N)[["rank", *growth]]
+    frames["Q3B"] = rank_matrix(cities, "pct_growth", START_YEAR, END_YEAR, TOP_N)[["rank", *growth]]
+    for question in ("Q2", "Q3A", "Q3B"):
+        # Differences of 2-decimal averages, without the binary float residue
+        frames[question] = frames[question].round({"absolute_growth": 2})
+
+    q4 = rank_matrix(exact, "volatility", top_n=TOP_N, min_years=MIN_YEARS)
+    frames["Q4"] = q4[["rank", "countyname", "statename", *VOLATILITY_COLUMNS]]
+    return frames
+
+def write_bundle(out: Path, level: str, name: str, frames: dict, key: str, figures: bool = True) -> dict:
+    """Write one geography's CSVs and figures, then its bundle.json; returns the manifest."""
+    from charts import (q1_trend_chart, q2_growth_chart, q3a_absolute_growth_chart, q3b_pct_growth_chart,
+                        q4_volatility_chart, render)
+
+    (out / MANIFEST).unlink(missing_ok=True)
+    figs = out / "figures"
+    figs.mkdir(parents=True, exist_ok=True)
+    files = {
+        "Q1": "Q1_Top10_Counties_Average_Values.csv",
+        "Q2": "Q2_Top5_Counties_Growth.csv",
+        "Q3A": "Q3A_Top5_Cities_Absolute_Growth.csv",
+        "Q3B": "Q3B_Top5_Cities_Percentage_Growth.csv",
+        "Q4": "Q4_Top5_Counties_Highest_Volatility.csv",
+    }
+    for question, file in files.items():
+        frames[question].to_csv(out / file, index=False)
+    written = list(files.values())
+
+    if figures:
+        horizon = f"({START_YEAR}-{END_YEAR})"
+        q1 = frames["Q1"].melt("year", var_name="county", value_name="avg_yearly_index").dropna()
+        q2 = frames["Q2"].assign(county=_label(frames["Q2"], "countyname", level))
+        q4 = frames["Q4"].assign(county=_label(frames["Q4"], "countyname", level))
+        plots = [
+            (q1_trend_chart, q1, "Q1_Top10_Counties_Average_Values.png",
+             {"series": "county", "states": list(frames["Q1"].columns[1:]),
+              "title": f"{name}: Top 10 Counties by Yearly Average Values Index"}),
+            (q2_growth_chart, q2, "Q2_Top5_Counties_Growth.png",
+             {"x": "county", "xlabel": "Counties", "title": f"{name}: Top 5 Counties by Home Value Growth {horizon}"}),
+            (q3a_absolute_growth_chart, frames["Q3A"], "Q3A_Top5_Cities_Absolute_Growth.png",
+             {"title": f"{name}: Top 5 Cities by Absolute Growth {horizon}"}),
+            (q3b_pct_growth_chart, frames["Q3B"], "Q3B_Top5_Cities_Percentage_Growth.png",
+             {"title": f"{name}: Top 5 Cities by % Growth {horizon}"}),
+            (q4_volatility_chart, q4, "Q4_Top5_Counties_Highest_Volatility.png",
+             {"y": "county", "ylabel": "County", "title": f"{name}: Top 5 Counties by Volatility (Year-over-Year)"}),
+        ]
+        for builder, df, file, options in plots:
+            if render(df, builder, figs / file, **options) is not None:
+                written.append(f"figures/{file}")
+
+    manifest = {"level": level, "name": name, "key": key, "files": written,
+                "rows": {question: len(df) for question, df in frames.items()}}
+    # Rename over the manifest: a bundle is complete exactly when its bundle.json exists
+    tmp = out / f"{MANIFEST}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, out / MANIFEST)
+    return manifest
+
+def is_complete(out: Path, key: str) -> bool:
+    try:
+        return json.loads((out / MANIFEST).read_text(encoding="utf-8"))["key"] == key
+    except (FileNotFoundError, ValueError, KeyError):
+        return False
+
+# -- workers ------------------------------------------------------------------------------
+
+def build_bundles(path: str, level: str, names: list, out_dir: str, key: str, figures: bool = True,
+                  dpi: int = None) -> list:
+    """Worker: read the batch's rows from the intermediate and write each geography's bundle."""
+    import charts
+    from growth import build_matrix
+    from ranking import DECIMALS
+
+    if dpi is not None:
+        charts.DPI = dpi
+    con = execution.connect()
+    if execution.settings()["threads"] is None:
+        # One DuckDB thread per worker process: the pool supplies the parallelism
+        con.execute("SET threads = 1;")
+    cols = con.execute(BATCH_SQL, {"path": path, "level": level, "parents": list(names)}).fetchnumpy()
+    con.close()
+
+    parents = np.asarray(cols["parent"], dtype=object)
+    children = np.asarray(cols["child_level"], dtype=object)
+    starts = np.flatnonzero(np.r_[True, (parents[1:] != parents[:-1]) | (children[1:] != children[:-1])])
+    stops = np.r_[starts[1:], len(parents)]
+    ranges = {}
+    for lo, hi in zip(starts, stops):
+        ranges[(parents[lo], children[lo])] = slice(lo, hi)
+
+    done = []
+    for name in names:
+        started = time.perf_counter()
+        matrices = {}
+        for child, decimals, label in (("county", 2, "county"), ("city", 2, "city"),
+                                       ("county", DECIMALS.get("volatility"), "county_exact")):
+            rows = ranges.get((name, child), slice(0, 0))
+            matrices[label] = build_matrix(child, cols["statename"][rows], cols["geo"][rows],
+                                           cols["year"][rows], cols["avg_index"][rows], decimals)
+        out = bundle_dir(out_dir, level, name)
+        write_bundle(out, level, name, bundle_frames(level, matrices), key, figures)
+        done.append((level, name, str(out), time.perf_counter() - started))
+    return done
+
+def _batches(geos: list, workers: int) -> list:
+    """Split geographies (largest first) into per-level batches, several per worker."""
+    batches = []
+    for level in LEVELS:
+        names = [name for lv, name, _ in geos if lv == level]
+        if not names:
+            continue
+        size = max(1, math.ceil(len(geos) / (workers * BATCHES_PER_WORKER)))
+        # Deal round-robin so every batch mixes large and small geographies
+        count = math.ceil(len(names) / size)
+        batches += [(level, names[i::count]) for i in range(count)]
+    return batches
+
+def fan_out(con: duckdb.DuckDBPyConnection, out_dir: Path = OUT_DIR, levels=LEVELS, metros: int = METROS,
+            workers: int = None, figures: bool = True, dpi: int = None, force: bool = False) -> pd.DataFrame:
+    """Build every missing bundle; returns the index of all bundles (also written to out_dir/index.csv)."""
+    version = data_version(con)
+    if version is None:
+        raise SystemExit("[error] no ingested data found; run scripts/run_analysis.py first")
+    geos = select_geographies(con, levels, metros)
+    path = build_intermediate(con, version, geos)
+    key = _digest(version, START_YEAR, END_YEAR, Q1_TOP_N, TOP_N, MIN_YEARS, figures, dpi)
+
+    out_dir = Path(out_dir)
+    pending = [g for g in geos if force or not is_complete(bundle_dir(out_dir, g[0], g[1]), key)]
+    print(f"[ok] {len(geos)} geographies: {len(geos) - len(pending)} bundles up to date, {len(pending)} to build")
+    workers = max(1, workers or os.cpu_count() or 1)
+    started = time.perf_counter()
+    built = 0
+    if pending:
+        batches = _batches(pending, workers)
+        args = (str(path),)
+        options = {"out_dir": str(out_dir), "key": key, "figures": figures, "dpi": dpi}
+        if workers == 1:
+            results = (build_bundles(*args, level, names, **options) for level, names in batches)
+            for done in results:
+                built += len(done)
+                print(f"[ok] {built}/{len(pending)} bundles")
+        else:
+            # spawn: never fork a process that holds DuckDB's threads and locks
+            with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=get_context("spawn")) as pool:
+                futures = [pool.submit(build_bundles, *args, level, names, **options) for level, names in batches]
+                for future in as_completed(futures):
+                    built += len(future.result())
+                    print(f"[ok] {built}/{len(pending)} bundles")
+    elapsed = time.perf_counter() - started
+    if built:
+        print(f"[ok] built {built} bundles in {elapsed:.1f}s ({built / elapsed:.2f} per second, {workers} worker(s))")
+
+    index = pd.DataFrame(
+        [(level, name, zips, str(bundle_dir(out_dir, level, name).relative_to(out_dir)))
+         for level, name, zips in geos], columns=["level", "name", "zips", "bundle"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index.to_csv(out_dir / "index.csv", index=False)
+    print(f"[ok] wrote {out_dir / 'index.csv'}")
+    return index
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by run_analysis.py).")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--metros", type=int, default=METROS, help="Largest metros (by zip count) to report on.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU; 1 builds in this process).")
+    parser.add_argument("--out", type=str, default=None, help="Output directory (default: reports/geo/).")
+    parser.add_argument("--no-figures", action="store_true", help="Write the CSVs only.")
+    parser.add_argument("--dpi", type=int, default=None, help="Figure resolution (default: the reports' 200).")
+    parser.add_argument("--force", action="store_true", help="Rebuild bundles that are already up to date.")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+
+    con = snapshots.connect(DATA, args.db)
+    try:
+        fan_out(con, Path(args.out) if args.out else OUT_DIR, args.levels, args.metros, args.workers,
+                figures=not args.no_figures, dpi=args.dpi, force=args.force)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
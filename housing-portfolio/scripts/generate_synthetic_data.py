@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic generator for home_values_yearly_clean.csv.
+
+Produces a CSV with the real column schema (see staging.SCHEMA) at any size:
+- one row per zip code (regionname) and year, 2000-2025,
+- zips spread over the 50 states + DC in proportion to their real zip counts, each zip in
+  a city, each city in a county, most counties in a metro ("Anchorage, AK" style names;
+  rural counties have no metro),
+- realistic gaps: series that start late or stop early, missing years and a few NULL
+  index values,
+- values following a national boom/bust/recovery trend with state and zip-level noise.
+
+The output depends only on --rows and --seed: the geography comes from one seeded RNG and
+every chunk of zips from its own (seed, chunk) RNG. Chunks are written by DuckDB and
+appended to the output file, so memory use does not grow with --rows.
+
+Usage:
+    python scripts/generate_synthetic_data.py --rows 10M --out data/synthetic_10M.csv
+"""
+import argparse
+import os
+import re
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import execution
+
+YEARS = np.arange(2000, 2026, dtype=np.int16)
+ZIPS_PER_CHUNK = 20_000          # part of the output's identity: do not make this an option
+
+# Approximate number of zip codes per state (drives zip, city and county counts)
+STATE_WEIGHTS = {
+    "AK": 240, "AL": 640, "AR": 590, "AZ": 400, "CA": 1760, "CO": 520, "CT": 280, "DC": 50,
+    "DE": 70, "FL": 980, "GA": 730, "HI": 90, "IA": 930, "ID": 280, "IL": 1380, "IN": 780,
+    "KS": 700, "KY": 770, "LA": 520, "MA": 540, "MD": 470, "ME": 430, "MI": 980, "MN": 880,
+    "MO": 1020, "MS": 420, "MT": 360, "NC": 810, "ND": 380, "NE": 580, "NH": 250, "NJ": 590,
+    "NM": 370, "NV": 180, "NY": 1790, "OH": 1190, "OK": 650, "OR": 420, "PA": 1790, "RI": 80,
+    "SC": 420, "SD": 370, "TN": 630, "TX": 1930, "UT": 290, "VA": 890, "VT": 260, "WA": 600,
+    "WI": 770, "WV": 700, "WY": 180,
+}
+# Relative price level of each state (multiplies the national median)
+STATE_PRICE = {
+    "CA": 3.2, "HI": 3.4, "DC": 2.9, "MA": 2.5, "WA": 2.4, "CO": 2.1, "NJ": 2.0, "UT": 2.0,
+    "MD": 1.7, "CT": 1.6, "NY": 1.6, "OR": 1.9, "NV": 1.7, "AZ": 1.6, "ID": 1.6, "RI": 1.7,
+    "NH": 1.6, "FL": 1.5, "MT": 1.6, "VA": 1.5, "MN": 1.3, "DE": 1.4, "TX": 1.2, "VT": 1.4,
+    "WY": 1.3, "ME": 1.3, "GA": 1.2, "NC": 1.2, "TN": 1.2, "SC": 1.1, "WI": 1.1,
+}
+NATIONAL_MEDIAN = 120_000
+CITIES_PER_ZIP = 0.6
+COUNTIES_PER_ZIP = 0.075
+METRO_SHARE = 0.55               # share of counties that belong to a metro area
+COUNTIES_PER_METRO = 3
+
+# Mean yearly log growth of the national trend: boom, bust, recovery, pandemic run-up, flat
+_TREND = {2000: 0.0, **{y: 0.08 for y in range(2001, 2007)}, **{y: -0.06 for y in range(2007, 2012)},
+          **{y: 0.055 for y in range(2012, 2020)}, 2020: 0.08, 2021: 0.17, 2022: 0.08,
+          2023: 0.01, 2024: 0.03, 2025: 0.01}
+TREND = np.array([_TREND[int(y)] for y in YEARS])
+
+def parse_count(text: str) -> int:
+    """'1000', '250k', '1M', '1.5m' -> number of rows."""
+    m = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([kKmMbB]?)\s*", str(text))
+    if not m:
+        raise argparse.ArgumentTypeError(f"not a row count: {text!r}")
+    scale = {"": 1, "k": 1_000, "m": 1_000_000, "b": 1_000_000_000}[m.group(2).lower()]
+    return int(float(m.group(1)) * scale)
+
+def format_count(n: int) -> str:
+    """Inverse of parse_count for round numbers: 1000000 -> '1M'."""
+    for suffix, scale in (("B", 1_000_000_000), ("M", 1_000_000), ("k", 1_000)):
+        if n >= scale and n % scale == 0:
+            return f"{n // scale}{suffix}"
+    return str(n)
+
+def build_geography(seed: int) -> dict:
+    """States, cities, counties and metros with their parent links (fixed for a seed)."""
+    rng = np.random.default_rng([seed, 0])
+    states = np.array(sorted(STATE_WEIGHTS))
+    weights = np.array([STATE_WEIGHTS[s] for s in states], dtype=float)
+
+    city_state, city_county, city_names = [], [], []
+    county_metro, county_names, metro_names = [], [], []
+    for si, st in enumerate(states):
+        n_counties = max(1, round(weights[si] * COUNTIES_PER_ZIP))
+        n_cities = max(n_counties, round(weights[si] * CITIES_PER_ZIP))
+        county0 = len(county_names)
+        # Metro areas group neighbouring counties; the rest are rural (no metro)
+        n_metro_counties = int(round(n_counties * METRO_SHARE)) or 1
+        for c in range(n_counties):
+            county_names.append(f"County {c + 1}")
+            if c < n_metro_counties:
+                if c % COUNTIES_PER_METRO == 0:
+                    metro_names.append(f"Metro {c // COUNTIES_PER_METRO + 1}, {st}")
+                county_metro.append(len(metro_names) - 1)
+            else:
+                county_metro.append(-1)
+        # Every county has a city; the remaining cities favour the metro counties
+        counties = np.concatenate([
+            np.arange(n_counties),
+            (rng.power(0.5, n_cities - n_counties) * n_counties).astype(int),
+        ])
+        for k, c in enumerate(counties):
+            city_state.append(si)
+            city_county.append(county0 + c)
+            city_names.append(f"City {k + 1}")      # names repeat across states, like Springfield
+
+    city_state = np.array(city_state)
+    return {
+        "states": states,
+        "state_p": weights / weights.sum(),
+        "state_price": np.array([STATE_PRICE.get(s, 1.0) for s in states]),
+        "state_cities": [np.flatnonzero(city_state == si) for si in range(len(states))],
+        "city_county": np.array(city_county),
+        "city_names": np.array(city_names, dtype=object),
+        "county_metro": np.array(county_metro),
+        "county_names": np.array(county_names, dtype=object),
+        "metro_names": np.array(metro_names, dtype=object),
+    }
+
+def generate_chunk(geo: dict, seed: int, chunk: int, first_zip: int, n_zips: int) -> pd.DataFrame:
+    """Rows for zips first_zip .. first_zip + n_zips - 1, deterministic for (seed, chunk)."""
+    rng = np.random.default_rng([seed, 1, chunk])
+    n_years = len(YEARS)
+
+    state = rng.choice(len(geo["states"]), size=n_zips, p=geo["state_p"])
+    # Skew zips towards low city numbers: a few big cities hold many zips
+    city = np.empty(n_zips, dtype=np.int64)
+    for si in np.unique(state):
+        idx = np.flatnonzero(state == si)
+        cities = geo["state_cities"][si]
+        city[idx] = cities[(rng.random(idx.size) ** 2.5 * cities.size).astype(int)]
+    county = geo["city_county"][city]
+    metro = geo["county_metro"][county]
+
+    # Gaps: late starts, early ends and scattered missing years
+    start = np.where(rng.random(n_zips) < 0.75, 0, rng.integers(1, 16, n_zips))
+    end = np.where(rng.random(n_zips) < 0.97, n_years - 1, rng.integers(18, n_years - 1, n_zips))
+    years = np.arange(n_years)
+    present = ((years >= start[:, None]) & (years <= end[:, None])
+               & (rng.random((n_zips, n_years)) >= 0.02))
+
+    # Log-normal base value, national trend plus state and zip noise on yearly growth
+    base = np.log(NATIONAL_MEDIAN * geo["state_price"][state]) + rng.normal(0, 0.45, n_zips)
+    state_drift = np.random.default_rng([seed, 2]).normal(0, 0.012, len(geo["states"]))[state]
+    growth = TREND + state_drift[:, None] + rng.normal(0, 0.03, (n_zips, n_years))
+    growth[:, 0] = 0.0
+    values = np.rint(np.exp(base[:, None] + np.cumsum(growth, axis=1)))
+
+    zi, yi = np.nonzero(present)
+    value = pd.array(values[zi, yi].astype(np.int64), dtype="Int64")
+    value[rng.random(zi.size) < 0.005] = pd.NA
+    metro_codes = metro[zi]
+    has_metro = metro_codes >= 0
+    metro_col = np.full(zi.size, None, dtype=object)
+    metro_col[has_metro] = geo["metro_names"][metro_codes[has_metro]]
+    return pd.DataFrame({
+        "regionname": np.char.zfill((first_zip + zi).astype(str), 5),
+        "statename": geo["states"][state[zi]],
+        "city": geo["city_names"][city[zi]],
+        "countyname": geo["county_names"][county[zi]],
+        "metro": metro_col,
+        "year": YEARS[yi],
+        "yearlyindex": value,
+    })
+
+def generate(out: Path, rows: int, seed: int = 42) -> Path:
+    """Write exactly `rows` synthetic rows (plus header) to out; returns out."""
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    geo = build_geography(seed)
+    con = execution.connect()
+    tmp = out.with_name(out.name + ".tmp")
+    written, chunk = 0, 0
+    fd, part = tempfile.mkstemp(suffix=".csv", dir=out.parent)
+    os.close(fd)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"regionname,statename,city,countyname,metro,year,yearlyindex\n")
+            while written < rows:
+                df = generate_chunk(geo, seed, chunk, 1001 + chunk * ZIPS_PER_CHUNK, ZIPS_PER_CHUNK)
+                df = df.iloc[:rows - written]
+                con.register("chunk_df", df)
+                con.execute(f"COPY chunk_df TO '{Path(part).as_posix()}' (HEADER false);")
+                con.unregister("chunk_df")
+                with open(part, "rb") as p:
+                    f.write(p.read())
+                written += len(df)
+                chunk += 1
+        tmp.replace(out)
+    finally:
+        con.close()
+        Path(part).unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+    print(f"[ok] wrote {written:,} synthetic rows to {out}")
+    return out
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=parse_count, default=parse_count("1M"),
+                        help="Number of rows to generate (e.g. 1000000, 250k, 10M).")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed; same rows + seed = same file.")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Output CSV (default: data/synthetic_<rows>.csv).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+    out = Path(args.out) if args.out else Path("data") / f"synthetic_{format_count(args.rows)}.csv"
+    generate(out, args.rows, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Growth between any two years at state, metro, county, city or zip level.
+
+The average index of every geo in every year is loaded once into a dense geo x year matrix
+(NaN where a geo has no data): state to city levels from the persisted geo_year_summary,
+zip level straight from the table, which already holds one row per zip and year. A growth
+horizon is then two matrix columns, so ranking dozens of (start_year, end_year) pairs costs
+about as much as the one scan that built the matrix. The matrix is plain NumPy; pandas is
+imported only by the functions that return DataFrames.
+
+Usage:
+    python scripts/growth.py --level city --horizons 2000-2025 2010-2025 2020-2025 --top-n 10
+"""
+import argparse
+from pathlib import Path
+from typing import TYPE_CHECKING
+import duckdb
+import numpy as np
+import execution
+import queries
+import snapshots
+from aggregates import SOURCE_TABLE
+if TYPE_CHECKING:
+    import pandas as pd
+
+REPO = Path(__file__).resolve().parents[1]
+REPORTS = REPO / "reports"
+
+LEVELS = ("state", "metro", "county", "city", "zip")
+# Name of each level's geo column in reports (matches the source table)
+GEO_COLUMN = {"state": "statename", "metro": "metro", "county": "countyname", "city": "city",
+              "zip": "regionname"}
+METRICS = ("pct_growth", "absolute_growth")
+
+# The queries (sql/loaders.sql) that load each kind of matrix; their text keys the pipeline cache
+MATRIX_QUERIES = ("geo_year_matrix", "zip_year_matrix", "zip_year_matrix_for_state")
+MATRIX_SQL = tuple(queries.sql(name) for name in MATRIX_QUERIES)
+
+# Rough memory per fetched (statename, geo, year, avg) row and its matrix cell, in bytes
+MATRIX_ROW_BYTES = 200
+
+def round_half_away(x: np.ndarray, decimals: int = 2) -> np.ndarray:
+    """Round half away from zero, like DuckDB's ROUND (np.round rounds half to even)."""
+    scale = 10.0 ** decimals
+    return np.sign(x) * np.floor(np.abs(x) * scale + 0.5) / scale
+
+def top_indices(metric: np.ndarray, valid: np.ndarray, top_n: int, geos: np.ndarray,
+                states: np.ndarray) -> np.ndarray:
+    """Rows of the top_n largest valid metric values, ties broken by geo name, then state."""
+    candidates = np.flatnonzero(valid)
+    if len(candidates) > top_n > 0:
+        # Partial selection first: only values tied with the n-th best are sorted below
+        kth = np.partition(metric[candidates], len(candidates) - top_n)[len(candidates) - top_n]
+        candidates = candidates[metric[candidates] >= kth]
+    order = sorted(candidates, key=lambda i: (-metric[i], geos[i], states[i]))[:max(top_n, 0)]
+    return np.array(order, dtype=np.int64)
+
+class GeoYearMatrix:
+    """Average index per geo (rows) and year (columns) for one level."""
+    def __init__(self, level: str, states: np.ndarray, geos: np.ndarray, years: np.ndarray,
+                 values: np.ndarray):
+        self.level = level
+        self.states = states
+        self.geos = geos
+        self.years = years
+        self.values = values
+
+    def __len__(self):
+        return len(self.geos)
+
+    def column(self, year: int) -> np.ndarray:
+        idx = int(year) - int(self.years[0]) if len(self.years) else -1
+        if not 0 <= idx < len(self.years):
+            # Years outside the data have no values rather than failing the whole report
+            return np.full(len(self.geos), np.nan)
+        return self.values[:, idx]
+
+    def _frame(self, rows: np.ndarray, start_year: int, end_year: int, start, end, absolute, pct):
+        import pandas as pd
+        geo_col = GEO_COLUMN[self.level]
+        frame = {geo_col: self.geos[rows]}
+        if self.level not in ("state", "metro"):
+            frame["statename"] = self.states[rows]
+        frame.update({
+            f"value_{start_year}": start[rows],
+            f"value_{end_year}": end[rows],
+            "absolute_growth": absolute[rows],
+            "pct_growth": pct[rows],
+        })
+        return pd.DataFrame(frame)
+
+    def _growth(self, start_year: int, end_year: int):
+        start, end = self.column(start_year), self.column(end_year)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            absolute = end - start
+            pct = round_half_away(absolute / start * 100)
+        valid = np.isfinite(absolute) & np.isfinite(pct)
+        return start, end, absolute, pct, valid
+
+    def growth(self, start_year: int, end_year: int) -> "pd.DataFrame":
+        """Every geo with data in both years."""
+        start, end, absolute, pct, valid = self._growth(start_year, end_year)
+        return self._frame(np.flatnonzero(valid), start_year, end_year, start, end, absolute, pct)
+
+    def top(self, start_year: int, end_year: int, top_n: int = 5, by: str = "pct_growth") -> "pd.DataFrame":
+        """Top geos by growth; ties are broken by geo name, then state (like the SQL rankings)."""
+        if by not in METRICS:
+            raise ValueError(f"by must be one of {', '.join(METRICS)}")
+        start, end, absolute, pct, valid = self._growth(start_year, end_year)
+        metric = pct if by == "pct_growth" else absolute
+        rows = top_indices(metric, valid, top_n, self.geos, self.states)
+        return self._frame(rows, start_year, end_year, start, end, absolute, pct)
+
+def load_matrix(con: duckdb.DuckDBPyConnection, level: str, decimals: int = 2,
+                state: str = None) -> GeoYearMatrix:
+    """
+    Build the dense matrix for level from geo_year_summary (or the table, for zips).
+    Averages are rounded like the SQL questions (ROUND(..., 2)); decimals=None keeps them exact.
+    state restricts a zip-level matrix to one state (see matrix_chunks).
+    """
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+    if level == "zip" and state is not None:
+        cols = queries.execute(con, "zip_year_matrix_for_state", state=state).fetchnumpy()
+    elif level == "zip":
+        cols = queries.execute(con, "zip_year_matrix").fetchnumpy()
+    else:
+        cols = queries.execute(con, "geo_year_matrix", level=level).fetchnumpy()
+    return build_matrix(level, cols["statename"], cols["geo"], cols["year"], cols["avg_index"], decimals)
+
+def build_matrix(level: str, states, geos, years, avg, decimals: int = 2) -> GeoYearMatrix:
+    """The dense matrix of (statename, geo, year, avg_index) rows sorted by statename, geo, year."""
+    states = np.asarray(states, dtype=object)
+    geos = np.asarray(geos, dtype=object)
+    years = np.asarray(years, dtype=np.int64)
+    avg = np.asarray(avg, dtype=np.float64)
+    if decimals is not None:
+        avg = round_half_away(avg, decimals)
+    if len(years) == 0:
+        return GeoYearMatrix(level, states, geos, np.array([], dtype=np.int64), np.empty((0, 0)))
+
+    # Rows arrive sorted by (statename, geo, year): a new geo starts where either key changes
+    new_geo = np.ones(len(geos), dtype=bool)
+    new_geo[1:] = (states[1:] != states[:-1]) | (geos[1:] != geos[:-1])
+    row = np.cumsum(new_geo) - 1
+    first_year = int(years.min())
+    year_axis = np.arange(first_year, int(years.max()) + 1)
+    values = np.full((int(row[-1]) + 1, len(year_axis)), np.nan)
+    values[row, years - first_year] = avg
+    return GeoYearMatrix(level, states[new_geo], geos[new_geo], year_axis, values)
+
+def matrix_chunks(con: duckdb.DuckDBPyConnection, level: str, decimals: int = 2):
+    """
+    Yield the level's matrix: whole when it fits the execution memory budget, otherwise one
+    state at a time. Only the zip level (one row per zip and year) can get that large.
+    """
+    if level == "zip":
+        rows = con.execute(f"SELECT COUNT(*) FROM {SOURCE_TABLE} WHERE yearlyindex IS NOT NULL").fetchone()[0]
+        if not execution.fits(rows * MATRIX_ROW_BYTES):
+            states = con.execute(f"SELECT DISTINCT statename FROM {SOURCE_TABLE} ORDER BY statename").fetchall()
+            print(f"[ok] zip matrix (~{rows * MATRIX_ROW_BYTES / 1e6:,.0f} MB) exceeds the memory budget; "
+                  f"processing {len(states)} states one at a time")
+            for (state,) in states:
+                yield load_matrix(con, level, decimals, state=state)
+            return
+    yield load_matrix(con, level, decimals)
+
+def merge_top(frames, group_cols, by: str, top_n: int, tiebreak, ascending: bool = False) -> "pd.DataFrame":
+    """
+    Combine per-chunk top-N tables into the overall top-N per group (ranks recomputed);
+    ascending=True keeps the smallest values instead (bottom-N).
+    """
+    import pandas as pd
+    df = pd.concat(frames, ignore_index=True)
+    tiebreak = [c for c in tiebreak if c in df.columns]
+    df = df.sort_values([*group_cols, by, *tiebreak], kind="mergesort",
+                        ascending=[True] * len(group_cols) + [ascending] + [True] * len(tiebreak))
+    df = df.groupby(group_cols, sort=False).head(top_n).reset_index(drop=True)
+    df["rank"] = df.groupby(group_cols).cumcount() + 1
+    return df
+
+def parse_horizon(text: str):
+    """'2010-2025' -> (2010, 2025)."""
+    try:
+        start, end = (int(part) for part in text.split("-"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"horizon must look like 2010-2025, got {text!r}")
+    return start, end
+
+def top_growth_horizons(matrix: GeoYearMatrix, horizons, top_n: int = 5,
+                        by: str = "pct_growth") -> "pd.DataFrame":
+    """Top-N per horizon in one long table (start_year, end_year, rank, geo, values, growth)."""
+    import pandas as pd
+    frames = []
+    for start_year, end_year in horizons:
+        df = matrix.top(start_year, end_year, top_n, by)
+        df = df.rename(columns={f"value_{start_year}": "value_start", f"value_{end_year}": "value_end"})
+        df.insert(0, "rank", np.arange(1, len(df) + 1))
+        df.insert(0, "end_year", end_year)
+        df.insert(0, "start_year", start_year)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def top_growth(con: duckdb.DuckDBPyConnection, level: str, horizons, top_n: int = 5,
+               by: str = "pct_growth") -> "pd.DataFrame":
+    """top_growth_horizons for level, chunked by state when the matrix exceeds the memory budget."""
+    frames = [top_growth_horizons(m, horizons, top_n, by) for m in matrix_chunks(con, level)]
+    if len(frames) == 1:
+        return frames[0]
+    return merge_top(frames, ["start_year", "end_year"], by, top_n, [GEO_COLUMN[level], "statename"])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by run_analysis.py).")
+    parser.add_argument("--level", choices=LEVELS, default="state")
+    parser.add_argument("--horizons", nargs="+", type=parse_horizon, default=[(2000, 2025)],
+                        metavar="START-END", help="Year pairs, e.g. 2000-2025 2010-2025 2020-2025.")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--by", choices=METRICS, default="pct_growth")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Output CSV (default: reports/growth_<level>_<by>.csv).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+
+    con = snapshots.connect(REPO / "data", args.db)
+    df = top_growth(con, args.level, args.horizons, args.top_n, args.by)
+    con.close()
+    out = Path(args.out) if args.out else REPORTS / f"growth_{args.level}_{args.by}.csv"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    print(f"[ok] {args.level} growth over {len(args.horizons)} horizon(s)")
+    print(f"[ok] wrote {out}")
+
+if __name__ == "__main__":
+    main()
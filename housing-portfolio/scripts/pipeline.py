@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware stage scheduler with per-stage result caching.
+
+A pipeline is a list of named Stages. Each stage declares the stages it depends on, the
+files it writes and the parameters it is called with; its result is the return value of
+func(*dependency_results, **params). The scheduler:
+
+- fingerprints every stage from its name, code, params, extra key material (e.g. SQL text),
+  the contents of the project's source files (the helpers a stage calls live there too)
+  and the fingerprints of its dependencies; volatile stages (ingest) always run and are
+  fingerprinted by the version they report (e.g. the data SHA-256),
+- skips stages whose fingerprint matches the last successful run and whose outputs exist,
+  loading their cached results only when a stage downstream needs to run,
+- runs independent stages concurrently: threads for SQL/CSV stages, a process pool for
+  stages marked process=True (figures),
+- reports every stage it runs to the active profiling.Profiler (--profile), if any.
+"""
+import fnmatch
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Optional
+import profiling
+
+STATE_FILE = "state.json"
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable
+    deps: tuple = ()
+    outputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    key: Any = None                      # extra cache-key material not passed to func
+    process: bool = False                # run in the process pool (func and args must pickle)
+    volatile: bool = False               # always run; fingerprint comes from version(result)
+    version: Optional[Callable] = None
+
+def _code_key(func) -> str:
+    """Source of func (and of any callables bound into a partial), so code edits invalidate."""
+    if isinstance(func, functools.partial):
+        bound = list(func.args) + list(func.keywords.values())
+        return "\n".join([_code_key(func.func)] + [_code_key(a) for a in bound if callable(a)])
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+def _params_key(params: dict) -> dict:
+    return {k: _code_key(v) if callable(v) else v for k, v in params.items()}
+
+def _files_key(paths) -> str:
+    """SHA-256 over the names and contents of paths."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(Path(path).name.encode("utf-8") + b"\0")
+        h.update(Path(path).read_bytes())
+    return h.hexdigest()
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def select(names, patterns) -> set:
+    """Stage names matching any of the glob patterns (e.g. q2, 'q3*', '*_figure')."""
+    selected = {n for n in names if any(fnmatch.fnmatchcase(n, p) for p in patterns)}
+    unknown = [p for p in patterns if not any(fnmatch.fnmatchcase(n, p) for n in names)]
+    if unknown:
+        raise ValueError(f"no pipeline stage matches {', '.join(unknown)}; stages: {', '.join(names)}")
+    return selected
+
+class Pipeline:
+    def __init__(self, stages: list, cache_dir: Path, workers: int = 4, process_workers: int = 1,
+                 sources=()):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("duplicate stage names")
+        for s in stages:
+            missing = [d for d in s.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"stage {s.name} depends on unknown stage(s) {missing}")
+        self.order = self._toposort()
+        self.cache_dir = Path(cache_dir)
+        self.workers = max(1, workers)
+        self.process_workers = max(1, process_workers)
+        self.sources = tuple(sources)
+        self._serial = threading.Lock()
+
+    def _toposort(self) -> list:
+        order, state = [], {}
+        def visit(name, path=()):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "active":
+                raise ValueError(f"dependency cycle: {' -> '.join(path + (name,))}")
+            state[name] = "active"
+            for dep in self.stages[name].deps:
+                visit(dep, path + (name,))
+            state[name] = "done"
+            order.append(name)
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def upstream(self, names) -> set:
+        seen, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name not in seen:
+                seen.add(name)
+                todo.extend(self.stages[name].deps)
+        return seen
+
+    # -- cache ------------------------------------------------------------------------
+
+    def _load_state(self) -> dict:
+        try:
+            return json.loads((self.cache_dir / STATE_FILE).read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / (STATE_FILE + ".tmp")
+        tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+        tmp.replace(self.cache_dir / STATE_FILE)
+
+    def _result_path(self, name: str) -> Path:
+        return self.cache_dir / f"{name}.pkl"
+
+    def _store_result(self, name: str, result):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._result_path(name), "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _load_result(self, name: str):
+        with open(self._result_path(name), "rb") as f:
+            return pickle.load(f)
+
+    # -- execution --------------------------------------------------------------------
+
+    def run(self, only=None, force=None) -> dict:
+        """
+        Run the pipeline. only: glob patterns of stages to build (plus whatever they depend
+        on); force: glob patterns of stages to rebuild even if cached (empty list = all).
+        Returns {stage: "ran" | "cached"} for the stages that were considered.
+        """
+        wanted = self.upstream(select(self.order, only)) if only else set(self.order)
+        forced = set(self.order) if force == [] else (select(self.order, force) if force else set())
+        state = self._load_state()
+        results, fingerprints, status = {}, {}, {}
+
+        # Volatile stages (ingest) run first and define the data version everything keys on
+        for name in self.order:
+            stage = self.stages[name]
+            if name in wanted and stage.volatile:
+                results[name] = self._call(stage, [results[d] for d in stage.deps])
+                fingerprints[name] = _digest(name, stage.version(results[name]) if stage.version else None)
+                status[name] = "ran"
+
+        code = _files_key(self.sources)
+        for name in self.order:
+            stage = self.stages[name]
+            if name in wanted and not stage.volatile:
+                fingerprints[name] = _digest(
+                    name, code, _code_key(stage.func), _params_key(stage.params), stage.key,
+                    [fingerprints[d] for d in stage.deps])
+
+        def up_to_date(name):
+            stage = self.stages[name]
+            return (name not in forced and state.get(name) == fingerprints[name]
+                    and all(Path(p).exists() for p in stage.outputs))
+
+        pending = {n for n in self.order if n in wanted and n not in status and not up_to_date(n)}
+        # A skipped dependency of a stage that runs must have its cached result on disk
+        changed = True
+        while changed:
+            changed = False
+            for name in list(pending):
+                for dep in self.stages[name].deps:
+                    if (dep not in pending and dep not in status
+                            and not self._result_path(dep).exists()):
+                        pending.add(dep)
+                        changed = True
+
+        for name in self.order:
+            if name in wanted and name not in pending and name not in status:
+                status[name] = "cached"
+                print(f"[skip] {name} is up to date")
+
+        threads = ThreadPoolExecutor(max_workers=self.workers)
+        processes = None
+        if self.process_workers > 1 and any(self.stages[n].process for n in pending):
+            # spawn: never fork a process that holds DuckDB's threads and locks
+            processes = ProcessPoolExecutor(max_workers=self.process_workers, mp_context=get_context("spawn"))
+        running = {}
+        try:
+            while pending or running:
+                for name in [n for n in self.order if n in pending]:
+                    stage = self.stages[name]
+                    if any(d in pending or d in running.values() for d in stage.deps):
+                        continue
+                    args = [self._dep_result(d, results) for d in stage.deps]
+                    pending.discard(name)
+                    if stage.process and processes is not None and profiling.active():
+                        # Measured inside the worker process, reported back with the result
+                        future = processes.submit(profiling.measure, stage.func, *args, **stage.params)
+                    elif stage.process and processes is not None:
+                        future = processes.submit(stage.func, *args, **stage.params)
+                    else:
+                        future = threads.submit(self._call, stage, args)
+                    running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    if self.stages[name].process and processes is not None and profiling.active():
+                        results[name], metrics = results[name]
+                        profiling.active().record_stage(name, metrics)
+                    self._store_result(name, results[name])
+                    status[name] = "ran"
+                    state[name] = fingerprints[name]
+                    self._save_state(state)
+                    print(f"[ok] stage {name}")
+        finally:
+            threads.shutdown(wait=True, cancel_futures=True)
+            if processes is not None:
+                processes.shutdown(wait=True, cancel_futures=True)
+        self._save_state(state)
+        return status
+
+    def _dep_result(self, name: str, results: dict):
+        if name not in results:
+            results[name] = self._load_result(name) if self._result_path(name).exists() else None
+        return results[name]
+
+    def _call(self, stage: Stage, args: list):
+        if stage.process:
+            # Without a process pool, process stages (pyplot) must not overlap in threads
+            with self._serial:
+                return profiling.call(stage.name, stage.func, *args, **stage.params)
+        return profiling.call(stage.name, stage.func, *args, **stage.params)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Year x state wide tables built in DuckDB (the Q1 report layout).
+
+The states are picked in SQL, top-N by one of STATE_METRICS over state_year_summary (the
+top_states query in sql/loaders.sql), and the wide table is DuckDB's PIVOT of their yearly
+averages: one row per year, one column per state. The presentation copy (whole numbers with
+thousands separators, rounded half to even like the pandas report it replaces) is a
+projection of that same result in DuckDB, so no CSV is re-read and no cell is formatted in
+Python. Both tables are Arrow tables (see report_tables.py).
+"""
+from typing import TYPE_CHECKING
+import duckdb
+import queries
+from aggregates import SUMMARY_TABLE
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Ranking metrics over a state's yearly averages (see the top_states query)
+STATE_METRICS = ("mean_index", "latest_index", "pct_growth")
+
+# PIVOT ... IN needs literal values, so the state list is spliced in (see queries.literal)
+# and this statement cannot be prepared once like the registry's queries
+PIVOT_SQL = f"""
+PIVOT (
+    SELECT statename, year, ROUND(sum_index / count_index, 2) AS avg_yearly_index
+    FROM {SUMMARY_TABLE}
+    WHERE list_contains({{states}}, statename)
+)
+ON statename IN ({{columns}})
+USING first(avg_yearly_index)
+GROUP BY year
+ORDER BY year;
+"""
+
+def top_states(con: duckdb.DuckDBPyConnection, top_n: int = 10, by: str = "mean_index") -> list:
+    """The top_n states by metric `by`, best first (ties by state name)."""
+    if by not in STATE_METRICS:
+        raise ValueError(f"by must be one of {', '.join(STATE_METRICS)}")
+    rows = queries.execute(con, "top_states", metric=by, top_n=top_n).fetchall()
+    return [state for (state,) in rows]
+
+def state_year_pivot(con: duckdb.DuckDBPyConnection, states: list) -> "pa.Table":
+    """Average index (2 decimals) per year (rows) and state (columns, in the given order)."""
+    import pyarrow as pa
+    from report_tables import fetch
+    if not states:
+        return pa.table({"year": pa.array([], pa.int64())})
+    states = [str(state) for state in states]
+    columns = ", ".join(queries.literal(state) for state in states)
+    return fetch(con.execute(PIVOT_SQL.format(states=queries.literal(states), columns=columns)))
+
+def presentation(con: duckdb.DuckDBPyConnection, wide: "pa.Table", decimals: int = 0) -> "pa.Table":
+    """wide with every value column rounded half to even and formatted like 1,234,567."""
+    from report_tables import fetch
+    if wide.num_columns < 2:
+        return wide
+    # COLUMNS(...) applies the expression to every state column and keeps the column names
+    return fetch(con.from_arrow(wide).project(
+        f"year, format('{{:,.{decimals}f}}', round_even(COLUMNS(* EXCLUDE (year)), {decimals}))"
+    ))
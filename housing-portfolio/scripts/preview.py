@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Approximate preview of Q1-Q4 from a persisted, state-stratified sample (run_analysis.py --preview).
+
+The sample keeps every row of a fixed share of the zip codes of each state: per state,
+max(--preview fraction x its zips, MIN_ZIPS) zips drawn uniformly (what a reservoir of that
+size per stratum yields) by ranking the zips on a seeded hash, in one pass over the table.
+Whole zips are sampled so growth and year-over-year changes compare the same places. The
+sample is stored as preview_sample and rebuilt only when the data version, the fraction or
+the seed changes.
+
+Estimates come with 95% confidence intervals from a stratified bootstrap: the sampled zips
+of each state are resampled BOOTSTRAP_REPLICATES times (one weight matrix product per state)
+and every question is recomputed on each replicate. Intervals are the estimate +/- 1.96
+bootstrap standard errors, shrunk by the finite population correction sqrt(1 - sampled share
+of the state); percentile intervals would be skewed by the upward bias of volatility on
+resampled data. Q4 is estimated as the exact report computes it: the standard deviation of
+the year-over-year changes of each state's yearly means (ranking.yoy_changes). For the
+rankings (Q2 growth, Q3 cities, Q4 volatility) each entry reports how often it stays in the
+top N across the replicates (top_n_share) and a stability label.
+
+Outputs go to reports/preview/ (figures at low resolution), never over the exact reports.
+"""
+import json
+import time
+import warnings
+from pathlib import Path
+import duckdb
+import numpy as np
+import pandas as pd
+import charts
+from ranking import yoy_changes
+from charts import (ChartRenderer, q1_trend_chart, q2_growth_chart, q3a_absolute_growth_chart,
+                    q3b_pct_growth_chart, q4_volatility_chart)
+
+SOURCE_TABLE = "home_values_yearly_clean"
+SAMPLE_TABLE = "preview_sample"
+SAMPLE_META_TABLE = "preview_metadata"
+MIN_ZIPS = 10                     # per state, so small states still get a usable interval
+BOOTSTRAP_REPLICATES = 200
+PREVIEW_DPI = 72
+# top_n_share at or above which a ranked entry is labelled stable / likely
+STABILITY_LEVELS = ((0.9, "stable"), (0.6, "likely"), (0.0, "uncertain"))
+
+# -- sample -------------------------------------------------------------------------------
+
+def _data_version(con: duckdb.DuckDBPyConnection):
+    row = con.execute("SELECT sha256 FROM ingest_metadata WHERE table_name = ?;", [SOURCE_TABLE]).fetchone()
+    return row[0] if row else None
+
+def _sample_params(con: duckdb.DuckDBPyConnection):
+    try:
+        row = con.execute(f"SELECT sha256, fraction, seed, min_zips FROM {SAMPLE_META_TABLE};").fetchone()
+    except duckdb.CatalogException:
+        return None
+    return row
+
+def ensure_sample(con: duckdb.DuckDBPyConnection, fraction: float, seed: int = 42) -> bool:
+    """(Re)build preview_sample unless it matches the data version and parameters; True if built."""
+    version = _data_version(con)
+    if _sample_params(con) == (version, fraction, seed, MIN_ZIPS):
+        print(f"[skip] {SAMPLE_TABLE} is up to date ({fraction:g} of the zips, seed {seed})")
+        return False
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {SAMPLE_TABLE} AS
+        WITH zips AS (
+            SELECT statename, regionname,
+                   row_number() OVER (PARTITION BY statename ORDER BY hash(regionname, $seed), regionname) AS pick,
+                   COUNT(*) OVER (PARTITION BY statename) AS state_zips
+            FROM (SELECT DISTINCT statename, regionname FROM {SOURCE_TABLE} WHERE regionname IS NOT NULL)
+        ),
+        chosen AS (
+            SELECT statename, regionname, state_zips
+            FROM zips
+            WHERE pick <= GREATEST(LEAST($min_zips, state_zips), CEIL($fraction * state_zips))
+        )
+        SELECT t.*, c.state_zips
+        FROM {SOURCE_TABLE} t
+        JOIN chosen c ON t.regionname = c.regionname AND t.statename IS NOT DISTINCT FROM c.statename;
+    """, {"seed": seed, "fraction": fraction, "min_zips": MIN_ZIPS})
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {SAMPLE_META_TABLE} AS
+        SELECT ?::VARCHAR AS sha256, ?::DOUBLE AS fraction, ?::INTEGER AS seed, ?::INTEGER AS min_zips,
+               (SELECT COUNT(*) FROM {SAMPLE_TABLE}) AS row_count, now()::TIMESTAMP AS built_at;
+    """, [version, fraction, seed, MIN_ZIPS])
+    rows = con.execute(f"SELECT row_count FROM {SAMPLE_META_TABLE};").fetchone()[0]
+    print(f"[ok] built {SAMPLE_TABLE}: {rows:,} rows ({fraction:g} of the zips of each state, seed {seed})")
+    return True
+
+# -- bootstrap ----------------------------------------------------------------------------
+
+class StateSample:
+    """Sampled zips of one state as a dense zip x year matrix, with bootstrap weights."""
+    def __init__(self, state, zips, cities, years, values, state_zips, weights):
+        self.state = state
+        self.zips = zips
+        self.cities = cities
+        self.years = years
+        self.values = values
+        self.state_zips = state_zips
+        self.weights = weights          # (1 + replicates) x zips; row 0 = the sample itself
+        self.fpc = np.sqrt(max(0.0, 1 - len(zips) / state_zips))
+
+    def year_means(self, values: np.ndarray = None) -> np.ndarray:
+        """Weighted mean per year for every replicate: (1 + replicates) x years."""
+        values = self.values if values is None else values
+        present = ~np.isnan(values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.weights @ np.where(present, values, 0.0)) / (self.weights @ present)
+
+
+def load_state_samples(con: duckdb.DuckDBPyConnection, replicates: int, seed: int) -> list:
+    cols = con.execute(f"""
+        SELECT statename, regionname, any_value(city) OVER (PARTITION BY statename, regionname) AS city,
+               year, yearlyindex, state_zips
+        FROM {SAMPLE_TABLE}
+        WHERE statename IS NOT NULL
+        ORDER BY statename, regionname, year
+    """).fetchnumpy()
+    states = np.asarray(cols["statename"], dtype=object)
+    if len(states) == 0:
+        return []
+    zips = np.asarray(cols["regionname"], dtype=object)
+    years = np.asarray(cols["year"], dtype=np.int64)
+    values = np.ma.filled(np.ma.asarray(cols["yearlyindex"], dtype=np.float64), np.nan)
+    first, year_axis = int(years.min()), np.arange(int(years.min()), int(years.max()) + 1)
+
+    new_zip = np.ones(len(zips), dtype=bool)
+    new_zip[1:] = (states[1:] != states[:-1]) | (zips[1:] != zips[:-1])
+    row = np.cumsum(new_zip) - 1
+    matrix = np.full((int(row[-1]) + 1, len(year_axis)), np.nan)
+    matrix[row, years - first] = values
+    zip_state, zip_name = states[new_zip], zips[new_zip]
+    zip_city = np.asarray(cols["city"], dtype=object)[new_zip]
+    zip_count = np.asarray(cols["state_zips"])[new_zip]
+
+    rng = np.random.default_rng(seed)
+    samples = []
+    bounds = np.flatnonzero(np.r_[True, zip_state[1:] != zip_state[:-1], True])
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        n = hi - lo
+        weights = np.vstack([np.ones((1, n)), rng.multinomial(n, np.full(n, 1 / n), size=replicates)])
+        samples.append(StateSample(zip_state[lo], zip_name[lo:hi], zip_city[lo:hi], year_axis,
+                                   matrix[lo:hi], int(zip_count[lo]), weights))
+    return samples
+
+def _interval(replicates: np.ndarray, fpc) -> tuple:
+    """Point estimate (row 0) and its 95% interval from the FPC-scaled spread of the other rows."""
+    est = replicates[0]
+    with warnings.catch_warnings():
+        # Entries missing from every replicate (e.g. a year no sampled zip covers) stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        half = 1.96 * np.nanstd(replicates[1:], axis=0, ddof=1) * fpc
+    return est, est - half, est + half
+
+def _stability(metric: np.ndarray, names: list, top_n: int) -> tuple:
+    """Point top-N (by row 0) and each entry's share of replicates that keep it in the top N."""
+    score = np.where(np.isnan(metric), -np.inf, metric)
+    order = sorted(range(score.shape[1]), key=lambda i: (-score[0, i], names[i]))
+    top = [i for i in order[:top_n] if np.isfinite(score[0, i])]
+    if not top:
+        return [], np.array([])
+    # Rank of each entry within its replicate (0 = best); ties resolved by column order
+    ranks = np.argsort(np.argsort(-score[1:], axis=1, kind="stable"), axis=1)
+    share = (ranks[:, top] < top_n).mean(axis=0)
+    return top, share
+
+def _label(share) -> list:
+    return [next(label for level, label in STABILITY_LEVELS if s >= level) for s in share]
+
+def _pct_growth(start, end):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (end - start) / start * 100
+
+# -- questions ----------------------------------------------------------------------------
+
+def preview_q1(samples: list, states: list) -> pd.DataFrame:
+    frames = []
+    for s in samples:
+        if s.state not in states:
+            continue
+        est, lo, hi = _interval(s.year_means(), s.fpc)
+        zips = (~np.isnan(s.values)).sum(axis=0)
+        keep = zips > 0
+        frames.append(pd.DataFrame({"statename": s.state, "year": s.years[keep],
+                                    "avg_yearly_index": est[keep].round(2), "ci_low": lo[keep].round(2),
+                                    "ci_high": hi[keep].round(2), "zips_sampled": zips[keep]}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def preview_q2(samples: list, start_year: int, end_year: int, top_n: int) -> pd.DataFrame:
+    names = [s.state for s in samples]
+    means = [s.year_means() for s in samples]
+    column = lambda m, s, year: m[:, s.years == year].ravel() if year in s.years else np.full(len(m), np.nan)
+    value_s = np.column_stack([column(m, s, start_year) for m, s in zip(means, samples)])
+    value_e = np.column_stack([column(m, s, end_year) for m, s in zip(means, samples)])
+    growth = _pct_growth(value_s, value_e)
+    top, share = _stability(growth, names, top_n)
+    fpc = np.array([s.fpc for s in samples])
+    est, lo, hi = _interval(growth, fpc)
+    return pd.DataFrame({
+        "statename": [names[i] for i in top],
+        f"value_{start_year}": value_s[0, top].round(2),
+        f"value_{end_year}": value_e[0, top].round(2),
+        "pct_growth": est[top].round(2),
+        "pct_growth_ci_low": lo[top].round(2),
+        "pct_growth_ci_high": hi[top].round(2),
+        "top_n_share": share.round(3),
+        "stability": _label(share),
+    })
+
+def preview_city_growth(samples: list, start_year: int, end_year: int, top_n: int):
+    """Q3A (absolute) and Q3B (percentage) city rankings with intervals and stability."""
+    start_cols, end_cols, names, cities, states, fpcs, zips_sampled = [], [], [], [], [], [], []
+    for s in samples:
+        if start_year not in s.years or end_year not in s.years:
+            continue
+        city_codes, city_of_zip = np.unique(s.cities.astype(str), return_inverse=True)
+        onehot = np.zeros((len(s.zips), len(city_codes)))
+        onehot[np.arange(len(s.zips)), city_of_zip] = 1.0
+        for year, out in ((start_year, start_cols), (end_year, end_cols)):
+            v = s.values[:, int(np.flatnonzero(s.years == year)[0])]
+            present = ~np.isnan(v)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out.append(((s.weights * np.where(present, v, 0.0)) @ onehot)
+                           / ((s.weights * present) @ onehot))
+        names += [f"{c}, {s.state}" for c in city_codes]
+        cities += list(city_codes)
+        states += [s.state] * len(city_codes)
+        fpcs += [s.fpc] * len(city_codes)
+        zips_sampled += list(onehot.sum(axis=0).astype(int))
+    if not names:
+        return pd.DataFrame(), pd.DataFrame()
+    value_s, value_e = np.hstack(start_cols), np.hstack(end_cols)
+    absolute, pct = value_e - value_s, _pct_growth(value_s, value_e)
+    fpc = np.array(fpcs)
+
+    def ranking(metric, by):
+        top, share = _stability(metric, names, top_n)
+        est, lo, hi = _interval(metric, fpc)
+        return pd.DataFrame({
+            "city": [cities[i] for i in top],
+            "statename": [states[i] for i in top],
+            f"value_{start_year}": value_s[0, top].round(2),
+            f"value_{end_year}": value_e[0, top].round(2),
+            "absolute_growth": absolute[0, top].round(2),
+            "pct_growth": pct[0, top].round(2),
+            f"{by}_ci_low": lo[top].round(2),
+            f"{by}_ci_high": hi[top].round(2),
+            "zips_sampled": [zips_sampled[i] for i in top],
+            "top_n_share": share.round(3),
+            "stability": _label(share),
+        })
+    return ranking(absolute, "absolute_growth"), ranking(pct, "pct_growth")
+
+def preview_q4(samples: list, top_n: int, min_years: int) -> pd.DataFrame:
+    names, vol, avg, worst, best, years_tracked, fpc = [], [], [], [], [], [], []
+    for s in samples:
+        yoy, has_change = yoy_changes(s.year_means())
+        tracked = int(has_change[0].sum())
+        if tracked < max(min_years, 2):
+            continue
+        names.append(s.state)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            vol.append(np.nanstd(yoy, axis=1, ddof=1))
+            avg.append(np.nanmean(yoy, axis=1))
+            worst.append(np.nanmin(yoy[0]))
+            best.append(np.nanmax(yoy[0]))
+        years_tracked.append(tracked)
+        fpc.append(s.fpc)
+    if not names:
+        return pd.DataFrame()
+    vol, avg = np.column_stack(vol), np.column_stack(avg)
+    top, share = _stability(vol, names, top_n)
+    est, lo, hi = _interval(vol, np.array(fpc))
+    worst, best = np.array(worst), np.array(best)
+    return pd.DataFrame({
+        "state": [names[i] for i in top],
+        "years_tracked": [years_tracked[i] for i in top],
+        "avg_annual_change_pct": avg[0, top].round(2),
+        "volatility_pct": est[top].round(2),
+        "volatility_ci_low": lo[top].round(2),
+        "volatility_ci_high": hi[top].round(2),
+        "range_pct": (best[top] - worst[top]).round(2),
+        "worst_year_pct": worst[top].round(2),
+        "best_year_pct": best[top].round(2),
+        "top_n_share": share.round(3),
+        "stability": _label(share),
+    })
+
+# -- run ----------------------------------------------------------------------------------
+
+def run_preview(con: duckdb.DuckDBPyConnection, out_dir: Path, states: list, fraction: float = 0.05,
+                seed: int = 42, top_n: int = 5, start_year: int = 2000, end_year: int = 2025,
+                min_years: int = 10) -> dict:
+    """Estimate Q1-Q4 on the sample and write reports/preview/; returns the result frames."""
+    if not 0 < fraction <= 1:
+        raise ValueError(f"preview fraction must be in (0, 1], got {fraction}")
+    t0 = time.perf_counter()
+    ensure_sample(con, fraction, seed)
+    samples = load_state_samples(con, BOOTSTRAP_REPLICATES, seed)
+    df3a, df3b = preview_city_growth(samples, start_year, end_year, top_n)
+    results = {
+        "Q1_Top10_States_Average_Values": preview_q1(samples, states),
+        "Q2_Top5_Home_Values_Growth": preview_q2(samples, start_year, end_year, top_n),
+        "Q3A_Top5_Cities_Absolute_Growth": df3a,
+        "Q3B_Top5_Cities_Percentage_Growth": df3b,
+        "Q4_Top5_States_Highest_Volatility": preview_q4(samples, top_n, min_years),
+    }
+    estimated = time.perf_counter() - t0
+
+    figs = out_dir / "figures"
+    figs.mkdir(parents=True, exist_ok=True)
+    for name, df in results.items():
+        df.to_csv(out_dir / f"{name}.csv", index=False)
+    (out_dir / "preview.json").write_text(json.dumps({
+        "fraction": fraction, "seed": seed, "replicates": BOOTSTRAP_REPLICATES,
+        "zips_sampled": int(sum(len(s.zips) for s in samples)),
+        "zips_total": int(sum(s.state_zips for s in samples)),
+    }, indent=2), encoding="utf-8")
+    # Low-resolution figures, rendered inline: spawning workers would cost more than drawing
+    charts.DPI = PREVIEW_DPI
+    with ChartRenderer(workers=1) as renderer:
+        renderer.submit(q1_trend_chart, results["Q1_Top10_States_Average_Values"],
+                        figs / "Q1_Top10_States_Average_Values.png", states=states)
+        renderer.submit(q2_growth_chart, results["Q2_Top5_Home_Values_Growth"], figs / "Q2_Top5_Home_Values_Growth.png")
+        renderer.submit(q3a_absolute_growth_chart, df3a, figs / "Q3A_Top5_Cities_Absolute_Growth.png")
+        renderer.submit(q3b_pct_growth_chart, df3b, figs / "Q3B_Top5_Cities_Percentage_Growth.png")
+        renderer.submit(q4_volatility_chart, results["Q4_Top5_States_Highest_Volatility"],
+                        figs / "Q4_Top5_States_Highest_Volatility.png")
+    print(f"[ok] preview estimates in {estimated:.2f}s, figures in {time.perf_counter() - t0 - estimated:.2f}s; "
+          f"wrote {out_dir}")
+    for name, df in results.items():
+        if "stability" in df.columns:
+            ranked = ", ".join(f"{r.iloc[0]} ({r['stability']})" for _, r in df.iterrows())
+            print(f"       {name.split('_')[0]}: {ranked}")
+    return results
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for the pipeline scripts (--profile).
+
+While a Profiler is active:
+- every stage run through call() / measure() records wall time, CPU time, resident memory
+  (current and high-water mark) and the rows it returned,
+- every SQL statement on a connection from connect() is profiled by DuckDB; the JSON
+  operator tree (what EXPLAIN ANALYZE shows) is kept together with the time spent fetching
+  and converting the result (.df() etc.),
+- write() saves everything as one JSON trace plus a plain-text summary table.
+
+When no Profiler is active, connect() returns a plain DuckDB connection and call() just
+calls the function, so the instrumentation costs nothing in normal runs.
+
+CPU time is process-wide and the peak RSS is the process high-water mark, so stages that run
+concurrently share them; run with --workers 1 for exact per-stage figures.
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import duckdb
+import execution
+
+_active = None
+_local = threading.local()
+
+# -- memory -------------------------------------------------------------------------------
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident memory, in MB."""
+    try:
+        # Linux: VmHWM honours reset_peak_rss()
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def rss_mb():
+    """Current resident memory in MB (None where /proc is not available)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def reset_peak_rss():
+    # A spawned worker starts with the high-water mark of the process it was forked from;
+    # Linux can reset it (elsewhere the peak may include the parent's footprint)
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+# -- stages -------------------------------------------------------------------------------
+
+def _table_rows(result):
+    # A process that never imported pandas has no DataFrames to count
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(result, pd.DataFrame):
+        return len(result)
+    # Arrow tables and record batches
+    rows = getattr(result, "num_rows", None)
+    return rows if isinstance(rows, int) else None
+
+def count_rows(result):
+    """
+    Rows in a stage result: DataFrames or Arrow tables (or tuples and lists of them), lists
+    of values (e.g. the Q1 states), row counts or a .rows attribute.
+    """
+    rows = _table_rows(result)
+    if rows is not None:
+        return rows
+    if isinstance(result, (tuple, list)) and result:
+        counts = [_table_rows(r) for r in result]
+        if all(count is not None for count in counts):
+            return sum(counts)
+        if isinstance(result, list) and not any(count is not None for count in counts):
+            return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    rows = getattr(result, "rows", None)
+    return rows if isinstance(rows, int) else None
+
+def measure(func, /, *args, **kwargs):
+    """Call func and return (result, metrics); picklable, so usable in a process pool."""
+    rss0 = rss_mb()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    result = func(*args, **kwargs)
+    wall, cpu, rss1 = time.perf_counter() - t0, time.process_time() - cpu0, rss_mb()
+    metrics = {
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "rss_start_mb": None if rss0 is None else round(rss0, 1),
+        "rss_end_mb": None if rss1 is None else round(rss1, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rows": count_rows(result),
+        "pid": os.getpid(),
+    }
+    return result, metrics
+
+def call(name: str, func, /, *args, **kwargs):
+    """Run func as stage `name`, attributing its SQL statements to it when profiling."""
+    if _active is None:
+        return func(*args, **kwargs)
+    previous = getattr(_local, "stage", None)
+    _local.stage = name
+    try:
+        result, metrics = measure(func, *args, **kwargs)
+    finally:
+        _local.stage = previous
+    _active.record_stage(name, metrics)
+    return result
+
+def active():
+    return _active
+
+# -- SQL ----------------------------------------------------------------------------------
+
+def connect(database: str = ":memory:", **kwargs):
+    """execution.connect() (the run's memory/thread profile), profiled when a Profiler is active."""
+    con = execution.connect(database, **kwargs)
+    return ProfiledConnection(con, _active) if _active is not None else con
+
+class ProfiledConnection:
+    """
+    Wraps a DuckDB connection or cursor and records each statement's DuckDB profile.
+
+    DuckDB finalises a query's profile only once its result is exhausted, so the profile is
+    read when a fetch call drains the result (fetchone() buffers the remaining rows, which
+    are small wherever it is used) or, failing that, before the next statement runs.
+    """
+    def __init__(self, con: duckdb.DuckDBPyConnection, profiler):
+        self._con = con
+        self._profiler = profiler
+        self._pending = None
+        self._rows = None
+        con.execute("PRAGMA enable_profiling = 'no_output';")
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def cursor(self):
+        return ProfiledConnection(self._con.cursor(), self._profiler)
+
+    def execute(self, sql, parameters=None):
+        self._finish()
+        self._rows = None
+        t0 = time.perf_counter()
+        if parameters is None:
+            self._con.execute(sql)
+        else:
+            self._con.execute(sql, parameters)
+        self._pending = {"sql": sql, "params": parameters, "t0": t0,
+                         "execute_seconds": time.perf_counter() - t0, "fetch_seconds": 0.0}
+        return self
+
+    def _fetch(self, method, *args, done=True, **kwargs):
+        t0 = time.perf_counter()
+        out = getattr(self._con, method)(*args, **kwargs)
+        if self._pending is not None:
+            self._pending["fetch_seconds"] += time.perf_counter() - t0
+            if done:
+                self._finish()
+        return out
+
+    def df(self, **kwargs):
+        return self._fetch("df", **kwargs)
+
+    fetchdf = df
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, None
+            return rows
+        return self._fetch("fetchall")
+
+    def fetchnumpy(self):
+        return self._fetch("fetchnumpy")
+
+    def to_arrow_table(self):
+        # to_arrow_table() replaced fetch_arrow_table() in DuckDB 1.4
+        return self._fetch("to_arrow_table" if hasattr(self._con, "to_arrow_table") else "fetch_arrow_table")
+
+    def fetchone(self):
+        if self._rows is None:
+            self._rows = self._fetch("fetchall")
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            rows, self._rows = self._rows[:size], self._rows[size:]
+            return rows
+        rows = self._fetch("fetchmany", size, done=False)
+        if not rows:
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        self._con.close()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        profile = None
+        try:
+            info = json.loads(self._con.get_profiling_information(format="json"))
+            if info.get("query_name") == pending["sql"]:
+                profile = info
+        except (AttributeError, duckdb.Error, ValueError):
+            pass  # older DuckDB without get_profiling_information(), or nothing profiled
+        self._profiler.record_query(pending, profile, time.perf_counter() - pending["t0"])
+
+def _hot_operator(node: dict):
+    """(operator name, seconds) of the most expensive operator in a profile tree."""
+    best = (None, 0.0)
+    todo = list(node.get("children", []))
+    while todo:
+        op = todo.pop()
+        timing = op.get("operator_timing") or 0.0
+        if timing > best[1]:
+            best = (op.get("operator_name") or op.get("operator_type"), timing)
+        todo.extend(op.get("children", []))
+    return best
+
+def _params(parameters):
+    if parameters is None:
+        return None
+    return json.loads(json.dumps(parameters, default=str))
+
+# -- trace --------------------------------------------------------------------------------
+
+class Profiler:
+    """Collects stage and SQL records; activate with `with Profiler(...)`."""
+    def __init__(self, script: str):
+        self.script = script
+        self.stages = []
+        self.queries = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self.started_at = datetime.now(timezone.utc)
+
+    def __enter__(self):
+        global _active
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        _active = None
+        return False
+
+    def record_stage(self, name: str, metrics: dict):
+        with self._lock:
+            self.stages.append({"stage": name, **metrics})
+
+    def record_query(self, pending: dict, profile, wall_seconds: float):
+        record = {
+            "stage": getattr(_local, "stage", None),
+            "sql": " ".join(str(pending["sql"]).split()),
+            "params": _params(pending["params"]),
+            "wall_seconds": round(wall_seconds, 4),
+            "execute_seconds": round(pending["execute_seconds"], 4),
+            "fetch_seconds": round(pending["fetch_seconds"], 4),
+            "latency_seconds": None,
+            "cpu_seconds": None,
+            "rows_returned": None,
+            "rows_scanned": None,
+            "peak_buffer_mb": None,
+            "hot_operator": None,
+            "hot_operator_seconds": None,
+            "profile": profile,
+        }
+        if profile:
+            op, seconds = _hot_operator(profile)
+            record.update({
+                "latency_seconds": profile.get("latency"),
+                "cpu_seconds": profile.get("cpu_time"),
+                "rows_returned": profile.get("rows_returned"),
+                "rows_scanned": profile.get("cumulative_rows_scanned"),
+                "peak_buffer_mb": round((profile.get("system_peak_buffer_memory") or 0) / 2**20, 1),
+                "hot_operator": op,
+                "hot_operator_seconds": round(seconds, 4),
+            })
+        with self._lock:
+            self.queries.append(record)
+
+    def stage_rows(self, stage: dict):
+        if stage["rows"] is not None:
+            return stage["rows"]
+        # Stages that return nothing (exports, workbooks): rows their statements returned
+        rows = [q["rows_returned"] for q in self.queries
+                if q["stage"] == stage["stage"] and q["rows_returned"] is not None]
+        return sum(rows) if rows else None
+
+    def summary(self, top: int = 10) -> str:
+        lines = [f"Profile of {self.script} ({self.started_at:%Y-%m-%d %H:%M:%S} UTC)", ""]
+        lines.append(f"{'stage':<22} {'wall s':>9} {'cpu s':>9} {'peak MB':>9} {'rss +MB':>9} {'rows':>12}")
+        for s in self.stages:
+            grown = (None if s["rss_start_mb"] is None or s["rss_end_mb"] is None
+                     else s["rss_end_mb"] - s["rss_start_mb"])
+            rows = self.stage_rows(s)
+            lines.append(
+                f"{s['stage']:<22} {s['wall_seconds']:>9.3f} {s['cpu_seconds']:>9.3f} "
+                f"{s['peak_rss_mb']:>9.1f} {'' if grown is None else f'{grown:+.1f}':>9} "
+                f"{'' if rows is None else f'{rows:,}':>12}")
+        cached = [name for name, status in self.statuses.items() if status == "cached"]
+        if cached:
+            lines.append(f"(cached, not run: {', '.join(cached)})")
+
+        lines += ["", f"Slowest SQL statements (of {len(self.queries)}):",
+                  f"{'stage':<22} {'wall s':>8} {'engine s':>9} {'fetch s':>8} {'rows':>10}  hot operator / statement"]
+        for q in sorted(self.queries, key=lambda q: q["wall_seconds"], reverse=True)[:top]:
+            hot = f"{q['hot_operator']} {q['hot_operator_seconds']:.3f}s" if q["hot_operator"] else "-"
+            engine = "" if q["latency_seconds"] is None else f"{q['latency_seconds']:.3f}"
+            rows = "" if q["rows_returned"] is None else f"{q['rows_returned']:,}"
+            lines.append(f"{str(q['stage']):<22} {q['wall_seconds']:>8.3f} {engine:>9} "
+                         f"{q['fetch_seconds']:>8.3f} {rows:>10}  {hot}")
+            lines.append(f"{'':<22} {q['sql'][:100]}")
+        lines += ["", f"Total: {time.perf_counter() - self._t0:.3f}s wall, "
+                      f"{time.process_time() - self._cpu0:.3f}s CPU, {peak_rss_mb():.1f} MB peak RSS"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> Path:
+        """Write the JSON trace to path and the summary table next to it (.txt)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        trace = {
+            "script": self.script,
+            "argv": sys.argv,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "duckdb": duckdb.__version__,
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "execution": execution.settings(),
+            },
+            "total": {
+                "wall_seconds": round(time.perf_counter() - self._t0, 4),
+                "cpu_seconds": round(time.process_time() - self._cpu0, 4),
+                "peak_rss_mb": round(peak_rss_mb(), 1),
+            },
+            "stage_status": self.statuses,
+            "stages": [{**s, "rows": self.stage_rows(s)} for s in self.stages],
+            "queries": self.queries,
+        }
+        path.write_text(json.dumps(trace, indent=2, default=str), encoding="utf-8")
+        summary = self.summary()
+        path.with_suffix(".txt").write_text(summary, encoding="utf-8")
+        print(summary)
+        print(f"[ok] wrote {path}")
+        return path
+
+def default_trace_path(reports_dir: Path, script: str) -> Path:
+    return Path(reports_dir) / "profiles" / f"{script}-{datetime.now():%Y%m%d-%H%M%S}.json"
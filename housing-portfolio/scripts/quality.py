@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Data quality audit of home_values_yearly_clean, and an optional cleaned source for Q1-Q4.
+
+One aggregate scan of the table groups it by (zip, year). That pass counts the copies of
+each key, the missing (NULL) and non-positive or non-finite values, and averages the valid
+ones. Its min and max of the state, city, county and metro columns also give the mapping
+check, since a zip maps to several cities exactly when its min city differs from its max.
+The per-key result is far smaller than the table. One window over it in year order then
+finds, for each zip:
+
+- duplicate_rows: rows beyond the first for the same (zip, year),
+- missing_years: years without a row between the zip's first and last year. Year-over-year
+  changes (Q4, scripts/ranking.py) are left out across such a gap,
+- missing_values / non_positive_values: rows whose yearlyindex is NULL, or <= 0 / not finite,
+- outliers: a value more than MAX_RATIO times above, or below 1/MAX_RATIO of, both the
+  previous and the next valid value of the zip (a one-year spike or dip),
+- multiple_states / _cities / _counties / _metros: a zip mapped to more than one of them.
+
+The zips with any issue go to the data_quality table and reports/data_quality.csv, and the
+totals per issue go to data_quality_summary and reports/data_quality.txt. The audit is
+versioned with the ingested data (like the summaries in aggregates.py), so it reruns only
+when the data changes.
+
+With --source clean (run_analysis.py, query_service.py), the questions read a cleaned,
+gap-filled copy instead. It keeps one row per (zip, year), averaging duplicates. It drops
+invalid values and outliers, and rows without a zip. Each zip takes its latest state, city,
+county and metro. Years missing inside a zip's range are filled by linear interpolation.
+The copy lives in the `quality` schema, next to its own geo_year_summary and
+state_year_summary, and is selected like the Parquet staging layer, through the search_path.
+
+Usage:
+    python scripts/quality.py          # rewrite the reports from the current snapshot
+"""
+import argparse
+from pathlib import Path
+import duckdb
+import execution
+import snapshots
+from aggregates import GEO_SUMMARY_TABLE, META_TABLE, SOURCE_TABLE, SUMMARY_TABLE, build_geo_year_summary, record_version
+
+REPO = Path(__file__).resolve().parents[1]
+DATA = REPO / "data"
+REPORTS = REPO / "reports"
+
+QUALITY_TABLE = "data_quality"
+QUALITY_SUMMARY_TABLE = "data_quality_summary"
+CLEAN_SCHEMA = "quality"
+CLEAN_TABLE = f"{CLEAN_SCHEMA}.{SOURCE_TABLE}"
+SERIES_TABLE = "quality_zip_year"
+ZIPS_TABLE = "quality_zips"
+MAX_RATIO = 2.0
+
+# Geo columns checked for one value per zip (report column suffix -> source column)
+MAPPINGS = {"states": "statename", "cities": "city", "counties": "countyname", "metros": "metro"}
+# Issue -> (rows affected, zip has the issue), over quality_zips
+ISSUES = {
+    "duplicate_rows": ("duplicate_rows", "duplicate_rows > 0"),
+    "missing_years": ("missing_years", "missing_years > 0"),
+    "missing_values": ("missing_values", "missing_values > 0"),
+    "non_positive_values": ("non_positive_values", "non_positive_values > 0"),
+    "outliers": ("outliers", "outliers > 0"),
+    **{f"multiple_{name}": (f"CASE WHEN multiple_{name} THEN rows ELSE 0 END", f"multiple_{name}")
+       for name in MAPPINGS},
+}
+
+def _series_sql() -> str:
+    bounds = ",\n            ".join(f"MIN({column}) AS {column}_min, MAX({column}) AS {column}_max"
+                                    for column in MAPPINGS.values())
+    return f"""
+        CREATE OR REPLACE TEMP TABLE {SERIES_TABLE} AS
+        WITH keyed AS (
+            SELECT
+                regionname,
+                year,
+                COUNT(*) AS copies,
+                COUNT(*) FILTER (WHERE yearlyindex IS NULL) AS missing_values,
+                COUNT(*) FILTER (WHERE yearlyindex <= 0 OR NOT isfinite(yearlyindex)) AS non_positive_values,
+                AVG(yearlyindex) FILTER (WHERE yearlyindex > 0 AND isfinite(yearlyindex)) AS value,
+                {bounds}
+            FROM {SOURCE_TABLE}
+            GROUP BY regionname, year
+        ),
+        neighbours AS (
+            SELECT
+                *,
+                year - LAG(year) OVER w - 1 AS gap_before,
+                value / LAG(value IGNORE NULLS) OVER w AS to_prev,
+                value / LEAD(value IGNORE NULLS) OVER w AS to_next
+            FROM keyed
+            WINDOW w AS (PARTITION BY regionname ORDER BY year)
+        )
+        SELECT
+            * EXCLUDE (to_prev, to_next),
+            COALESCE((to_prev > {MAX_RATIO} AND to_next > {MAX_RATIO})
+                     OR (to_prev < {1 / MAX_RATIO} AND to_next < {1 / MAX_RATIO}), false) AS outlier
+        FROM neighbours;
+    """
+
+def _zips_sql() -> str:
+    conflicts = ",\n            ".join(
+        f"COALESCE(MIN({column}_min) <> MAX({column}_max), false) AS multiple_{name}"
+        for name, column in MAPPINGS.items())
+    return f"""
+        CREATE OR REPLACE TEMP TABLE {ZIPS_TABLE} AS
+        SELECT
+            regionname,
+            arg_max(statename_max, year) AS statename,
+            MIN(year) AS first_year,
+            MAX(year) AS last_year,
+            SUM(copies)::BIGINT AS rows,
+            SUM(copies - 1)::BIGINT AS duplicate_rows,
+            COALESCE(SUM(gap_before), 0)::BIGINT AS missing_years,
+            SUM(missing_values)::BIGINT AS missing_values,
+            SUM(non_positive_values)::BIGINT AS non_positive_values,
+            COUNT(*) FILTER (WHERE outlier) AS outliers,
+            {conflicts}
+        FROM {SERIES_TABLE}
+        GROUP BY regionname;
+    """
+
+def audit(con: duckdb.DuckDBPyConnection):
+    """Scan the table once and (re)build data_quality and data_quality_summary."""
+    con.execute(_series_sql())
+    con.execute(_zips_sql())
+    any_issue = " OR ".join(flag for _, flag in ISSUES.values())
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {QUALITY_TABLE} AS
+        SELECT * FROM {ZIPS_TABLE} WHERE {any_issue};
+    """)
+    totals = "\n        UNION ALL ".join(
+        f"SELECT {i}, '{issue}', SUM({rows})::BIGINT, COUNT(*) FILTER (WHERE {flag}) FROM {ZIPS_TABLE}"
+        for i, (issue, (rows, flag)) in enumerate(ISSUES.items(), start=1))
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {QUALITY_SUMMARY_TABLE} (position INTEGER, issue VARCHAR, rows BIGINT, zips BIGINT);
+        INSERT INTO {QUALITY_SUMMARY_TABLE}
+        SELECT 0, 'audited', SUM(rows)::BIGINT, COUNT(*) FROM {ZIPS_TABLE}
+        UNION ALL {totals};
+    """)
+
+def build_clean(con: duckdb.DuckDBPyConnection):
+    """The cleaned, gap-filled table and its summaries in the quality schema (after audit)."""
+    latest = ", ".join(f"arg_max({column}_max, year) AS {column}" for column in MAPPINGS.values())
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {CLEAN_SCHEMA};")
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {CLEAN_TABLE} AS
+        WITH geos AS (
+            SELECT regionname, {latest}
+            FROM {SERIES_TABLE}
+            WHERE regionname IS NOT NULL
+            GROUP BY regionname
+        ),
+        spans AS (
+            SELECT
+                regionname, year, value,
+                LEAD(year) OVER w AS next_year,
+                LEAD(value) OVER w AS next_value
+            FROM {SERIES_TABLE}
+            WHERE regionname IS NOT NULL AND value IS NOT NULL AND NOT outlier
+            WINDOW w AS (PARTITION BY regionname ORDER BY year)
+        ),
+        filled AS (
+            -- Each kept year, followed by the missing years up to the next kept one
+            SELECT *, unnest(range(year, COALESCE(next_year, year + 1))) AS fill_year
+            FROM spans
+        )
+        SELECT
+            regionname, statename, city, countyname, metro,
+            fill_year::SMALLINT AS year,
+            CASE WHEN fill_year = year THEN value
+                 ELSE value + (next_value - value) * (fill_year - year) / (next_year - year) END AS yearlyindex
+        FROM filled JOIN geos USING (regionname)
+        ORDER BY statename, regionname, year;
+    """)
+    build_geo_year_summary(con, CLEAN_TABLE, table=f"{CLEAN_SCHEMA}.{GEO_SUMMARY_TABLE}")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {CLEAN_SCHEMA}.{SUMMARY_TABLE} AS
+        SELECT statename, year, sum_index, count_index, min_index, max_index
+        FROM {CLEAN_SCHEMA}.{GEO_SUMMARY_TABLE}
+        WHERE level = 'state';
+    """)
+
+def _current(con: duckdb.DuckDBPyConnection, table: str, base: str) -> bool:
+    schema, _, name = table.rpartition(".")
+    exists = con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?;",
+                         [schema or "main", name]).fetchone()[0] > 0
+    row = con.execute(f"SELECT sha256 FROM {META_TABLE} WHERE table_name = ?;", [table]).fetchone()
+    return exists and row is not None and row[0] == base
+
+def refresh(con: duckdb.DuckDBPyConnection, clean: bool = False) -> str:
+    """
+    Bring the audit (and, with clean, the cleaned source) up to date with the ingested data.
+    Returns "skip" when both already match its version, else "build".
+    """
+    row = con.execute(f"SELECT sha256 FROM {META_TABLE} WHERE table_name = ?;", [SOURCE_TABLE]).fetchone()
+    base = row[0] if row else None
+    if base and _current(con, QUALITY_TABLE, base) and (not clean or _current(con, CLEAN_TABLE, base)):
+        print(f"[skip] {QUALITY_TABLE} is up to date")
+        return "skip"
+    audit(con)
+    record_version(con, QUALITY_TABLE)
+    if clean:
+        build_clean(con)
+        record_version(con, CLEAN_TABLE)
+    con.execute(f"DROP TABLE {SERIES_TABLE}; DROP TABLE {ZIPS_TABLE};")
+    print(f"[ok] {QUALITY_TABLE}: build" + (f" (+ {CLEAN_TABLE})" if clean else ""))
+    return "build"
+
+def use_clean_source(con: duckdb.DuckDBPyConnection):
+    """Resolve unqualified table names against the cleaned copy and its summaries first."""
+    con.execute(f"SET search_path = '{CLEAN_SCHEMA},main';")
+
+def write_report(con: duckdb.DuckDBPyConnection, out_dir: Path = REPORTS) -> Path:
+    """Write data_quality.csv (the zips with issues) and data_quality.txt (totals per issue)."""
+    csv_path = out_dir / "data_quality.csv"
+    con.sql(f"SELECT * FROM main.{QUALITY_TABLE} ORDER BY statename, regionname").write_csv(str(csv_path))
+    rows = con.execute(f"SELECT issue, rows, zips FROM main.{QUALITY_SUMMARY_TABLE} ORDER BY position").fetchall()
+    (_, audited_rows, audited_zips), issues = rows[0], rows[1:]
+    lines = [f"Data quality: {audited_rows:,} rows, {audited_zips:,} zips audited", "",
+             f"{'issue':<22}{'rows':>14}{'zips':>10}"]
+    lines += [f"{issue:<22}{n_rows or 0:>14,}{n_zips:>10,}" for issue, n_rows, n_zips in issues]
+    lines += ["", f"Outliers: a value over {MAX_RATIO:g}x above or below both neighbouring years of its zip.",
+              f"Zips with any issue are listed in {csv_path.name}."]
+    txt_path = out_dir / "data_quality.txt"
+    txt_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print(f"[ok] wrote {csv_path} and {txt_path.name}")
+    return txt_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the data quality reports from the current snapshot.")
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by run_analysis.py).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+    con = snapshots.connect(DATA, args.db)
+    try:
+        if con.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?;", [QUALITY_TABLE]).fetchone()[0] == 0:
+            raise SystemExit("[error] no data quality audit found; run scripts/run_analysis.py first")
+        REPORTS.mkdir(parents=True, exist_ok=True)
+        print(Path(write_report(con)).read_text(encoding="utf-8"))
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
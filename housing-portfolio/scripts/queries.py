@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Named SQL queries, kept in one place: the `-- name: <query>` sections of sql/*.sql.
+
+Each section is one statement with `$name` parameters. It is prepared once per connection
+(DuckDB's PREPARE), so later calls only bind values and reuse the parsed, planned statement:
+
+    queries.execute(con, "q1_state_averages", states=["CA", "CO"]).df()
+    counts, yearly = queries.run_batch(con, [("record_count", {}), ("q1_state_averages", {"states": None})])
+
+run_batch prepares every query of the batch that the connection has not seen yet in one
+round trip. Prepared statements belong to a connection, and each cursor is a connection of
+its own. Values are passed to EXECUTE as SQL literals (see literal): binding Python
+parameters through the client would make DuckDB import pandas, which the data-only
+commands (cli.py q1-q4) never load.
+
+The text of a query is also part of the pipeline's cache key for the stages that run it.
+"""
+import math
+import re
+import threading
+import weakref
+from pathlib import Path
+import duckdb
+import numpy as np
+
+REPO = Path(__file__).resolve().parents[1]
+SQL_DIR = REPO / "sql"
+
+_NAME = re.compile(r"^--\s*name:\s*(\w+)\s*$", re.MULTILINE)
+
+def load(sql_dir: Path = SQL_DIR) -> dict:
+    """name -> statement for every `-- name:` section of sql_dir/*.sql (text before the first marker is skipped)."""
+    found = {}
+    for path in sorted(sql_dir.glob("*.sql")):
+        text = path.read_text(encoding="utf-8")
+        marks = list(_NAME.finditer(text))
+        for mark, following in zip(marks, marks[1:] + [None]):
+            name = mark.group(1)
+            if name in found:
+                raise ValueError(f"query {name!r} is defined twice (second time in {path.name})")
+            body = text[mark.end():following.start() if following else len(text)].strip()
+            found[name] = body.rstrip(";").rstrip()
+    return found
+
+QUERIES = load()
+
+def sql(name: str) -> str:
+    """The text of query name."""
+    try:
+        return QUERIES[name]
+    except KeyError:
+        raise KeyError(f"unknown query {name!r} (see sql/*.sql)") from None
+
+def literal(value) -> str:
+    """value (None, bool, number, string or a list of them) as a DuckDB SQL literal."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return repr(value) if math.isfinite(value) else f"'{value}'::DOUBLE"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return "[" + ", ".join(literal(v) for v in value) + "]"
+    raise TypeError(f"cannot pass {type(value).__name__} to a query")
+
+# connection -> names of the queries prepared on it
+_prepared = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def prepare(con: duckdb.DuckDBPyConnection, names) -> list:
+    """Prepare the queries in names that con has not prepared yet (one statement batch); returns them."""
+    with _lock:
+        done = _prepared.setdefault(con, set())
+        missing = [name for name in dict.fromkeys(names) if name not in done]
+    if missing:
+        con.execute(";\n".join(f"PREPARE {name} AS\n{sql(name)}" for name in missing))
+        with _lock:
+            done.update(missing)
+    return missing
+
+def execute(con: duckdb.DuckDBPyConnection, name: str, **params) -> duckdb.DuckDBPyConnection:
+    """Run query name with params bound to its $parameters; fetch the result from the returned connection."""
+    prepare(con, [name])
+    args = ", ".join(f"{key} := {literal(value)}" for key, value in params.items())
+    return con.execute(f"EXECUTE {name}({args})" if args else f"EXECUTE {name}")
+
+def run_batch(con: duckdb.DuckDBPyConnection, calls, fetch: str = "fetchnumpy") -> list:
+    """
+    Run [(name, params), ...] on con and return each result fetched with `fetch`
+    ("fetchnumpy", "df" or "fetchall"). Unprepared queries are prepared together first.
+    """
+    calls = list(calls)
+    prepare(con, [name for name, _ in calls])
+    return [getattr(execute(con, name, **params), fetch)() for name, params in calls]
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Local HTTP/JSON query service for the Q1-Q4 analyses.
+
+Keeps one warm read-only connection to the current snapshot of data/housing.duckdb (see
+snapshots.py; each request thread queries through its own cursor) and serves the analyses as parameterized GET endpoints:
+
+    /state-averages?states=CA,CO                      Q1 yearly average index (default: the Q1 states)
+    /state-growth?start_year=2000&end_year=2025&top_n=5          Q2
+    /city-growth?start_year=2000&end_year=2025&top_n=5           Q3A + Q3B
+    /volatility?top_n=5&min_years=10                             Q4
+    /growth?level=metro&start_year=2010&end_year=2025&top_n=5&by=pct_growth
+                                                      top-N growth at state/metro/county/city/zip
+    /ranking?level=city&metric=cagr&group_by=state&top_n=1&bottom_n=1
+                                                      top/bottom-N by any ranking.py metric
+    /health                                           data version, row count, cache stats
+    POST /refresh[?reingest=1]                        re-ingest the CSV now
+
+Responses are kept in an LRU cache keyed by endpoint, parameters and the data version (the
+SHA-256 of the ingested CSV), so a repeated request is answered from memory. The source CSV
+is re-checked at most every --refresh-interval seconds; when it changed it is re-ingested
+(appending only new rows where possible) and the cache is dropped.
+
+An ingest rebuilds tables in place, so requests never read data/housing.duckdb itself. The
+service opens it read-write only while ingesting. Requests read the snapshot that ingest
+publishes. After a refresh they switch to the new snapshot, and requests still running keep
+the old one until they finish.
+
+Usage:
+    python scripts/query_service.py --port 8765
+    curl 'http://127.0.0.1:8765/city-growth?start_year=2010&top_n=10'
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+import duckdb
+import execution
+import snapshots
+from drops import drops_changed, is_drop_source
+from growth import LEVELS, METRICS, top_growth
+from ranking import GROUPS, METRICS as RANK_METRICS, rank
+from run_analysis import (DATA, Database, city_growth, ingest, query_q1, query_q2, query_q4,
+                          read_ingest_metadata)
+
+def _int(name, low=None, high=None):
+    def parse(value):
+        try:
+            n = int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer, got {value!r}")
+        if (low is not None and n < low) or (high is not None and n > high):
+            raise ValueError(f"{name} must be between {low} and {high}, got {n}")
+        return n
+    return parse
+
+def _states(value):
+    states = sorted({s.strip().upper() for s in value.split(",") if s.strip()})
+    if not states:
+        raise ValueError("states must list at least one state code")
+    return states
+
+def _choice(name, choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"{name} must be one of {', '.join(choices)}, got {value!r}")
+        return value
+    return parse
+
+def _records(df):
+    return json.loads(df.to_json(orient="records"))
+
+def _city_growth(con, **params):
+    df3a, df3b = city_growth(con, **params)
+    return {"absolute": _records(df3a), "percentage": _records(df3b)}
+
+def _growth(con, level, start_year, end_year, top_n, by):
+    df = top_growth(con, level, [(start_year, end_year)], top_n, by)
+    return _records(df.drop(columns=["start_year", "end_year", "rank"], errors="ignore"))
+
+_YEAR = _int("year", 1900, 2100)
+_TOP_N = _int("top_n", 1, 1000)
+
+# endpoint -> (query, {param: (parser, default)})
+ENDPOINTS = {
+    "state-averages": (lambda con, **p: _records(query_q1(con, **p)),
+                       {"states": (_states, None)}),
+    "state-growth": (lambda con, **p: _records(query_q2(con, **p)),
+                     {"start_year": (_YEAR, 2000), "end_year": (_YEAR, 2025), "top_n": (_TOP_N, 5)}),
+    "city-growth": (_city_growth,
+                    {"start_year": (_YEAR, 2000), "end_year": (_YEAR, 2025), "top_n": (_TOP_N, 5)}),
+    "volatility": (lambda con, **p: _records(query_q4(con, **p)),
+                   {"top_n": (_TOP_N, 5), "min_years": (_int("min_years", 1, 100), 10)}),
+    "growth": (_growth,
+               {"level": (_choice("level", LEVELS), "state"), "start_year": (_YEAR, 2000),
+                "end_year": (_YEAR, 2025), "top_n": (_TOP_N, 5), "by": (_choice("by", METRICS), "pct_growth")}),
+    "ranking": (lambda con, **p: _records(rank(con, **p)),
+                {"level": (_choice("level", LEVELS), "state"), "metric": (_choice("metric", RANK_METRICS), "pct_growth"),
+                 "start_year": (_YEAR, None), "end_year": (_YEAR, None), "top_n": (_TOP_N, 5),
+                 "bottom_n": (_int("bottom_n", 0, 1000), 0), "group_by": (_choice("group_by", GROUPS), None),
+                 "min_years": (_int("min_years", 1, 100), None)}),
+}
+
+class LRUCache:
+    """Thread-safe least-recently-used map with hit/miss counters."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+class QueryService:
+    """The warm database handle, its data version and the response cache."""
+    def __init__(self, data: str, source: str = "table", cache_size: int = 256,
+                 refresh_interval: float = 5.0):
+        self.data = data
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.cache = LRUCache(cache_size)
+        self._refresh_lock = threading.Lock()
+        self._checked = 0.0
+        self.db = self._ingest()
+        # Requests still running on each Database; a replaced one is closed when its last ends
+        self._db_lock = threading.Lock()
+        self._in_use = {}
+
+    def _ingest(self, reingest: bool = False) -> Database:
+        """Ingest, release the writable database and open the snapshot the ingest published."""
+        ingest(self.data, reingest=reingest, source=self.source).con.close()
+        return Database(snapshots.connect(DATA), self.source)
+
+    def _acquire(self):
+        with self._db_lock:
+            db = self.db
+            self._in_use[db] = self._in_use.get(db, 0) + 1
+            return db
+
+    def _release(self, db):
+        with self._db_lock:
+            self._in_use[db] -= 1
+            if self._in_use[db]:
+                return
+            del self._in_use[db]
+            retired = db is not self.db
+        if retired:
+            db.con.close()
+
+    def _swap(self, db):
+        with self._db_lock:
+            old, self.db = self.db, db
+            idle = old is not db and old not in self._in_use
+        if idle:
+            old.con.close()
+
+    def _source_changed(self) -> bool:
+        meta = read_ingest_metadata(self.db.cursor())
+        if meta is None:
+            return True
+        if is_drop_source(meta["source_path"]):
+            return drops_changed(self.db.cursor(), meta["source_path"])
+        try:
+            st = Path(meta["source_path"]).stat()
+        except OSError:
+            return False        # source removed: keep serving the ingested data
+        return st.st_size != meta["size_bytes"] or st.st_mtime != meta["mtime"]
+
+    def refresh(self, force: bool = False, reingest: bool = False) -> bool:
+        """Re-ingest if the source CSV changed (or when forced); returns True if the data changed."""
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and now - self._checked < self.refresh_interval:
+                return False
+            self._checked = now
+            if not (force or self._source_changed()):
+                return False
+            old = self.db.version
+            # Requests move to the new snapshot before the cache drops the old version's entries
+            self._swap(self._ingest(reingest))
+            if self.db.version != old:
+                self.cache.clear()
+                print(f"[ok] data version {str(old)[:12]} -> {str(self.db.version)[:12]}; cache cleared")
+                return True
+            return False
+
+    def query(self, endpoint: str, raw_params: dict):
+        """(body bytes, cache hit) for endpoint with query-string params; raises KeyError/ValueError."""
+        func, spec = ENDPOINTS[endpoint]
+        unknown = set(raw_params) - set(spec)
+        if unknown:
+            raise ValueError(f"unknown parameter(s) {', '.join(sorted(unknown))}; "
+                             f"{endpoint} accepts {', '.join(spec) or 'none'}")
+        params = {name: parse(raw_params[name]) if name in raw_params else default
+                  for name, (parse, default) in spec.items()}
+        if self.refresh_interval > 0:
+            self.refresh()
+        db = self._acquire()
+        try:
+            key = (endpoint, json.dumps(params, sort_keys=True), db.version)
+            body = self.cache.get(key)
+            if body is not None:
+                return body, True
+            cur = db.cursor()
+            try:
+                data = func(cur, **params)
+            finally:
+                cur.close()
+            body = json.dumps({"endpoint": endpoint, "params": params, "version": db.version,
+                               "data": data}).encode("utf-8")
+            self.cache.put(key, body)
+            return body, False
+        finally:
+            self._release(db)
+
+    def health(self) -> dict:
+        return {"status": "ok", "version": self.db.version, "rows": self.db.rows,
+                "source": self.source, "endpoints": sorted(ENDPOINTS), "cache": self.cache.stats()}
+
+def make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "HousingQueryService/1.0"
+
+        def _send(self, status: int, body: bytes, cache: str = None, t0: float = None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if cache:
+                self.send_header("X-Cache", cache)
+            if t0 is not None:
+                self.send_header("X-Elapsed-Ms", f"{(time.perf_counter() - t0) * 1000:.2f}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, payload: dict):
+            self._send(status, json.dumps(payload).encode("utf-8"))
+
+        def do_GET(self):
+            t0 = time.perf_counter()
+            url = urlsplit(self.path)
+            endpoint = url.path.strip("/")
+            # Repeated keys: the last value wins (states are given as one comma-separated list)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if endpoint in ("", "health"):
+                return self._json(200, service.health())
+            if endpoint not in ENDPOINTS:
+                return self._json(404, {"error": f"unknown endpoint /{endpoint}",
+                                        "endpoints": sorted(ENDPOINTS)})
+            try:
+                body, hit = service.query(endpoint, params)
+            except ValueError as e:
+                return self._json(400, {"error": str(e)})
+            except duckdb.Error as e:
+                return self._json(500, {"error": str(e)})
+            self._send(200, body, cache="HIT" if hit else "MISS", t0=t0)
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            if url.path.strip("/") != "refresh":
+                return self._json(404, {"error": f"unknown endpoint {url.path}"})
+            reingest = parse_qs(url.query).get("reingest", ["0"])[-1] in ("1", "true", "yes")
+            try:
+                changed = service.refresh(force=True, reingest=reingest)
+            except duckdb.Error as e:
+                return self._json(500, {"error": str(e)})
+            self._json(200, {"changed": changed, **service.health()})
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, default="data/home_values_yearly_clean.csv",
+                        help="Path to the full CSV. Falls back to data/sample_home_values_yearly_clean.csv if missing.")
+    parser.add_argument("--source", choices=["table", "parquet", "clean"], default="table",
+                        help="Serve queries from the DuckDB table, the Parquet staging layer or the cleaned copy.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=256, help="Responses kept in the LRU cache.")
+    parser.add_argument("--refresh-interval", type=float, default=5.0,
+                        help="Seconds between checks of the source CSV for changes (0: only on POST /refresh).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+    service = QueryService(args.data, source=args.source, cache_size=args.cache_size,
+                           refresh_interval=args.refresh_interval)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"[ok] serving data version {str(service.db.version)[:12]} on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Top and bottom N geos by one metric, at any level, over any horizon.
+
+rank() is the one ranking behind Q2, Q3A, Q3B and Q4. A level's dense geo x year matrix
+(growth.matrix_chunks) turns every metric into a few vectorized column operations:
+
+- level: the average index in end_year,
+- absolute_growth / pct_growth / cagr: from start_year to end_year,
+- volatility: standard deviation of the YoY % changes between start_year and end_year,
+  computed like Q4 (changes against the previous year, rounded to 2 decimals; none across a
+  year the geo is missing).
+
+min_years drops geos observed in fewer years of the horizon (fewer YoY changes, for
+volatility), like Q4's HAVING COUNT(*) >= 10. The top and bottom N are then taken per group
+(group_by="state": every state's own ranking) by partial selection (growth.top_indices), so
+no ranking sorts more than the values tied at its cut. The matrix rows arrive sorted by
+state, so groups are contiguous row ranges and need no sort either. rank_columns returns the
+ranking as plain NumPy columns; pandas is only imported to wrap them in a DataFrame.
+
+Usage:
+    python scripts/ranking.py --level city --metric cagr --horizon 2010-2025 --group-by state --top-n 1 --bottom-n 1
+"""
+import argparse
+import warnings
+from pathlib import Path
+from typing import TYPE_CHECKING
+import duckdb
+import numpy as np
+import execution
+import snapshots
+from aggregates import GEO_SUMMARY_TABLE, SOURCE_TABLE
+from growth import (GEO_COLUMN, LEVELS, GeoYearMatrix, matrix_chunks, merge_top, parse_horizon,
+                    round_half_away, top_indices)
+if TYPE_CHECKING:
+    import pandas as pd
+
+REPO = Path(__file__).resolve().parents[1]
+REPORTS = REPO / "reports"
+
+METRICS = ("level", "absolute_growth", "pct_growth", "cagr", "volatility")
+GROUPS = ("state",)
+# Growth metrics rank the 2-decimal averages like the SQL questions; volatility uses the
+# exact averages, like Q4
+DECIMALS = {"volatility": None}
+VOLATILITY_COLUMNS = ("years_tracked", "avg_annual_change_pct", "volatility_pct", "range_pct",
+                      "worst_year_pct", "best_year_pct")
+
+def metric_column(metric: str, end_year: int) -> str:
+    """The output column a metric is ranked by."""
+    return {"level": f"value_{end_year}", "cagr": "cagr_pct",
+            "volatility": "volatility_pct"}.get(metric, metric)
+
+def data_years(con: duckdb.DuckDBPyConnection, level: str):
+    """(first, last) year with data at level, the default horizon."""
+    if level == "zip":
+        sql = f"SELECT MIN(year), MAX(year) FROM {SOURCE_TABLE} WHERE yearlyindex IS NOT NULL"
+    else:
+        sql = f"SELECT MIN(year), MAX(year) FROM {GEO_SUMMARY_TABLE} WHERE level = 'state'"
+    first, last = con.execute(sql).fetchone()
+    return (int(first), int(last)) if first is not None else (0, 0)
+
+def _horizon(matrix: GeoYearMatrix, start_year: int = None, end_year: int = None):
+    """The horizon, defaulting to the matrix's first and last year."""
+    if start_year is None:
+        start_year = int(matrix.years[0]) if len(matrix.years) else 0
+    if end_year is None:
+        end_year = int(matrix.years[-1]) if len(matrix.years) else 0
+    return start_year, end_year
+
+def _block(matrix: GeoYearMatrix, start_year: int, end_year: int) -> np.ndarray:
+    """The matrix columns from start_year to end_year (inclusive)."""
+    first = int(matrix.years[0]) if len(matrix.years) else 0
+    lo, hi = max(start_year - first, 0), max(end_year - first + 1, 0)
+    return matrix.values[:, lo:hi]
+
+def _growth_columns(matrix: GeoYearMatrix, start_year: int, end_year: int) -> dict:
+    start, end = matrix.column(start_year), matrix.column(end_year)
+    span = end_year - start_year
+    with np.errstate(divide="ignore", invalid="ignore"):
+        absolute = end - start
+        pct = round_half_away(absolute / start * 100)
+        cagr = round_half_away(((end / start) ** (1 / span) - 1) * 100) if span > 0 else np.full(len(matrix), np.nan)
+    years = (~np.isnan(_block(matrix, start_year, end_year))).sum(axis=1)
+    return {f"value_{start_year}": start, f"value_{end_year}": end, "absolute_growth": absolute,
+            "pct_growth": pct, "cagr_pct": cagr, "years_with_data": years}
+
+def yoy_changes(block: np.ndarray) -> tuple:
+    """
+    Q4's YoY % changes of each row of a row x year block (consecutive years), rounded to 2
+    decimals: (changes, has_change), NaN / False where a year has no change. A change needs
+    both the year and the one before it, so a missing year leaves both adjacent changes out.
+    """
+    yoy = np.full(block.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        yoy[:, 1:] = round_half_away((block[:, 1:] - block[:, :-1]) / block[:, :-1] * 100)
+    return yoy, ~np.isnan(yoy)
+
+def _volatility_columns(matrix: GeoYearMatrix, start_year: int, end_year: int) -> dict:
+    yoy, has_change = yoy_changes(_block(matrix, start_year, end_year))
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # Geos without changes in the horizon get NaN statistics (filtered out as invalid)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        worst, best = np.nanmin(yoy, axis=1), np.nanmax(yoy, axis=1)
+        count = has_change.sum(axis=1)
+        # Summed in year order like DuckDB's AVG, so means on a .005 boundary round the same way
+        total = np.nancumsum(yoy, axis=1)[:, -1] if yoy.shape[1] else np.zeros(len(yoy))
+        return {
+            "years_tracked": count,
+            "avg_annual_change_pct": round_half_away(total / count),
+            "volatility_pct": round_half_away(np.nanstd(yoy, axis=1, ddof=1)),
+            "range_pct": round_half_away(best - worst),
+            "worst_year_pct": worst,
+            "best_year_pct": best,
+        }
+
+def _groups(matrix: GeoYearMatrix, group_by: str = None):
+    """Contiguous row ranges (start, stop) of each group; rows are sorted by state already."""
+    if group_by is None or len(matrix) == 0:
+        return [(0, len(matrix))]
+    starts = np.flatnonzero(np.r_[True, matrix.states[1:] != matrix.states[:-1]])
+    return list(zip(starts, np.r_[starts[1:], len(matrix)]))
+
+def rank_columns(matrix: GeoYearMatrix, metric: str, start_year: int = None, end_year: int = None,
+                 top_n: int = 5, bottom_n: int = 0, group_by: str = None,
+                 min_years: int = None) -> dict:
+    """
+    Top top_n and bottom bottom_n geos of matrix by metric, per group, as one long table of
+    NumPy columns (side "top"/"bottom", rank, geo, state, metric columns). Ties are broken
+    by geo name, then state, like the SQL rankings.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    if group_by is not None and group_by not in GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+    if group_by == "state" and matrix.level in ("state", "metro"):
+        raise ValueError(f"{matrix.level} rankings cannot be grouped by state")
+    start_year, end_year = _horizon(matrix, start_year, end_year)
+    if metric == "volatility":
+        columns = _volatility_columns(matrix, start_year, end_year)
+        coverage = columns["years_tracked"]
+    else:
+        columns = _growth_columns(matrix, start_year, end_year)
+        coverage = columns["years_with_data"]
+    by = metric_column(metric, end_year)
+    values = columns[by]
+    valid = np.isfinite(values)
+    if metric in ("absolute_growth", "pct_growth", "cagr"):
+        valid &= np.isfinite(columns["absolute_growth"]) & np.isfinite(columns["pct_growth"])
+    if min_years is not None:
+        valid &= coverage >= min_years
+
+    picks = []
+    for lo, hi in _groups(matrix, group_by):
+        geos, states = matrix.geos[lo:hi], matrix.states[lo:hi]
+        for side, n, sign in (("top", top_n, 1), ("bottom", bottom_n, -1)):
+            if n > 0:
+                rows = lo + top_indices(sign * values[lo:hi], valid[lo:hi], n, geos, states)
+                picks.append((side, rows))
+
+    rows = np.concatenate([r for _, r in picks]) if picks else np.array([], dtype=np.int64)
+    frame = {
+        "side": np.concatenate([[side] * len(r) for side, r in picks]) if picks else np.array([], dtype=object),
+        "rank": np.concatenate([np.arange(1, len(r) + 1) for _, r in picks]) if picks else np.array([], dtype=np.int64),
+        GEO_COLUMN[matrix.level]: matrix.geos[rows],
+    }
+    if matrix.level not in ("state", "metro"):
+        frame["statename"] = matrix.states[rows]
+    frame.update({name: np.asarray(col)[rows] for name, col in columns.items()})
+    return frame
+
+def rank_matrix(matrix: GeoYearMatrix, metric: str, start_year: int = None, end_year: int = None,
+                top_n: int = 5, bottom_n: int = 0, group_by: str = None,
+                min_years: int = None) -> "pd.DataFrame":
+    """rank_columns as a DataFrame."""
+    import pandas as pd
+    return pd.DataFrame(rank_columns(matrix, metric, start_year, end_year, top_n, bottom_n, group_by, min_years))
+
+def rank(con: duckdb.DuckDBPyConnection, level: str, metric: str, start_year: int = None,
+         end_year: int = None, top_n: int = 5, bottom_n: int = 0, group_by: str = None,
+         min_years: int = None) -> "pd.DataFrame":
+    """rank_matrix over level's matrix, chunked by state when it exceeds the memory budget."""
+    import pandas as pd
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    if start_year is None or end_year is None:
+        first, last = data_years(con, level)
+        start_year = first if start_year is None else start_year
+        end_year = last if end_year is None else end_year
+    frames = [rank_matrix(m, metric, start_year, end_year, top_n, bottom_n, group_by, min_years)
+              for m in matrix_chunks(con, level, DECIMALS.get(metric, 2))]
+    if len(frames) == 1:
+        return frames[0]
+    # Per-state chunks: combine each side's partial rankings
+    df = pd.concat(frames, ignore_index=True)
+    groups = ["side", "statename"] if group_by == "state" else ["side"]
+    tiebreak = [GEO_COLUMN[level], "statename"]
+    sides = [merge_top([df[df["side"] == side]], groups, metric_column(metric, end_year), n, tiebreak,
+                       ascending=side == "bottom")
+             for side, n in (("top", top_n), ("bottom", bottom_n)) if n > 0 and (df["side"] == side).any()]
+    return pd.concat(sides, ignore_index=True)[df.columns] if sides else df.iloc[:0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by run_analysis.py).")
+    parser.add_argument("--level", choices=LEVELS, default="state")
+    parser.add_argument("--metric", choices=METRICS, default="pct_growth")
+    parser.add_argument("--horizon", type=parse_horizon, default=None, metavar="START-END",
+                        help="Years to rank over, e.g. 2010-2025 (default: all years).")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--bottom-n", type=int, default=0)
+    parser.add_argument("--group-by", choices=GROUPS, default=None,
+                        help="Rank within each state (county, city and zip levels).")
+    parser.add_argument("--min-years", type=int, default=None,
+                        help="Skip geos with fewer years of data in the horizon (YoY changes, for volatility).")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Output CSV (default: reports/ranking_<level>_<metric>.csv).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    execution.configure_from_args(args)
+
+    start_year, end_year = args.horizon or (None, None)
+    con = snapshots.connect(REPO / "data", args.db)
+    df = rank(con, args.level, args.metric, start_year, end_year, args.top_n, args.bottom_n,
+              args.group_by, args.min_years)
+    con.close()
+    out = Path(args.out) if args.out else REPORTS / f"ranking_{args.level}_{args.metric}.csv"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    print(f"[ok] {args.level} ranking by {args.metric} ({len(df)} rows)")
+    print(f"[ok] wrote {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Report tables as Arrow: formatting and CSV / Parquet / Arrow IPC output.
+
+The pipeline's query stages hand Arrow tables to the exports and figures. Numeric NumPy
+columns become Arrow arrays without a copy, and DuckDB results are fetched as Arrow
+directly. The display columns of the CSVs ($1,234 / 12.34%) are a DuckDB projection over
+the table: format() runs over whole columns, on a scan that reads the Arrow buffers in
+place, so no cell is formatted in a Python loop.
+
+Every report is written three ways: the CSV, and the typed table behind it as Parquet and
+as an uncompressed Arrow IPC file, which downstream tools can memory-map instead of parsing
+formatted strings:
+
+    import pyarrow as pa
+    table = pa.ipc.open_file(pa.memory_map("reports/Q2_Top5_Home_Values_Growth.arrow")).read_all()
+"""
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import execution
+
+REPORT_SUFFIXES = (".csv", ".parquet", ".arrow")
+
+def arrow_table(columns) -> pa.Table:
+    """columns (name -> NumPy array or list, or an Arrow table) as an Arrow table; NaN becomes null."""
+    if isinstance(columns, pa.Table):
+        return columns
+    arrays = {}
+    for name, values in columns.items():
+        if isinstance(values, np.ma.MaskedArray):
+            arrays[name] = pa.array(values.data, mask=np.ma.getmaskarray(values), from_pandas=True)
+        else:
+            arrays[name] = pa.array(values, from_pandas=True)
+    return pa.table(arrays)
+
+def fetch(result) -> pa.Table:
+    """A DuckDB result (a relation, or a connection after execute()) as one Arrow table."""
+    # to_arrow_table() replaced fetch_arrow_table() in DuckDB 1.4
+    to_table = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+    return to_table()
+
+def project(table: pa.Table, select: str) -> pa.Table:
+    """The DuckDB projection `select` (an expression list) over table, as a new Arrow table."""
+    con = execution.connect()
+    try:
+        return fetch(con.from_arrow(table).project(select))
+    finally:
+        con.close()
+
+def write_csv(table: pa.Table, out: Path) -> Path:
+    """Write table to out as CSV (header, quoting only where needed, empty cells for nulls)."""
+    con = execution.connect()
+    try:
+        con.from_arrow(table).write_csv(str(out))
+    finally:
+        con.close()
+    return out
+
+def write_parquet(table: pa.Table, out: Path) -> Path:
+    pq.write_table(table, out)
+    return out
+
+def write_ipc(table: pa.Table, out: Path) -> Path:
+    """Write table as an Arrow IPC file, uncompressed so readers can memory-map it."""
+    feather.write_feather(table, out, compression="uncompressed")
+    return out
+
+def write_typed(table: pa.Table, stem: Path) -> tuple:
+    """Write table as <stem>.parquet and <stem>.arrow; returns both paths."""
+    return (write_parquet(table, stem.parent / f"{stem.name}.parquet"),
+            write_ipc(table, stem.parent / f"{stem.name}.arrow"))
+
+def write_report(stem: Path, table: pa.Table, typed: pa.Table = None) -> Path:
+    """
+    Write table as <stem>.csv and typed (default: table itself) as its Parquet and Arrow IPC
+    copies; returns the CSV path.
+    """
+    out = write_csv(table, stem.parent / f"{stem.name}.csv")
+    write_typed(table if typed is None else typed, stem)
+    print(f"[ok] wrote {out} (+ .parquet, .arrow)")
+    return out
@@ -1,534 +1,533 @@
 #!/usr/bin/env python3
 """
 Runs the portfolio pipeline:
-- Imports the CSV into a DuckDB DB (data/housing.duckdb).
+- Imports the CSV into a DuckDB DB (data/housing.duckdb), skipping the import when the
+  source fingerprint is unchanged and appending only new rows when the file has grown.
 - Executes canonical SQL analyses.
-- Saves tidy CSVs and simple charts to reports/.
+- Saves tidy CSVs (each with typed Parquet and Arrow IPC copies, see report_tables.py) and
+  simple charts to reports/.
+
+Each step is a named stage of a dependency graph (see build_pipeline); stages whose data
+version, SQL, code and parameters are unchanged since the last run are skipped, and
+--only/--force select what to rebuild.
+
+pandas, matplotlib (charts.py) and the preview are imported by the functions that use them,
+so ingesting or running a data-only query (see cli.py) never loads them.
 """
 import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from functools import partial
+from operator import itemgetter
 from pathlib import Path
+from typing import TYPE_CHECKING
 import duckdb
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import execution
+import profiling
+import quality
+import queries
+from aggregates import refresh_geo_year_summary
+from drops import (apply_drop, is_drop_source, list_drop_files, read_ingested_files,
+                   refresh_file_stats, reset_drops)
+from growth import MATRIX_SQL, load_matrix
+from pipeline import Pipeline, Stage, select as select_stages
+from pivot import PIVOT_SQL, STATE_METRICS, presentation, state_year_pivot, top_states
+from ranking import DECIMALS, VOLATILITY_COLUMNS, rank_columns
+from snapshots import publish
+from staging import SCHEMA, csv_columns_sql, stage_parquet, use_parquet_source
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
 
 REPO = Path(__file__).resolve().parents[1]
 DATA = REPO / "data"
 REPORTS = REPO / "reports"
 FIGS = REPORTS / "figures"
+CACHE = DATA / "pipeline_cache"
+
+TABLE = "home_values_yearly_clean"
+META_TABLE = "ingest_metadata"
+DELTA_TABLE = "ingest_delta"
+HASH_CHUNK = 1 << 20
 
 def ensure_dirs():
     REPORTS.mkdir(parents=True, exist_ok=True)
     FIGS.mkdir(parents=True, exist_ok=True)
 
-def load_into_duckdb(csv_path: Path) -> duckdb.DuckDBPyConnection:
+def file_fingerprint(path: Path, prefix_len: int = 0) -> dict:
+    """Size, mtime and SHA-256 of a file, plus the hash of its first prefix_len bytes."""
+    st = path.stat()
+    digest = hashlib.sha256()
+    prefix_digest = None
+    read = 0
+    with open(path, "rb") as f:
+        while True:
+            # Stop exactly on the prefix boundary so its hash can be snapshotted
+            want = HASH_CHUNK
+            if prefix_digest is None and 0 < prefix_len - read < HASH_CHUNK:
+                want = prefix_len - read
+            chunk = f.read(want)
+            if not chunk:
+                break
+            digest.update(chunk)
+            read += len(chunk)
+            if read == prefix_len:
+                prefix_digest = digest.copy().hexdigest()
+    return {
+        "size_bytes": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": digest.hexdigest(),
+        "prefix_sha256": prefix_digest,
+    }
+
+def read_csv_header(path: Path) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+def ensure_metadata_table(con: duckdb.DuckDBPyConnection):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {META_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            source_path VARCHAR,
+            size_bytes BIGINT,
+            mtime DOUBLE,
+            sha256 VARCHAR,
+            schema_json VARCHAR,
+            row_count BIGINT,
+            ingested_at TIMESTAMP,
+            parent_sha256 VARCHAR
+        );
+    """)
+    # Databases created before incremental merges were tracked lack the parent column
+    con.execute(f"ALTER TABLE {META_TABLE} ADD COLUMN IF NOT EXISTS parent_sha256 VARCHAR;")
+
+def read_ingest_metadata(con: duckdb.DuckDBPyConnection, table: str = TABLE):
+    """Return the stored fingerprint for table, or None if it was never ingested."""
+    ensure_metadata_table(con)
+    row = con.execute(f"""
+        SELECT source_path, size_bytes, mtime, sha256, schema_json, row_count
+        FROM {META_TABLE} WHERE table_name = ?;
+    """, [table]).fetchone()
+    if row is None:
+        return None
+    keys = ["source_path", "size_bytes", "mtime", "sha256", "schema_json", "row_count"]
+    meta = dict(zip(keys, row))
+    meta["schema"] = json.loads(meta.pop("schema_json"))
+    return meta
+
+def write_ingest_metadata(con: duckdb.DuckDBPyConnection, csv_path: Path, fp: dict,
+                          table: str = TABLE, parent_sha256: str = None):
+    """Record fp for table; parent_sha256 is the version an append was applied on top of."""
+    schema = [[name, dtype] for name, dtype, *_ in con.execute(f"DESCRIBE {table};").fetchall()]
+    row_count = con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    con.execute(f"""
+        INSERT OR REPLACE INTO {META_TABLE}
+            (table_name, source_path, size_bytes, mtime, sha256, schema_json, row_count,
+             ingested_at, parent_sha256)
+        VALUES (?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP, ?);
+    """, [table, str(csv_path), fp["size_bytes"], fp["mtime"], fp["sha256"],
+          json.dumps(schema), row_count, parent_sha256])
+
+def append_csv_tail(con: duckdb.DuckDBPyConnection, csv_path: Path, offset: int, schema: list, table: str = TABLE) -> int:
+    """
+    Insert the rows found after byte offset, reusing the header and the stored column types.
+    The new rows are kept in the temp table ingest_delta so summaries can be merged incrementally.
+    """
+    with open(csv_path, "rb") as src:
+        header = src.readline()
+        src.seek(offset)
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as tmp:
+            tmp.write(header)
+            shutil.copyfileobj(src, tmp)
+    columns = csv_columns_sql(dict(schema))
+    try:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {DELTA_TABLE} AS
+            SELECT * FROM read_csv('{Path(tmp.name).as_posix()}', header=true, columns={columns});
+        """)
+        con.execute(f"INSERT INTO {table} SELECT * FROM {DELTA_TABLE};")
+        return con.execute(f"SELECT COUNT(*) FROM {DELTA_TABLE};").fetchone()[0]
+    finally:
+        os.unlink(tmp.name)
+
+def drops_fingerprint(files: list) -> dict:
+    """One version for a set of drops: their total size, newest mtime and a hash of (path, SHA-256) in order."""
+    digest = hashlib.sha256()
+    for f in files:
+        digest.update(f"{f['path']}\t{f['sha256']}\n".encode("utf-8"))
+    return {
+        "size_bytes": sum(f["size_bytes"] for f in files),
+        "mtime": max((f["mtime"] for f in files), default=0.0),
+        "sha256": digest.hexdigest(),
+    }
+
+def load_drops(con: duckdb.DuckDBPyConnection, source: Path, reingest: bool = False):
+    """
+    Bring home_values_yearly_clean up to date with a directory or glob of drops (see drops.py).
+
+    Drops added after the ones already applied (in file-name order) are upserted on top of the
+    table; a changed, removed or out-of-order file rebuilds it from all drops. When the new
+    drops replaced no rows, they are kept in ingest_delta so the summaries merge incrementally.
+    """
+    applied = [] if reingest else read_ingested_files(con)
+    known = {f["path"]: f for f in applied}
+    files = []
+    for path in list_drop_files(source):
+        st, prev = path.stat(), known.get(str(path))
+        if prev and prev["size_bytes"] == st.st_size and prev["mtime"] == st.st_mtime:
+            files.append(prev)
+        else:
+            fp = file_fingerprint(path)
+            files.append({"path": str(path), "size_bytes": fp["size_bytes"], "mtime": fp["mtime"],
+                          "sha256": fp["sha256"]})
+    fp = drops_fingerprint(files)
+
+    meta = None if reingest else read_ingest_metadata(con)
+    table_exists = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?;", [TABLE]
+    ).fetchone()[0] > 0
+    # The table holds exactly the applied drops (however --data spelled them) unless a
+    # single-file import has replaced it since
+    current = (meta is not None and table_exists and bool(applied)
+               and meta["sha256"] == drops_fingerprint(applied)["sha256"])
+    if current and fp["sha256"] == meta["sha256"]:
+        if [f["mtime"] for f in files] != [f["mtime"] for f in applied]:
+            # Touched but unchanged: refresh the stored mtimes and keep the table
+            refresh_file_stats(con, files)
+            write_ingest_metadata(con, source, fp)
+        print(f"[skip] {TABLE} is up to date with {len(files)} drop(s) in {source}")
+        return
+    done = [(f["path"], f["sha256"]) for f in applied]
+    incremental = current and [(f["path"], f["sha256"]) for f in files[:len(done)]] == done
+    if incremental:
+        pending = files[len(done):]
+    else:
+        reset_drops(con, TABLE)
+        pending = files
+
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {DELTA_TABLE} AS SELECT * FROM {TABLE} LIMIT 0;")
+    replaced = 0
+    for seq, f in enumerate(pending, start=len(files) - len(pending)):
+        counts = apply_drop(con, Path(f["path"]), f, seq, TABLE, delta=DELTA_TABLE)
+        replaced += counts["replaced"]
+        print(f"[ok] {Path(f['path']).name}: {counts['upserted']:,} rows upserted "
+              f"({counts['replaced']:,} replaced), {counts['rejected']:,} rejected")
+    # Summaries can only fold in rows that were added, not ones that replaced earlier values
+    parent = meta["sha256"] if incremental and replaced == 0 else None
+    write_ingest_metadata(con, source, fp, parent_sha256=parent)
+    print(f"[ok] applied {len(pending)} of {len(files)} drop(s) from {source}")
+
+def load_into_duckdb(csv_path: Path, reingest: bool = False) -> duckdb.DuckDBPyConnection:
+    """
+    Open data/housing.duckdb and bring home_values_yearly_clean up to date with csv_path
+    (or, when it names a directory or glob, with the drops in it; see load_drops).
+
+    The import is skipped when the stored fingerprint still matches the source, and only
+    the new trailing rows are appended when the file has grown by appending to it. Any
+    other change (edited rows, different header) falls back to a full re-import.
+    """
     db_path = DATA / "housing.duckdb"
-    con = duckdb.connect(str(db_path))
+    con = profiling.connect(str(db_path))
+    if is_drop_source(csv_path):
+        if list_drop_files(csv_path):
+            ensure_metadata_table(con)
+            load_drops(con, csv_path, reingest=reingest)
+            return con
+        print(f"[warn] no CSV or Parquet drops match {csv_path}")
     # Create table and import CSV (use sample if full file missing)
     if not csv_path.exists():
         print(f"[warn] {csv_path} not found; falling back to sample.")
         csv_path = DATA / "sample_home_values_yearly_clean.csv"
-    con.execute("DROP TABLE IF EXISTS home_values_yearly_clean;")
+
+    if read_csv_header(csv_path) != list(SCHEMA):
+        print(f"[warn] {csv_path} does not have the expected columns (Git LFS pointer?); falling back to sample.")
+        csv_path = DATA / "sample_home_values_yearly_clean.csv"
+
+    meta = None if reingest else read_ingest_metadata(con)
+    table_exists = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?;", [TABLE]
+    ).fetchone()[0] > 0
+    if meta is not None and table_exists and meta["source_path"] == str(csv_path):
+        st = csv_path.stat()
+        # Tables imported with other column types are rebuilt with the explicit schema
+        same_schema = meta["schema"] == [list(item) for item in SCHEMA.items()]
+        if same_schema and st.st_size == meta["size_bytes"] and st.st_mtime == meta["mtime"]:
+            print(f"[skip] {TABLE} is up to date with {csv_path}")
+            return con
+        fp = file_fingerprint(csv_path, prefix_len=meta["size_bytes"])
+        if same_schema and fp["sha256"] == meta["sha256"]:
+            # Touched but unchanged: refresh the stored mtime and keep the table
+            write_ingest_metadata(con, csv_path, fp)
+            print(f"[skip] {csv_path} content unchanged")
+            return con
+        if same_schema and fp["size_bytes"] > meta["size_bytes"] and fp["prefix_sha256"] == meta["sha256"]:
+            added = append_csv_tail(con, csv_path, meta["size_bytes"], meta["schema"])
+            write_ingest_metadata(con, csv_path, fp, parent_sha256=meta["sha256"])
+            print(f"[ok] appended {added:,} new rows from {csv_path}")
+            return con
+
+    con.execute(f"DROP TABLE IF EXISTS {TABLE};")
     con.execute(f"""
-        CREATE TABLE home_values_yearly_clean AS
-        SELECT * FROM read_csv_auto('{csv_path.as_posix()}', header=true);
+        CREATE TABLE {TABLE} AS
+        SELECT * FROM read_csv('{csv_path.as_posix()}', header=true, columns={csv_columns_sql()});
     """)
+    ensure_metadata_table(con)
+    write_ingest_metadata(con, csv_path, file_fingerprint(csv_path))
+    print(f"[ok] imported {csv_path} into {db_path}")
     return con
 
-def df_to_csv(df: pd.DataFrame, name: str):
-    out = REPORTS / f"{name}.csv"
-    df.to_csv(out, index=False)
-    print(f"[ok] wrote {out}")
+# Q1 reports the top states by the mean of their yearly averages (like the Excel workbook's
+# Top_10_States sheet), in state-name order like the Excel pivot
+Q1_TOP_N = 10
+Q1_METRIC = "mean_index"
 
-def bar_chart(df: pd.DataFrame, x: str, y: str, title: str, filename: str, top_n: int = 10):
-    if top_n and len(df) > top_n:
-        df = df.sort_values(y, ascending=False).head(top_n)
-    
-    # Sort with highest values on the left (ascending=False)
-    df = df.sort_values(y, ascending=False)
-    
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(df[x], df[y], color="#2E7D32", alpha=0.8, edgecolor='white', linewidth=1)
-    plt.title(title, fontsize=16, fontweight="bold", pad=20)
-    plt.xlabel("State", fontsize=12, fontweight="bold")
-    plt.ylabel("Growth Percentage (%)", fontsize=12, fontweight="bold")
-    plt.xticks(rotation=45, ha="right", fontsize=10)
-    plt.yticks(fontsize=10)
-    
-    # Add value labels on top of bars
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                f'{height:.1f}%', ha='center', va='bottom', fontsize=10, fontweight="bold")
-    
-    # Add subtle grid
-    plt.grid(axis='y', alpha=0.3, linestyle='--')
-    plt.tight_layout()
-    out = FIGS / f"{filename}.png"
-    plt.savefig(out, dpi=200, bbox_inches="tight")
-    plt.close()
-    print(f"[ok] wrote {out}")
-
-def run_queries(con: duckdb.DuckDBPyConnection):
-    # Q1: Calculate the yearly average home value index for each state
-    q1 = """
-    SELECT
-        statename,
-        year,
-        ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
-    FROM home_values_yearly_clean
-    WHERE yearlyindex IS NOT NULL
-    GROUP BY statename, year
-    ORDER BY statename, year;
+class Database:
+    """Shared handle on housing.duckdb; every pipeline thread queries through its own cursor."""
+    def __init__(self, con: duckdb.DuckDBPyConnection, source: str = "table"):
+        self.con = con
+        self.source = source
+        self._lock = threading.Lock()
+        row = con.execute(f"SELECT sha256, row_count FROM {META_TABLE} WHERE table_name = ?;", [TABLE]).fetchone()
+        self.version = row[0] if row else None
+        self.rows = row[1] if row else None
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        with self._lock:
+            cur = self.con.cursor()
+        # Session settings such as search_path are not inherited by cursors
+        if self.source == "parquet":
+            use_parquet_source(cur)
+        elif self.source == "clean":
+            quality.use_clean_source(cur)
+        return cur
+
+def ingest(data: str, reingest: bool = False, partition_year: bool = False, source: str = "table") -> Database:
     """
-    df1 = con.execute(q1).df()
-    
-    # Create pivot format for Q1 (matching Excel format)
-    if not df1.empty:
-        # Use the exact order from Excel file: CA, CO, CT, DC, HI, MA, MD, NJ, UT, WA
-        excel_order = ['CA', 'CO', 'CT', 'DC', 'HI', 'MA', 'MD', 'NJ', 'UT', 'WA']
-        
-        # Filter to these specific states only
-        df_top10 = df1[df1['statename'].isin(excel_order)]
-        
-        # Create pivot table: years as rows, states as columns
-        pivot_df = df_top10.pivot(index='year', columns='statename', values='avg_yearly_index')
-        
-        # Reorder columns to match the Excel order exactly
-        pivot_df = pivot_df[excel_order]
-        
-        # Round to whole numbers (no decimals)
-        pivot_df = pivot_df.round(0).astype(int)
-        
-        # Format numbers with commas for better readability
-        pivot_df_formatted = pivot_df.copy()
-        for col in pivot_df_formatted.columns:
-            pivot_df_formatted[col] = pivot_df_formatted[col].apply(lambda x: f"{x:,}")
-        
-        # Save the pivot CSV with comma formatting
-        out = REPORTS / "Q1_Top10_States_Average_Values.csv"
-        pivot_df_formatted.to_csv(out)
-        print(f"[ok] wrote {out}")
-    else:
-        df_to_csv(df1, "Q1_Top10_States_Average_Values")
-    
-    # Create a line chart for Q1 showing trends over time
-    if not df1.empty:
-        # Use the exact same order as Excel file
-        excel_order = ['CA', 'CO', 'CT', 'DC', 'HI', 'MA', 'MD', 'NJ', 'UT', 'WA']
-        df1_sample = df1[df1['statename'].isin(excel_order)]
-        
-        plt.figure(figsize=(14, 8))
-        colors = ['#2E7D32', '#1976D2', '#D32F2F', '#F57C00', '#7B1FA2', '#388E3C', '#303F9F', '#C2185B', '#FBC02D', '#5D4037']
-        for i, state in enumerate(excel_order):
-            state_data = df1_sample[df1_sample['statename'] == state]
-            plt.plot(state_data['year'], state_data['avg_yearly_index'], marker='o', label=state, linewidth=2, color=colors[i % len(colors)])
-        
-        plt.title('Top 10 States by Yearly Average Values Index (2000-2025)', fontsize=14, fontweight='bold')
-        plt.xlabel('Year', fontsize=12)
-        plt.ylabel('Average Home Value Index', fontsize=12)
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        
-        out = FIGS / "Q1_Top10_States_Average_Values.png"
-        plt.savefig(out, dpi=200, bbox_inches="tight")
-        plt.close()
-        print(f"[ok] wrote {out}")
-    
-    # Q2: Which 5 states have shown the highest growth in home values index from 2000 to 2025?
-    q2 = """
-    WITH state_values AS (
-        SELECT
-            statename,
-            year,
-            ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
-        FROM home_values_yearly_clean
-        WHERE yearlyindex IS NOT NULL
-        GROUP BY statename, year
-    ),
-    growth_calc AS (
-        SELECT
-            statename,
-            MIN(CASE WHEN year = 2000 THEN avg_yearly_index END) AS value_2000,
-            MAX(CASE WHEN year = 2025 THEN avg_yearly_index END) AS value_2025
-        FROM state_values
-        GROUP BY statename
-    )
-    SELECT
-        statename,
-        value_2000,
-        value_2025,
-        ROUND(((value_2025 - value_2000) / value_2000) * 100, 2) AS pct_growth
-    FROM growth_calc
-    WHERE value_2000 IS NOT NULL AND value_2025 IS NOT NULL
-    ORDER BY pct_growth DESC
-    LIMIT 5;
+    Ingest stage: refresh the table, the shared summaries and the data quality audit (with
+    source "parquet", also the Parquet staging copy; with "clean", the cleaned copy), then
+    publish them as the read-only snapshot report jobs open (see snapshots.py).
     """
-    df2 = con.execute(q2).df()
-    
-    # Format Q2 data to match screenshot exactly
-    if not df2.empty:
-        # Calculate absolute growth
-        df2['absolute_growth'] = df2['value_2025'] - df2['value_2000']
-        
-        # Create output matching the screenshot format
-        output_df = pd.DataFrame({
-            'State': df2['statename'],
-            'Absolute Growth': df2['absolute_growth'].apply(lambda x: f"{x:,.0f}"),
-            '% Growth': df2['pct_growth'].apply(lambda x: f"{x:.2f}%")
-        })
-        
-        out = REPORTS / "Q2_Top5_Home_Values_Growth.csv"
-        output_df.to_csv(out, index=False)
-        print(f"[ok] wrote {out}")
-    else:
-        df_to_csv(df2, "q2_top5_states_highest_growth_2000_2025")
-    # Create combo chart for Q2 (matching Excel format)
-    if not df2.empty:
-        # Calculate absolute growth
-        df2['absolute_growth'] = df2['value_2025'] - df2['value_2000']
-        
-        # Create combo chart with bars and line
-        fig, ax1 = plt.subplots(figsize=(12, 8))
-        
-        # Create bars for absolute growth (left y-axis) - Dark blue
-        bars = ax1.bar(df2['statename'], df2['absolute_growth'], color='#1f4e79', alpha=0.8, width=0.6)
-        ax1.set_xlabel('States', fontsize=12, fontweight='bold')
-        ax1.set_ylabel('Increase in Home Values ($)', fontsize=12, fontweight='bold', color='black')
-        ax1.set_ylim(0, 700000)
-        ax1.set_yticks(range(0, 700001, 100000))
-        ax1.tick_params(axis='y', labelcolor='black')
-        
-        # Format left Y-axis tick labels with commas
-        ax1.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:,.0f}'))
-        
-        # Add value labels on bars
-        for bar in bars:
-            height = bar.get_height()
-            ax1.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                    f'${height:,.0f}', ha='center', va='bottom', fontsize=10, fontweight='bold', color='black')
-        
-        # Create second y-axis for percentage growth
-        ax2 = ax1.twinx()
-        line = ax2.plot(df2['statename'], df2['pct_growth'], color='#FFD700', marker='o', 
-                       linewidth=3, markersize=8, label='% Growth')
-        ax2.set_ylabel('% Growth (2000-2025)', fontsize=12, fontweight='bold', color='black')
-        ax2.set_ylim(0, 400)
-        ax2.set_yticks(range(0, 401, 50))
-        ax2.tick_params(axis='y', labelcolor='black')
-        
-        # Format right Y-axis tick labels with % symbol
-        ax2.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:.0f}%'))
-        
-        # Add percentage labels on line points
-        for i, (state, pct) in enumerate(zip(df2['statename'], df2['pct_growth'])):
-            ax2.text(i, pct + 10, f'{pct:.2f}%', ha='center', va='bottom',
-                    fontsize=10, fontweight='bold', color='black')
-        
-        # Set title
-        plt.title('Top 5 States: Home Value Growth (2000-2025)', fontsize=16, fontweight='bold', pad=20)
-        
-        # Create custom legend
-        from matplotlib.patches import Patch
-        from matplotlib.lines import Line2D
-        legend_elements = [Patch(facecolor='#1f4e79', label='Absolute Growth'),
-                          Line2D([0], [0], color='#FFD700', linewidth=3, marker='o', label='% Growth')]
-        ax1.legend(handles=legend_elements, loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=2)
-        
-        # Add grid
-        ax1.grid(True, alpha=0.3, axis='y')
-        
-        plt.tight_layout()
-        out = FIGS / "Q2_Top5_Home_Values_Growth.png"
-        plt.savefig(out, dpi=200, bbox_inches="tight")
-        plt.close()
-        print(f"[ok] wrote {out}")
-    
-    # Q3A: Create exact data from Excel screenshot (Absolute Growth)
-    # Using the exact cities and values from your Excel analysis
-    excel_q3a_data = {
-        'city': ['Atherton', 'Water Mill', 'Bridgehampton', 'Montecito', 'Los Altos'],
-        'statename': ['CA', 'NY', 'NY', 'CA', 'CA'],
-        'value_2000': [2242459, 837106, 731911, 1272436, 1221979],
-        'value_2025': [7669379, 4787128, 4318796, 4770993, 4669028],
-        'absolute_growth': [5426920, 3950022, 3586885, 3498557, 3447049],
-        'pct_growth': [242.01, 471.87, 490.07, 274.95, 282.20]
-    }
-    df3a = pd.DataFrame(excel_q3a_data)
-    
-    # Format Q3A data for better presentation (Absolute Growth)
-    if not df3a.empty:
-        # Add formatted columns for better readability
-        df3a_formatted = df3a.copy()
-        df3a_formatted['value_2000_formatted'] = df3a_formatted['value_2000'].apply(lambda x: f"${x:,.0f}")
-        df3a_formatted['value_2025_formatted'] = df3a_formatted['value_2025'].apply(lambda x: f"${x:,.0f}")
-        df3a_formatted['absolute_growth_formatted'] = df3a_formatted['absolute_growth'].apply(lambda x: f"${x:,.0f}")
-        df3a_formatted['pct_growth_formatted'] = df3a_formatted['pct_growth'].apply(lambda x: f"{x:.2f}%")
-        df3a_formatted['city_state'] = df3a_formatted['city'] + ', ' + df3a_formatted['statename']
-        
-        # Reorder columns for better presentation
-        df3a_formatted = df3a_formatted[['city_state', 'city', 'statename', 'value_2000_formatted', 'value_2025_formatted', 'absolute_growth_formatted', 'pct_growth_formatted', 'value_2000', 'value_2025', 'absolute_growth', 'pct_growth']]
-        df3a_formatted.columns = ['City_State', 'City', 'State', 'Value_2000_Formatted', 'Value_2025_Formatted', 'Absolute_Growth_Formatted', 'Pct_Growth_Formatted', 'Value_2000_Raw', 'Value_2025_Raw', 'Absolute_Growth_Raw', 'Pct_Growth_Raw']
-        
-        out = REPORTS / "Q3A_Top5_Cities_Absolute_Growth.csv"
-        df3a_formatted.to_csv(out, index=False)
-        print(f"[ok] wrote {out}")
-    else:
-        df_to_csv(df3a, "Q3A_Top5_Cities_Absolute_Growth")
-    
-    # Q3B: Create exact data from Excel screenshot (Percentage Growth)
-    # Using the exact cities and values from your Excel analysis
-    excel_q3b_data = {
-        'city': ['Greenwich', 'Alamo', 'Wilson', 'Park City', 'Houlton'],
-        'statename': ['CT', 'CA', 'NC', 'UT', 'ME'],  # Assuming states based on common locations
-        'value_2000': [75929, 65359, 72828, 76241, 38427],
-        'value_2025': [1410845, 749735, 828493, 744888, 350832],
-        'absolute_growth': [1410845-75929, 749735-65359, 828493-72828, 744888-76241, 350832-38427],
-        'pct_growth': [1758.11, 1047.10, 1037.60, 877.02, 812.98]
-    }
-    df3b = pd.DataFrame(excel_q3b_data)
-    
-    # Format Q3B data for better presentation (Percentage Growth)
-    if not df3b.empty:
-        # Add formatted columns for better readability
-        df3b_formatted = df3b.copy()
-        df3b_formatted['value_2000_formatted'] = df3b_formatted['value_2000'].apply(lambda x: f"${x:,.0f}")
-        df3b_formatted['value_2025_formatted'] = df3b_formatted['value_2025'].apply(lambda x: f"${x:,.0f}")
-        df3b_formatted['absolute_growth_formatted'] = df3b_formatted['absolute_growth'].apply(lambda x: f"${x:,.0f}")
-        df3b_formatted['pct_growth_formatted'] = df3b_formatted['pct_growth'].apply(lambda x: f"{x:.2f}%")
-        df3b_formatted['city_state'] = df3b_formatted['city'] + ', ' + df3b_formatted['statename']
-        
-        # Reorder columns for better presentation
-        df3b_formatted = df3b_formatted[['city_state', 'city', 'statename', 'value_2000_formatted', 'value_2025_formatted', 'absolute_growth_formatted', 'pct_growth_formatted', 'value_2000', 'value_2025', 'absolute_growth', 'pct_growth']]
-        df3b_formatted.columns = ['City_State', 'City', 'State', 'Value_2000_Formatted', 'Value_2025_Formatted', 'Absolute_Growth_Formatted', 'Pct_Growth_Formatted', 'Value_2000_Raw', 'Value_2025_Raw', 'Absolute_Growth_Raw', 'Pct_Growth_Raw']
-        
-        out = REPORTS / "Q3B_Top5_Cities_Percentage_Growth.csv"
-        df3b_formatted.to_csv(out, index=False)
-        print(f"[ok] wrote {out}")
-    else:
-        df_to_csv(df3b, "Q3B_Top5_Cities_Percentage_Growth")
-    
-    # Create charts for both Q3A and Q3B (matching Excel screenshot format)
-    # Q3A Chart: Absolute Growth (EXACT match to your first Excel screenshot)
-    if not df3a.empty:
-        # Sort by absolute growth descending (highest first)
-        df3a = df3a.sort_values('absolute_growth', ascending=False)
-        
-        fig, ax = plt.subplots(figsize=(12, 8))
-        
-        # Create clustered bar chart: 2000 and 2025 values
-        x = np.arange(len(df3a))
-        width = 0.35
-        
-        # Light blue bars for 2000 values (exact color from screenshot)
-        bars_2000 = ax.bar(x - width/2, df3a['value_2000'], width, label='2000', color='#87CEEB', alpha=0.8)
-        # Dark blue bars for 2025 values (exact color from screenshot)
-        bars_2025 = ax.bar(x + width/2, df3a['value_2025'], width, label='2025', color='#1f4e79', alpha=0.8)
-        
-        # Set labels and title (exact match to screenshot)
-        ax.set_xlabel('Cities', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Home Values Index ($)', fontsize=12, fontweight='bold')
-        ax.set_title('Top 5 Cities by Absolute Home Values Growth (2000-2025)', fontsize=16, fontweight='bold', pad=20)
-        ax.set_xticks(x)
-        ax.set_xticklabels(df3a['city'], fontsize=10)
-        
-        # Set exact y-axis range to match screenshot (0 to 9,000,000)
-        ax.set_ylim(0, 9000000)
-        ax.set_yticks(range(0, 9000001, 1000000))
-        
-        # Format y-axis with commas and dollar signs
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-        
-        # Add red text labels for absolute growth above bars (exact format from screenshot)
-        for i, (bar_2000, bar_2025) in enumerate(zip(bars_2000, bars_2025)):
-            height_2025 = bar_2025.get_height()
-            growth = df3a.iloc[i]['absolute_growth']
-            ax.text(bar_2025.get_x() + bar_2025.get_width()/2., height_2025 + height_2025*0.01,
-                   f'+${growth:,.0f}', ha='center', va='bottom', fontsize=10, fontweight='bold', color='red')
-        
-        # Add legend (exact positioning from screenshot)
-        ax.legend(loc='upper left')
-        ax.grid(True, alpha=0.3, axis='y')
-        plt.tight_layout()
-        
-        out = FIGS / "Q3A_Top5_Cities_Absolute_Growth.png"
-        plt.savefig(out, dpi=200, bbox_inches="tight")
-        plt.close()
-        print(f"[ok] wrote {out}")
-    
-    # Q3B Chart: Percentage Growth (EXACT match to your second Excel screenshot)
-    if not df3b.empty:
-        # Sort by percentage growth descending (highest first)
-        df3b = df3b.sort_values('pct_growth', ascending=False)
-        
-        fig, ax1 = plt.subplots(figsize=(12, 8))
-        
-        # Create clustered bar chart: 2000 and 2025 values
-        x = np.arange(len(df3b))
-        width = 0.35
-        
-        # Light blue bars for 2000 values (exact color from screenshot)
-        bars_2000 = ax1.bar(x - width/2, df3b['value_2000'], width, label='2000', color='#87CEEB', alpha=0.8)
-        # Dark blue bars for 2025 values (exact color from screenshot)
-        bars_2025 = ax1.bar(x + width/2, df3b['value_2025'], width, label='2025', color='#1f4e79', alpha=0.8)
-        
-        # Set labels and title (exact match to screenshot)
-        ax1.set_xlabel('Cities', fontsize=12, fontweight='bold')
-        ax1.set_ylabel('Home Value Index ($)', fontsize=12, fontweight='bold')
-        ax1.set_title('Top 5 Cities by % Growth in Home Values (2000-2025)', fontsize=16, fontweight='bold', pad=20)
-        ax1.set_xticks(x)
-        ax1.set_xticklabels(df3b['city'], fontsize=10)
-        
-        # Set exact y-axis range to match screenshot (0 to 1,600,000)
-        ax1.set_ylim(0, 1600000)
-        ax1.set_yticks(range(0, 1600001, 200000))
-        
-        # Format y-axis with commas and dollar signs
-        ax1.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-        
-        # Create second y-axis for percentage growth
-        ax2 = ax1.twinx()
-        ax2.set_ylabel('% Growth (2000-2025)', fontsize=12, fontweight='bold')
-        
-        # Set exact right y-axis range to match screenshot (0% to 2000%)
-        ax2.set_ylim(0, 2000)
-        ax2.set_yticks(range(0, 2001, 200))
-        
-        # Add yellow line with data points for percentage growth (exact color from screenshot)
-        line = ax2.plot(x, df3b['pct_growth'], color='#FFD700', marker='o', linewidth=3, markersize=8, label='% Growth')
-        
-        # Add percentage labels on the line points (exact format from screenshot)
-        for i, (city, pct) in enumerate(zip(df3b['city'], df3b['pct_growth'])):
-            ax2.text(i, pct + pct*0.05, f'{pct:.2f}%', ha='center', va='bottom', 
-                    fontsize=10, fontweight='bold', color='black')
-        
-        # Add legends (exact positioning from screenshot)
-        lines1, labels1 = ax1.get_legend_handles_labels()
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
-        
-        ax1.grid(True, alpha=0.3, axis='y')
-        plt.tight_layout()
-        
-        out = FIGS / "Q3B_Top5_Cities_Percentage_Growth.png"
-        plt.savefig(out, dpi=200, bbox_inches="tight")
-        plt.close()
-        print(f"[ok] wrote {out}")
-    
-    # Q4: Which 5 states show the highest volatility in housing values year-over-year?
-    q4 = """
-    -- Step 1: Calculate yearly averages for each state
-    WITH yearly_averages AS (
-        SELECT 
-            statename,
-            year,
-            AVG(yearlyindex) AS avg_index
-        FROM home_values_yearly_clean
-        WHERE yearlyindex IS NOT NULL
-        GROUP BY statename, year
-    ),
-    
-    -- Step 2: Calculate year-over-year percentage changes
-    yearly_changes AS (
-        SELECT 
-            statename,
-            year,
-            avg_index,
-            LAG(avg_index) OVER (PARTITION BY statename ORDER BY year) AS prev_year_index,
-            -- Calculate percentage change from previous year
-            ROUND(((avg_index - LAG(avg_index) OVER (PARTITION BY statename ORDER BY year)) / 
-                   LAG(avg_index) OVER (PARTITION BY statename ORDER BY year)) * 100, 2) AS yoy_change_pct
-        FROM yearly_averages
-    ),
-    
-    -- Step 3: Calculate volatility metrics for each state
-    volatility_analysis AS (
-        SELECT 
-            statename,
-            COUNT(*) AS years_tracked,
-            ROUND(AVG(yoy_change_pct), 2) AS avg_yoy_change,
-            ROUND(STDDEV(yoy_change_pct), 2) AS volatility_stddev,
-            ROUND(MIN(yoy_change_pct), 2) AS worst_year_pct,
-            ROUND(MAX(yoy_change_pct), 2) AS best_year_pct,
-            ROUND(MAX(yoy_change_pct) - MIN(yoy_change_pct), 2) AS volatility_range
-        FROM yearly_changes
-        WHERE yoy_change_pct IS NOT NULL
-        GROUP BY statename
-        HAVING COUNT(*) >= 10  -- Only states with 10+ years of data
-    )
-    
-    -- Final result: Top 5 most volatile states
-    SELECT 
-        statename AS state,
-        years_tracked,
-        avg_yoy_change AS avg_annual_change_pct,
-        volatility_stddev AS volatility_pct,
-        volatility_range AS range_pct,
-        worst_year_pct,
-        best_year_pct
-    FROM volatility_analysis
-    ORDER BY volatility_stddev DESC
-    LIMIT 5;
+    con = load_into_duckdb(Path(data), reingest=reingest)
+    if source == "parquet":
+        stage_parquet(con, partition_by_year=partition_year)
+    refreshed = refresh_geo_year_summary(con) != "skip"
+    refreshed = quality.refresh(con, clean=source == "clean") != "skip" or refreshed
+    db = Database(con, source)
+    publish(con, DATA, db.version, force=refreshed)
+    if source == "parquet":
+        use_parquet_source(con)
+    elif source == "clean":
+        quality.use_clean_source(con)
+    return db
+
+def on_cursor(query, db: Database, *args, **params):
+    """Run a query function on a fresh cursor of db (pipeline stages run in threads)."""
+    return query(db.cursor(), *args, **params)
+
+def select_q1_states(con: duckdb.DuckDBPyConnection, top_n: int = Q1_TOP_N, by: str = Q1_METRIC) -> list:
+    """The Q1 states: top_n by metric `by` (see pivot.STATE_METRICS), in state-name order."""
+    return sorted(top_states(con, top_n, by))
+
+def q1_table(con: duckdb.DuckDBPyConnection, states: list = None, top_n: int = Q1_TOP_N,
+             by: str = Q1_METRIC) -> dict:
+    """Q1 as NumPy columns (statename, year, avg_yearly_index); see query_q1."""
+    # Read from the shared state x year summary
+    if states is None:
+        states = select_q1_states(con, top_n, by)
+    return queries.execute(con, "q1_state_averages", states=states).fetchnumpy()
+
+def query_q1(con: duckdb.DuckDBPyConnection, states: list = None, top_n: int = Q1_TOP_N,
+             by: str = Q1_METRIC) -> "pd.DataFrame":
+    """Q1: Yearly average home value index for each of the given states (default: the top_n by `by`)."""
+    if states is None:
+        states = select_q1_states(con, top_n, by)
+    return queries.execute(con, "q1_state_averages", states=states).df()
+
+def query_q1_pivot(con: duckdb.DuckDBPyConnection, states: list = None) -> tuple:
+    """Q1 as year x state Arrow tables: (raw averages, formatted whole numbers), both from one PIVOT."""
+    if states is None:
+        states = select_q1_states(con)
+    raw = state_year_pivot(con, states)
+    return raw, presentation(con, raw)
+
+def _select(columns: dict, names, renames: dict = None) -> dict:
+    renames = renames or {}
+    return {renames.get(name, name): columns[name] for name in names}
+
+def q2_table(con: duckdb.DuckDBPyConnection, start_year: int = 2000, end_year: int = 2025,
+             top_n: int = 5) -> dict:
+    """Q2 as NumPy columns (statename, value_<start>, value_<end>, pct_growth); see query_q2."""
+    ranked = rank_columns(load_matrix(con, "state"), "pct_growth", start_year, end_year, top_n)
+    return _select(ranked, ["statename", f"value_{start_year}", f"value_{end_year}", "pct_growth"])
+
+def query_q2(con: duckdb.DuckDBPyConnection, start_year: int = 2000, end_year: int = 2025,
+             top_n: int = 5) -> "pd.DataFrame":
+    """Q2: Which 5 states have shown the highest growth in home values index from 2000 to 2025?"""
+    import pandas as pd
+    return pd.DataFrame(q2_table(con, start_year, end_year, top_n))
+
+def city_growth_tables(con: duckdb.DuckDBPyConnection, start_year: int = 2000, end_year: int = 2025,
+                       top_n: int = 5):
+    """Q3A and Q3B as NumPy columns; see city_growth."""
+    matrix = load_matrix(con, "city")
+    growth = ["city", "statename", f"value_{start_year}", f"value_{end_year}", "absolute_growth", "pct_growth"]
+    return tuple(_select(rank_columns(matrix, by, start_year, end_year, top_n), growth)
+                 for by in ("absolute_growth", "pct_growth"))
+
+def city_growth(con: duckdb.DuckDBPyConnection, start_year: int = 2000, end_year: int = 2025,
+                top_n: int = 5):
     """
-    df4 = con.execute(q4).df()
-    
+    Top cities by absolute and by percentage growth between start_year and end_year.
+
+    Both rankings come from the dense city x year matrix built from geo_year_summary, so
+    any horizon is two column lookups instead of a scan of the zip-level table.
+    """
+    import pandas as pd
+    df3a, df3b = city_growth_tables(con, start_year, end_year, top_n)
+    return pd.DataFrame(df3a), pd.DataFrame(df3b)
+
+def q4_table(con: duckdb.DuckDBPyConnection, top_n: int = 5, min_years: int = 10) -> dict:
+    """Q4 as NumPy columns (state, then the volatility statistics); see query_q4."""
+    matrix = load_matrix(con, "state", DECIMALS["volatility"])
+    ranked = rank_columns(matrix, "volatility", top_n=top_n, min_years=min_years)
+    return _select(ranked, ["statename", *VOLATILITY_COLUMNS], {"statename": "state"})
+
+def query_q4(con: duckdb.DuckDBPyConnection, top_n: int = 5, min_years: int = 10) -> "pd.DataFrame":
+    """Q4: Which 5 states show the highest volatility in housing values year-over-year?"""
+    import pandas as pd
+    return pd.DataFrame(q4_table(con, top_n, min_years))
+
+def report_files(name: str) -> tuple:
+    """The CSV of report name and its typed Parquet and Arrow IPC copies (see report_tables.py)."""
+    from report_tables import REPORT_SUFFIXES
+    return tuple(REPORTS / f"{name}{suffix}" for suffix in REPORT_SUFFIXES)
+
+def arrow_result(build, con: duckdb.DuckDBPyConnection, *args, **params):
+    """build(con, ...) (NumPy columns, or a tuple of them) as Arrow table(s), for the pipeline stages."""
+    from report_tables import arrow_table
+    out = build(con, *args, **params)
+    return tuple(map(arrow_table, out)) if isinstance(out, tuple) else arrow_table(out)
+
+def export_q1(pivots: tuple) -> Path:
+    """Write the Q1 pivot (years as rows, states as columns): formatted, plus the raw values."""
+    from report_tables import write_csv, write_report
+    raw, formatted = pivots
+    write_csv(raw, REPORTS / "Q1_Top10_States_Average_Values_Pivot.csv")
+    return write_report(REPORTS / "Q1_Top10_States_Average_Values", formatted, typed=raw)
+
+def export_q2(t2: "pa.Table") -> Path:
+    from report_tables import project, write_report
+    # Format Q2 data to match screenshot exactly
+    if t2.num_rows == 0:
+        return write_report(REPORTS / "q2_top5_states_highest_growth_2000_2025", t2)
+
+    # State, absolute growth and % growth, formatted in DuckDB over the Arrow table
+    formatted = project(t2, """
+        statename AS "State",
+        format('{:,.0f}', value_2025 - value_2000) AS "Absolute Growth",
+        format('{:.2f}%', pct_growth) AS "% Growth"
+    """)
+    return write_report(REPORTS / "Q2_Top5_Home_Values_Growth", formatted, typed=t2)
+
+def export_q3(t3: "pa.Table", name: str) -> Path:
+    """Write one city growth ranking (Q3A absolute or Q3B percentage) with formatted columns."""
+    from report_tables import project, write_report
+    if t3.num_rows == 0:
+        return write_report(REPORTS / name, t3)
+
+    # Formatted columns for readability, then the raw values
+    formatted = project(t3, """
+        city || ', ' || statename AS City_State,
+        city AS City,
+        statename AS State,
+        '$' || format('{:,.0f}', value_2000) AS Value_2000_Formatted,
+        '$' || format('{:,.0f}', value_2025) AS Value_2025_Formatted,
+        '$' || format('{:,.0f}', absolute_growth) AS Absolute_Growth_Formatted,
+        format('{:.2f}%', pct_growth) AS Pct_Growth_Formatted,
+        value_2000 AS Value_2000_Raw,
+        value_2025 AS Value_2025_Raw,
+        absolute_growth AS Absolute_Growth_Raw,
+        pct_growth AS Pct_Growth_Raw
+    """)
+    return write_report(REPORTS / name, formatted, typed=t3)
+
+def export_q4(t4: "pa.Table") -> Path:
+    from report_tables import project, write_report
     # Format Q4 data for better presentation
-    if not df4.empty:
-        # Add formatted columns for better readability
-        df4_formatted = df4.copy()
-        df4_formatted['avg_yoy_change_formatted'] = df4_formatted['avg_annual_change_pct'].apply(lambda x: f"{x:.2f}%")
-        df4_formatted['volatility_stddev_formatted'] = df4_formatted['volatility_pct'].apply(lambda x: f"{x:.2f}%")
-        df4_formatted['volatility_range_formatted'] = df4_formatted['range_pct'].apply(lambda x: f"{x:.2f}%")
-        df4_formatted['worst_year_formatted'] = df4_formatted['worst_year_pct'].apply(lambda x: f"{x:.2f}%")
-        df4_formatted['best_year_formatted'] = df4_formatted['best_year_pct'].apply(lambda x: f"{x:.2f}%")
-        
-        # Reorder columns for better presentation
-        df4_formatted = df4_formatted[['state', 'years_tracked', 'avg_yoy_change_formatted', 'volatility_stddev_formatted', 
-                                      'volatility_range_formatted', 'worst_year_formatted', 'best_year_formatted',
-                                      'avg_annual_change_pct', 'volatility_pct', 'range_pct', 'worst_year_pct', 'best_year_pct']]
-        df4_formatted.columns = ['State', 'Years_Tracked', 'Avg_YoY_Change_Formatted', 'Volatility_StdDev_Formatted', 
-                                'Volatility_Range_Formatted', 'Worst_Year_Formatted', 'Best_Year_Formatted',
-                                'Avg_YoY_Change_Raw', 'Volatility_StdDev_Raw', 'Volatility_Range_Raw', 'Worst_Year_Raw', 'Best_Year_Raw']
-        
-        out = REPORTS / "Q4_Top5_States_Highest_Volatility.csv"
-        df4_formatted.to_csv(out, index=False)
-        print(f"[ok] wrote {out}")
-    else:
-        df_to_csv(df4, "Q4_Top5_States_Highest_Volatility")
-    
-    # Create a horizontal bar chart for Q4 showing volatility by state
-    if not df4.empty:
-        # Sort with highest volatility at the top
-        df4 = df4.sort_values('volatility_pct', ascending=True)
-        
-        plt.figure(figsize=(12, 8))
-        bars = plt.barh(df4['state'], df4['volatility_pct'], color="#D32F2F", alpha=0.8, edgecolor='white', linewidth=1)
-        
-        plt.title('Top 5 States with Highest Housing Value Volatility (Year-over-Year)', fontsize=16, fontweight='bold', pad=20)
-        plt.xlabel('Volatility (Standard Deviation of YoY Changes)', fontsize=12, fontweight='bold')
-        plt.ylabel('State', fontsize=12, fontweight='bold')
-        plt.xticks(fontsize=10)
-        plt.yticks(fontsize=10)
-        
-        # Add value labels on the right side of bars
-        for i, bar in enumerate(bars):
-            width = bar.get_width()
-            plt.text(width + width*0.01, bar.get_y() + bar.get_height()/2,
-                    f'{width:.2f}%', ha='left', va='center', fontsize=10, fontweight='bold')
-        
-        # Add grid for better readability
-        plt.grid(axis='x', alpha=0.3, linestyle='--')
-        plt.tight_layout()
-        
-        out = FIGS / "Q4_Top5_States_Highest_Volatility.png"
-        plt.savefig(out, dpi=200, bbox_inches="tight")
-        plt.close()
-        print(f"[ok] wrote {out}")
-
-
-def write_summary():
-    """Generate reports/summary.txt from the computed CSV outputs."""
+    if t4.num_rows == 0:
+        return write_report(REPORTS / "Q4_Top5_States_Highest_Volatility", t4)
+
+    # Formatted columns for readability, then the raw values
+    formatted = project(t4, """
+        state AS State,
+        years_tracked AS Years_Tracked,
+        format('{:.2f}%', avg_annual_change_pct) AS Avg_YoY_Change_Formatted,
+        format('{:.2f}%', volatility_pct) AS Volatility_StdDev_Formatted,
+        format('{:.2f}%', range_pct) AS Volatility_Range_Formatted,
+        format('{:.2f}%', worst_year_pct) AS Worst_Year_Formatted,
+        format('{:.2f}%', best_year_pct) AS Best_Year_Formatted,
+        avg_annual_change_pct AS Avg_YoY_Change_Raw,
+        volatility_pct AS Volatility_StdDev_Raw,
+        range_pct AS Volatility_Range_Raw,
+        worst_year_pct AS Worst_Year_Raw,
+        best_year_pct AS Best_Year_Raw
+    """)
+    return write_report(REPORTS / "Q4_Top5_States_Highest_Volatility", formatted, typed=t4)
+
+def build_pipeline(args) -> Pipeline:
+    """The analysis as a DAG: ingest -> per-question query -> CSV export / figure -> summary."""
+    from charts import (default_workers, render, q1_trend_chart, q2_growth_chart, q3a_absolute_growth_chart,
+                        q3b_pct_growth_chart, q4_volatility_chart)
+    figure = lambda name, dep, builder, **options: Stage(
+        name, render, deps=(dep,), outputs=(options["out"],),
+        params={"builder": builder, **options}, process=True)
+    stages = [
+        # The source is part of the version: the cleaned copy gives different results
+        Stage("ingest", ingest, volatile=True, version=lambda db: (db.version, db.source),
+              params={"data": args.data, "reingest": args.reingest,
+                      "partition_year": args.partition_year, "source": args.source}),
+        Stage("q1_states", partial(on_cursor, select_q1_states), deps=("ingest",),
+              key=(queries.sql("top_states"), STATE_METRICS), params={"top_n": args.q1_top_n, "by": args.q1_by}),
+        Stage("q1", partial(on_cursor, partial(arrow_result, q1_table)), deps=("ingest", "q1_states"), key=queries.sql("q1_state_averages")),
+        Stage("q1_pivot", partial(on_cursor, query_q1_pivot), deps=("ingest", "q1_states"), key=PIVOT_SQL),
+        Stage("q2", partial(on_cursor, partial(arrow_result, q2_table)), deps=("ingest",), key=MATRIX_SQL),
+        Stage("city_growth", partial(on_cursor, partial(arrow_result, city_growth_tables)), deps=("ingest",),
+              key=MATRIX_SQL),
+        Stage("q3a", itemgetter(0), deps=("city_growth",)),
+        Stage("q3b", itemgetter(1), deps=("city_growth",)),
+        Stage("q4", partial(on_cursor, partial(arrow_result, q4_table)), deps=("ingest",), key=MATRIX_SQL),
+        Stage("q1_csv", export_q1, deps=("q1_pivot",),
+              outputs=(*report_files("Q1_Top10_States_Average_Values"),
+                       REPORTS / "Q1_Top10_States_Average_Values_Pivot.csv")),
+        Stage("q2_csv", export_q2, deps=("q2",), outputs=report_files("Q2_Top5_Home_Values_Growth")),
+        Stage("q3a_csv", export_q3, deps=("q3a",), outputs=report_files("Q3A_Top5_Cities_Absolute_Growth"),
+              params={"name": "Q3A_Top5_Cities_Absolute_Growth"}),
+        Stage("q3b_csv", export_q3, deps=("q3b",), outputs=report_files("Q3B_Top5_Cities_Percentage_Growth"),
+              params={"name": "Q3B_Top5_Cities_Percentage_Growth"}),
+        Stage("q4_csv", export_q4, deps=("q4",), outputs=report_files("Q4_Top5_States_Highest_Volatility")),
+        Stage("quality", partial(on_cursor, quality.write_report), deps=("ingest",),
+              outputs=(REPORTS / "data_quality.csv", REPORTS / "data_quality.txt")),
+        figure("q1_figure", "q1", q1_trend_chart, out=FIGS / "Q1_Top10_States_Average_Values.png"),
+        figure("q2_figure", "q2", q2_growth_chart, out=FIGS / "Q2_Top5_Home_Values_Growth.png"),
+        figure("q3a_figure", "q3a", q3a_absolute_growth_chart, out=FIGS / "Q3A_Top5_Cities_Absolute_Growth.png"),
+        figure("q3b_figure", "q3b", q3b_pct_growth_chart, out=FIGS / "Q3B_Top5_Cities_Percentage_Growth.png"),
+        figure("q4_figure", "q4", q4_volatility_chart, out=FIGS / "Q4_Top5_States_Highest_Volatility.png"),
+        Stage("summary", write_summary, deps=("q1_csv", "q2_csv", "q3a_csv", "q3b_csv", "q4_csv"),
+              outputs=(REPORTS / "summary.txt",)),
+    ]
+    chart_workers = default_workers() if args.chart_workers is None else args.chart_workers
+    # Any edit to the scripts or the SQL files invalidates the cached stage results
+    sources = sorted(Path(__file__).parent.glob("*.py")) + sorted(queries.SQL_DIR.glob("*.sql"))
+    return Pipeline(stages, CACHE, workers=args.workers, process_workers=chart_workers, sources=sources)
+
+def write_summary(*exports):
+    """Generate reports/summary.txt from the computed CSV outputs (exports: their paths, in pipeline order)."""
+    import pandas as pd
     try:
         yearly_avg = pd.read_csv(REPORTS / "q1_yearly_average_by_state.csv")
     except FileNotFoundError:
@@ -579,15 +578,79 @@ def write_summary():
         f.write("- Highest volatility state: " + highest_volatility_line + "\n")
     print(f"[ok] wrote {out_path}")
 
+def add_ingest_arguments(parser):
+    """Options of the ingest stage (shared with cli.py)."""
+    parser.add_argument("--data", type=str, default="data/home_values_yearly_clean.csv",
+                        help="Path to the full CSV, or a directory or glob of CSV/Parquet drops "
+                             "upserted in file-name order. Falls back to data/sample_home_values_yearly_clean.csv if missing.")
+    parser.add_argument("--reingest", action="store_true",
+                        help="Ignore the stored fingerprint and re-import the CSV from scratch.")
+    parser.add_argument("--source", choices=["table", "parquet", "clean"], default="table",
+                        help="Run the queries against the DuckDB table, the Parquet staging layer or the "
+                             "cleaned, gap-filled copy (see quality.py).")
+    parser.add_argument("--partition-year", action="store_true",
+                        help="Partition the Parquet staging layer by statename and year.")
+
+def add_pipeline_arguments(parser):
+    """Options build_pipeline reads besides the ingest ones (shared with cli.py)."""
+    add_ingest_arguments(parser)
+    parser.add_argument("--chart-workers", type=int, default=None,
+                        help="Processes used to render figures (default: up to 4; 1 renders serially).")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Threads used to run independent query and export stages.")
+    parser.add_argument("--q1-top-n", type=int, default=Q1_TOP_N, help="States in the Q1 report (default 10).")
+    parser.add_argument("--q1-by", choices=STATE_METRICS, default=Q1_METRIC,
+                        help="Metric that picks the Q1 states (default: mean of their yearly averages).")
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--data", type=str, default="data/home_values_yearly_clean.csv",
-                        help="Path to the full CSV. Falls back to data/sample_home_values_yearly_clean.csv if missing.")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--only", nargs="+", metavar="STAGE",
+                        help="Build only these stages (glob patterns, e.g. q2 'q3*' '*_figure') and what they need.")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        help="Rebuild these stages even if cached (no pattern: rebuild everything).")
+    parser.add_argument("--list-stages", action="store_true",
+                        help="Print the pipeline stages in execution order and exit.")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="TRACE_JSON",
+                        help="Record time, CPU, memory and rows per stage and DuckDB's profile of every "
+                             "SQL statement (default trace: reports/profiles/run_analysis-<time>.json).")
+    parser.add_argument("--preview", nargs="?", type=float, const=0.05, default=None, metavar="FRACTION",
+                        help="Fast approximate run: estimate Q1-Q4 with confidence intervals on a stratified "
+                             "sample of this fraction of each state's zips (default 0.05); writes reports/preview/.")
+    parser.add_argument("--preview-seed", type=int, default=42, help="Seed of the preview sample and bootstrap.")
+    execution.add_arguments(parser)
     args = parser.parse_args()
+    execution.configure_from_args(args)
+    if args.preview is not None:
+        if not 0 < args.preview <= 1:
+            parser.error("--preview FRACTION must be in (0, 1]")
+        con = load_into_duckdb(Path(args.data), reingest=args.reingest)
+        refresh_geo_year_summary(con)
+        from preview import run_preview
+        states = select_q1_states(con, args.q1_top_n, args.q1_by)
+        run_preview(con, REPORTS / "preview", states, fraction=args.preview, seed=args.preview_seed)
+        con.close()
+        return
+    pipeline = build_pipeline(args)
+    if args.list_stages:
+        for name in pipeline.order:
+            deps = ", ".join(pipeline.stages[name].deps)
+            print(f"{name}" + (f"  <- {deps}" if deps else ""))
+        return
+    for option, patterns in (("--only", args.only), ("--force", args.force)):
+        if patterns:
+            try:
+                select_stages(pipeline.order, patterns)
+            except ValueError as e:
+                parser.error(f"{option}: {e}")
     ensure_dirs()
-    con = load_into_duckdb(Path(args.data))
-    run_queries(con)
-    write_summary()
+    print(f"[ok] execution profile: {execution.describe()}")
+    if args.profile is None:
+        pipeline.run(only=args.only, force=args.force)
+    else:
+        with profiling.Profiler("run_analysis") as profiler:
+            profiler.statuses = pipeline.run(only=args.only, force=args.force)
+        profiler.write(Path(args.profile) if args.profile else profiling.default_trace_path(REPORTS, "run_analysis"))
     print("[done] Analysis complete. See reports/ and reports/figures/.")
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Versioned, read-only snapshots of data/housing.duckdb for report jobs running concurrently.
+
+run_analysis.py owns data/housing.duckdb: it is the only process that opens it read-write
+(DuckDB locks the file for its writer) and it rebuilds tables in place. Once an ingest has
+brought the table and its summaries up to date, publish() copies the database into a new
+file named after the data version, data/snapshots/housing-<sha256 prefix>-<time>.duckdb,
+and then points data/snapshots/CURRENT.json at it with an atomic rename. A snapshot is
+complete before the pointer names it, and never changes afterwards.
+
+Readers (create_excel_workbooks.py, growth.py, volatility.py) resolve the pointer once and
+open that snapshot read-only, so any number of them can run side by side on one consistent
+version while the next ingest proceeds. The newest KEEP snapshots are kept, so a job that
+resolved the pointer just before a swap still finds its file.
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+import duckdb
+import profiling
+
+SNAPSHOT_DIR = "snapshots"
+POINTER = "CURRENT.json"
+KEEP = 3
+
+def snapshot_dir(data_dir: Path) -> Path:
+    return Path(data_dir) / SNAPSHOT_DIR
+
+def read_pointer(data_dir: Path):
+    """The published snapshot as {"version", "file", "published_at"}, or None."""
+    try:
+        return json.loads((snapshot_dir(data_dir) / POINTER).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+def _write_pointer(directory: Path, info: dict):
+    # Write beside the pointer, then rename over it: readers see the old or the new one, whole
+    tmp = directory / f"{POINTER}.tmp"
+    tmp.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    os.replace(tmp, directory / POINTER)
+
+def prune(directory: Path, keep: int = KEEP, current: str = None):
+    """Delete all but the newest keep snapshots (never the current one)."""
+    files = sorted(directory.glob("housing-*.duckdb"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in files[keep:]:
+        if path.name != current:
+            path.unlink(missing_ok=True)
+            Path(f"{path}.wal").unlink(missing_ok=True)
+
+def publish(con: duckdb.DuckDBPyConnection, data_dir: Path, version: str, keep: int = KEEP,
+            force: bool = False):
+    """
+    Copy con's database into a snapshot of version and make it current; returns its path.
+    A no-op when a snapshot of version is already current, unless force (e.g. the summaries
+    were rebuilt); None when the data has no version yet.
+    """
+    if not version:
+        print("[warn] no data version recorded; snapshot not published")
+        return None
+    directory = snapshot_dir(data_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    pointer = read_pointer(data_dir)
+    if (not force and pointer and pointer["version"] == version
+            and (directory / pointer["file"]).exists()):
+        print(f"[skip] snapshot {pointer['file']} is current")
+        return directory / pointer["file"]
+    # A new file every time: a republished version never overwrites a file readers have open
+    name = f"housing-{version[:16]}-{datetime.now():%Y%m%d%H%M%S%f}.duckdb"
+    # Built under a temporary name, so no reader can open a half-copied file
+    tmp = directory / f"{name}.tmp"
+    tmp.unlink(missing_ok=True)
+    source = con.execute("SELECT current_database();").fetchone()[0]
+    con.execute(f"ATTACH '{tmp.as_posix()}' AS snapshot_build;")
+    try:
+        con.execute(f'COPY FROM DATABASE "{source}" TO snapshot_build;')
+    finally:
+        con.execute("DETACH snapshot_build;")
+    os.replace(tmp, directory / name)
+    _write_pointer(directory, {"version": version, "file": name,
+                               "published_at": datetime.now().isoformat(timespec="seconds")})
+    prune(directory, keep, current=name)
+    print(f"[ok] published snapshot {directory / name}")
+    return directory / name
+
+def resolve(data_dir: Path) -> Path:
+    """The current snapshot's file (falls back to housing.duckdb before the first publish)."""
+    pointer = read_pointer(data_dir)
+    if pointer is not None:
+        path = snapshot_dir(data_dir) / pointer["file"]
+        if path.exists():
+            return path
+    print("[warn] no snapshot published yet (run scripts/run_analysis.py); reading housing.duckdb")
+    return Path(data_dir) / "housing.duckdb"
+
+def connect(data_dir: Path, database: str = None):
+    """Read-only connection to database, or to the current snapshot of data_dir."""
+    path = database if database is not None else resolve(data_dir)
+    return profiling.connect(str(path), read_only=True)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Typed Parquet staging layer for the housing dataset.
+
+- Declares the explicit column types of home_values_yearly_clean (no CSV type sniffing).
+- Writes the ingested table once to Hive-partitioned, dictionary-encoded Parquet under
+  data/parquet/home_values_yearly_clean/statename=XX/[year=YYYY/]*.parquet.
+- Exposes it as the view staging.home_values_yearly_clean, so the queries in
+  sql/analysis.sql read Parquet (with partition pruning) after:
+      SET search_path = 'staging,main';
+"""
+import json
+import shutil
+from pathlib import Path
+import duckdb
+
+REPO = Path(__file__).resolve().parents[1]
+PARQUET_DIR = REPO / "data" / "parquet" / "home_values_yearly_clean"
+MANIFEST = "_manifest.json"
+STAGING_SCHEMA = "staging"
+
+# Explicit column types of the cleaned dataset
+SCHEMA = {
+    "regionname": "VARCHAR",
+    "statename": "VARCHAR",
+    "city": "VARCHAR",
+    "countyname": "VARCHAR",
+    "metro": "VARCHAR",
+    "year": "SMALLINT",
+    "yearlyindex": "DOUBLE",
+}
+
+def csv_columns_sql(schema: dict = SCHEMA) -> str:
+    """Render a schema as the columns={...} argument of DuckDB's read_csv."""
+    return "{" + ", ".join(f"'{name}': '{dtype}'" for name, dtype in schema.items()) + "}"
+
+def read_manifest(out_dir: Path = PARQUET_DIR):
+    try:
+        return json.loads((out_dir / MANIFEST).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+def create_staging_view(con: duckdb.DuckDBPyConnection, out_dir: Path = PARQUET_DIR,
+                        table: str = "home_values_yearly_clean"):
+    """(Re)create staging.<table> over the Parquet dataset; partition columns keep their types."""
+    manifest = read_manifest(out_dir) or {}
+    partition_by = manifest.get("partition_by", ["statename"])
+    hive_types = ", ".join(f"'{col}': '{SCHEMA[col]}'" for col in partition_by)
+    glob = (out_dir / "/".join("*" for _ in partition_by) / "*.parquet").as_posix()
+    columns = ", ".join(SCHEMA)
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {STAGING_SCHEMA};")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {STAGING_SCHEMA}.{table} AS
+        SELECT {columns}
+        FROM read_parquet('{glob}', hive_partitioning=true, hive_types={{{hive_types}}});
+    """)
+
+def stage_parquet(con: duckdb.DuckDBPyConnection, out_dir: Path = PARQUET_DIR,
+                  partition_by_year: bool = False, table: str = "home_values_yearly_clean") -> bool:
+    """
+    Write table to Hive-partitioned Parquet unless the existing dataset was built from the
+    same source fingerprint (as recorded by the ingest). Returns True if files were written.
+    """
+    partition_by = ["statename", "year"] if partition_by_year else ["statename"]
+    row = con.execute(
+        "SELECT sha256 FROM ingest_metadata WHERE table_name = ?;", [table]
+    ).fetchone()
+    source_sha256 = row[0] if row else None
+    manifest = read_manifest(out_dir)
+    if (manifest and source_sha256 and manifest.get("sha256") == source_sha256
+            and manifest.get("partition_by") == partition_by):
+        create_staging_view(con, out_dir, table)
+        print(f"[skip] Parquet staging in {out_dir} is up to date")
+        return False
+
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    # DuckDB's default dictionary size limit already covers the low-cardinality strings of a
+    # state; raising it makes every partition writer reserve a far larger dictionary up front
+    con.execute(f"""
+        COPY (SELECT * FROM {table} ORDER BY {", ".join(partition_by)}, regionname)
+        TO '{out_dir.as_posix()}'
+        (FORMAT parquet, PARTITION_BY ({", ".join(partition_by)}), COMPRESSION zstd);
+    """)
+    (out_dir / MANIFEST).write_text(json.dumps({
+        "sha256": source_sha256,
+        "partition_by": partition_by,
+        "schema": SCHEMA,
+    }, indent=2), encoding="utf-8")
+    create_staging_view(con, out_dir, table)
+    print(f"[ok] staged Parquet dataset in {out_dir}")
+    return True
+
+def use_parquet_source(con: duckdb.DuckDBPyConnection):
+    """Resolve unqualified table names against the Parquet staging views first."""
+    con.execute(f"SET search_path = '{STAGING_SCHEMA},main';")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Rolling-window volatility of year-over-year changes at state, metro, county, city or zip level.
+
+Q4 measures one standard deviation of the YoY % change over the whole period, per state. This
+engine computes the mean and standard deviation of the YoY change over every trailing window
+of 3, 5 and 10 years (or any --windows) for every geo of a level, including all zips:
+
+- the level's average index is loaded once as a dense geo x year matrix (growth.load_matrix),
+  and the YoY change of every geo and year is one vectorized division,
+- the window statistics are kept incrementally with Welford's update: walking the years once,
+  each year's change is added to every window's running (count, mean, M2) and the change that
+  falls out of the window is removed, for all geos and all windows at the same time. No window
+  is re-scanned, and the cost does not depend on the window lengths.
+
+YoY changes follow Q4: percent change of the yearly average against the previous year, rounded
+to 2 decimals, and the sample standard deviation (STDDEV). A year missing from a geo's series
+leaves both adjacent changes missing, as in Q4, and a window only counts when it holds at
+least --min-periods changes (default: the full window).
+
+Usage:
+    python scripts/volatility.py --levels state metro county zip --windows 3 5 10 --top-n 10
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import execution
+import snapshots
+from growth import LEVELS, GeoYearMatrix, matrix_chunks, merge_top, round_half_away, top_indices
+
+REPO = Path(__file__).resolve().parents[1]
+REPORTS = REPO / "reports"
+
+WINDOWS = (3, 5, 10)
+
+def yoy_changes(matrix: GeoYearMatrix) -> np.ndarray:
+    """YoY % change per geo (rows) for years[1:] (columns); NaN where either year is missing."""
+    values = matrix.values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (values[:, 1:] - values[:, :-1]) / values[:, :-1] * 100
+    change[~np.isfinite(change)] = np.nan
+    return round_half_away(change)
+
+class RollingStats:
+    """Running count, mean and M2 (sum of squared deviations) of one window, for every geo."""
+    def __init__(self, window: int, n_geos: int):
+        self.window = window
+        self.count = np.zeros(n_geos)
+        self.mean = np.zeros(n_geos)
+        self.m2 = np.zeros(n_geos)
+
+    def add(self, x: np.ndarray):
+        ok = ~np.isnan(x)
+        self.count += ok
+        delta = np.where(ok, x - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += np.where(ok, delta * (x - self.mean), 0.0)
+
+    def remove(self, x: np.ndarray):
+        ok = ~np.isnan(x)
+        self.count -= ok
+        delta = np.where(ok, x - self.mean, 0.0)
+        self.mean -= delta / np.maximum(self.count, 1)
+        self.m2 -= np.where(ok, delta * (x - self.mean), 0.0)
+        # An emptied window starts again from exact zeros rather than rounding residue
+        empty = self.count == 0
+        self.mean[empty] = 0.0
+        self.m2[empty] = 0.0
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (NaN below two values)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count >= 2, np.sqrt(np.maximum(self.m2, 0.0) / (self.count - 1)), np.nan)
+
+def rolling_volatility(matrix: GeoYearMatrix, windows=WINDOWS, end_years=None) -> dict:
+    """
+    {(window, end_year): (count, mean, std)} arrays over the matrix's geos, for the windows of
+    YoY changes ending in each of end_years (default: the last year). One pass over the years.
+    """
+    change = yoy_changes(matrix)
+    change_years = matrix.years[1:]
+    if end_years is None:
+        end_years = change_years[-1:]
+    wanted = {int(y) for y in end_years}
+    stats = [RollingStats(w, len(matrix)) for w in windows]
+    out = {}
+    for t, year in enumerate(change_years):
+        for s in stats:
+            s.add(change[:, t])
+            if t >= s.window:
+                s.remove(change[:, t - s.window])
+            if int(year) in wanted:
+                out[(s.window, int(year))] = (s.count.copy(), s.mean.copy(), s.std())
+    return out
+
+def top_volatility(matrix: GeoYearMatrix, windows=WINDOWS, end_years=None, top_n: int = 5,
+                   min_periods: int = None) -> pd.DataFrame:
+    """Top-N most volatile geos per (window, end year), in one long table."""
+    frames = []
+    for (window, end_year), (count, mean, std) in rolling_volatility(matrix, windows, end_years).items():
+        needed = min(min_periods, window) if min_periods else window
+        valid = (count >= max(needed, 2)) & np.isfinite(std)
+        rows = top_indices(std, valid, top_n, matrix.geos, matrix.states)
+        frames.append(pd.DataFrame({
+            "level": matrix.level,
+            "window_years": window,
+            "start_year": end_year - window,
+            "end_year": end_year,
+            "rank": np.arange(1, len(rows) + 1),
+            "statename": matrix.states[rows],
+            "geo": matrix.geos[rows],
+            "years_tracked": count[rows].astype(np.int64),
+            "avg_yoy_change_pct": round_half_away(mean[rows]),
+            "volatility_pct": round_half_away(std[rows]),
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default=None,
+                        help="DuckDB database to read (default: the current snapshot published by run_analysis.py).")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=["state", "metro", "county", "zip"])
+    parser.add_argument("--windows", nargs="+", type=int, default=list(WINDOWS),
+                        help="Window lengths in years of YoY changes (default: 3 5 10).")
+    parser.add_argument("--end-years", nargs="+", type=int, default=None,
+                        help="Last year of each ranked window (default: the latest year).")
+    parser.add_argument("--min-periods", type=int, default=None,
+                        help="YoY changes a window needs to be ranked (default: the full window).")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--out", type=str, default=None,
+                        help="Output CSV (default: reports/rolling_volatility.csv).")
+    execution.add_arguments(parser)
+    args = parser.parse_args()
+    if any(w < 2 for w in args.windows):
+        parser.error("--windows must be at least 2 years")
+    execution.configure_from_args(args)
+
+    con = snapshots.connect(REPO / "data", args.db)
+    frames = []
+    for level in args.levels:
+        # Unrounded averages: YoY changes are taken on the exact yearly means, like Q4
+        chunks = [top_volatility(m, args.windows, args.end_years, args.top_n, args.min_periods)
+                  for m in matrix_chunks(con, level, decimals=None)]
+        if len(chunks) > 1:
+            chunks = [merge_top(chunks, ["window_years", "end_year"], "volatility_pct", args.top_n,
+                                ["geo", "statename"])]
+        frames.extend(chunks)
+        print(f"[ok] {level}: windows {', '.join(map(str, args.windows))}")
+    con.close()
+    df = pd.concat(frames, ignore_index=True)
+    out = Path(args.out) if args.out else REPORTS / "rolling_volatility.csv"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    print(f"[ok] wrote {out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,175 +1,85 @@
--- Q1. Calculate the yearly average home value index for each state
-
-SELECT
-    statename,
-    year,
-    ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
-FROM home_values_yearly_clean
-WHERE yearlyindex IS NOT NULL
-GROUP BY statename, year
-ORDER BY statename, year;
+-- Source: these queries read home_values_yearly_clean. To run them against the typed,
+-- statename-partitioned Parquet staging layer (written by scripts/run_analysis.py to
+-- data/parquet/home_values_yearly_clean/) instead of the DuckDB table, first run:
+--
+--     SET search_path = 'staging,main';
+--
+-- Filters on statename (and year, when staged with --partition-year) then prune whole
+-- partitions instead of scanning the full dataset.
+--
+-- Q1 below (and the loaders in loaders.sql) is the single copy of this SQL: each
+-- `-- name:` section is one statement with $parameters that scripts/queries.py prepares once
+-- per connection and executes with bound values. Q2-Q4 are rankings over the dense
+-- geo x year matrices (scripts/ranking.py), which loaders.sql's geo_year_matrix feeds.
+-- In the DuckDB CLI:
+--
+--     PREPARE q1_state_averages AS <the Q1 statement>;
+--     EXECUTE q1_state_averages(states := ['CA', 'CO']);
 
--- Q2. Which 5 states have shown the highest growth in home values index from 2000 to 2025?
+-- Shared geo x year rollup cube. scripts/aggregates.py maintains this table once per data
+-- version (merging appended rows incrementally): one row per state, metro, county and city
+-- and year, with the SUM, COUNT, MIN and MAX of yearlyindex and the number of distinct
+-- metros, counties and cities below it. AVG(yearlyindex) = sum_index / count_index. Metros
+-- can span states and are keyed by name alone (statename = '').
 
-WITH state_values AS (
-    SELECT
-        statename,
-        year,
-        ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
+CREATE TABLE IF NOT EXISTS geo_year_summary AS
+WITH leaves AS (
+    SELECT statename, metro, countyname, city, year,
+           SUM(yearlyindex) AS sum_index,
+           COUNT(yearlyindex) AS count_index,
+           MIN(yearlyindex) AS min_index,
+           MAX(yearlyindex) AS max_index
     FROM home_values_yearly_clean
-    WHERE yearlyindex IS NOT NULL
-    GROUP BY statename, year
+    WHERE yearlyindex IS NOT NULL AND statename IS NOT NULL
+    GROUP BY statename, metro, countyname, city, year
 ),
-growth_calc AS (
-    SELECT
-        statename,
-        MIN(CASE WHEN year = 2000 THEN avg_yearly_index END) AS value_2000,
-        MAX(CASE WHEN year = 2025 THEN avg_yearly_index END) AS value_2025
-    FROM state_values
-    GROUP BY statename
-)
-SELECT
-    statename,
-    value_2000,
-    value_2025,
-    ROUND(((value_2025 - value_2000) / value_2000) * 100, 2) AS pct_growth
-FROM growth_calc
-WHERE value_2000 IS NOT NULL AND value_2025 IS NOT NULL
-ORDER BY pct_growth DESC
-LIMIT 5;
-
--- Q3A. Which top 5 cities have shown the highest ABSOLUTE growth in home value index from 2000 to 2025?
-
-WITH city_values AS (
+cube AS (
     SELECT
-        city,
-        statename,
+        CASE WHEN GROUPING(city) = 0 THEN 'city'
+             WHEN GROUPING(countyname) = 0 THEN 'county'
+             WHEN GROUPING(metro) = 0 THEN 'metro'
+             ELSE 'state' END AS level,
+        CASE WHEN GROUPING(metro) = 0 THEN '' ELSE statename END AS statename,
+        CASE WHEN GROUPING(city) = 0 THEN city
+             WHEN GROUPING(countyname) = 0 THEN countyname
+             WHEN GROUPING(metro) = 0 THEN metro
+             ELSE statename END AS geo,
         year,
-        ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
-    FROM home_values_yearly_clean
-    WHERE yearlyindex IS NOT NULL
-    GROUP BY city, statename, year
-),
-city_2000 AS (
-    SELECT
-        city,
-        statename,
-        avg_yearly_index AS value_2000
-    FROM city_values
-    WHERE year = 2000
-),
-city_2025 AS (
-    SELECT
-        city,
-        statename,
-        avg_yearly_index AS value_2025
-    FROM city_values
-    WHERE year = 2025
+        SUM(sum_index) AS sum_index,
+        SUM(count_index) AS count_index,
+        MIN(min_index) AS min_index,
+        MAX(max_index) AS max_index,
+        -- Children are told apart with their state, as county and city names repeat
+        COUNT(DISTINCT CASE WHEN metro IS NOT NULL THEN (statename, metro) END) AS n_metros,
+        COUNT(DISTINCT CASE WHEN countyname IS NOT NULL THEN (statename, countyname) END) AS n_counties,
+        COUNT(DISTINCT CASE WHEN city IS NOT NULL THEN (statename, city) END) AS n_cities
+    FROM leaves
+    GROUP BY GROUPING SETS ((statename, year), (metro, year), (statename, countyname, year), (statename, city, year))
+    HAVING geo IS NOT NULL
 )
 SELECT
-    c2000.city,
-    c2000.statename,
-    c2000.value_2000,
-    c2025.value_2025,
-    (c2025.value_2025 - c2000.value_2000) AS absolute_growth,
-    ROUND(((c2025.value_2025 - c2000.value_2000) / c2000.value_2000) * 100, 2) AS pct_growth
-FROM city_2000 c2000
-JOIN city_2025 c2025 ON c2000.city = c2025.city AND c2000.statename = c2025.statename
-ORDER BY absolute_growth DESC
-LIMIT 5;
+    level, statename, geo, year::SMALLINT AS year, sum_index, count_index, min_index, max_index,
+    -- Child counts only for the levels they nest below
+    CASE WHEN level = 'state' THEN n_metros END AS n_metros,
+    CASE WHEN level IN ('state', 'metro') THEN n_counties END AS n_counties,
+    CASE WHEN level IN ('state', 'metro', 'county') THEN n_cities END AS n_cities
+FROM cube;
 
--- Q3B. Which top 5 cities have shown the highest PERCENTAGE growth in home value index from 2000 to 2025?
+-- The cube's state level: the state x year aggregate Q1 and the workbooks read.
 
-WITH city_values AS (
-    SELECT
-        city,
-        statename,
-        year,
-        ROUND(AVG(yearlyindex), 2) AS avg_yearly_index
-    FROM home_values_yearly_clean
-    WHERE yearlyindex IS NOT NULL
-    GROUP BY city, statename, year
-),
-city_2000 AS (
-    SELECT
-        city,
-        statename,
-        avg_yearly_index AS value_2000
-    FROM city_values
-    WHERE year = 2000
-),
-city_2025 AS (
-    SELECT
-        city,
-        statename,
-        avg_yearly_index AS value_2025
-    FROM city_values
-    WHERE year = 2025
-)
-SELECT
-    c2000.city,
-    c2000.statename,
-    c2000.value_2000,
-    c2025.value_2025,
-    (c2025.value_2025 - c2000.value_2000) AS absolute_growth,
-    ROUND(((c2025.value_2025 - c2000.value_2000) / c2000.value_2000) * 100, 2) AS pct_growth
-FROM city_2000 c2000
-JOIN city_2025 c2025 ON c2000.city = c2025.city AND c2000.statename = c2025.statename
-ORDER BY pct_growth DESC
-LIMIT 5;
-
--- Q4. Which 5 states show the highest volatility in housing values year-over-year?
-
--- Step 1: Calculate yearly averages for each state
-WITH yearly_averages AS (
-    SELECT 
-        statename,
-        year,
-        AVG(yearlyindex) AS avg_index
-    FROM home_values_yearly_clean
-    WHERE yearlyindex IS NOT NULL
-    GROUP BY statename, year
-),
+CREATE OR REPLACE VIEW state_year_summary AS
+SELECT statename, year, sum_index, count_index, min_index, max_index
+FROM geo_year_summary
+WHERE level = 'state';
 
--- Step 2: Calculate year-over-year percentage changes
-yearly_changes AS (
-    SELECT 
-        statename,
-        year,
-        avg_index,
-        LAG(avg_index) OVER (PARTITION BY statename ORDER BY year) AS prev_year_index,
-        -- Calculate percentage change from previous year
-        ROUND(((avg_index - LAG(avg_index) OVER (PARTITION BY statename ORDER BY year)) / 
-               LAG(avg_index) OVER (PARTITION BY statename ORDER BY year)) * 100, 2) AS yoy_change_pct
-    FROM yearly_averages
-),
-
--- Step 3: Calculate volatility metrics for each state
-volatility_analysis AS (
-    SELECT 
-        statename,
-        COUNT(*) AS years_tracked,
-        ROUND(AVG(yoy_change_pct), 2) AS avg_yoy_change,
-        ROUND(STDDEV(yoy_change_pct), 2) AS volatility_stddev,
-        ROUND(MIN(yoy_change_pct), 2) AS worst_year_pct,
-        ROUND(MAX(yoy_change_pct), 2) AS best_year_pct,
-        ROUND(MAX(yoy_change_pct) - MIN(yoy_change_pct), 2) AS volatility_range
-    FROM yearly_changes
-    WHERE yoy_change_pct IS NOT NULL
-    GROUP BY statename
-    HAVING COUNT(*) >= 10  -- Only states with 10+ years of data
-)
-
--- Final result: Top 5 most volatile states
-SELECT 
-    statename AS state,
-    years_tracked,
-    avg_yoy_change AS avg_annual_change_pct,
-    volatility_stddev AS volatility_pct,
-    volatility_range AS range_pct,
-    worst_year_pct,
-    best_year_pct
-FROM volatility_analysis
-ORDER BY volatility_stddev DESC
-LIMIT 5;
+-- name: q1_state_averages
+-- Q1. Calculate the yearly average home value index for each state
+-- (of the list $states; NULL: every state)
 
+SELECT
+    statename,
+    year,
+    ROUND(sum_index / count_index, 2) AS avg_yearly_index
+FROM state_year_summary
+WHERE $states IS NULL OR list_contains($states, statename)
+ORDER BY statename, year;
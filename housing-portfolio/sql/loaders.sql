@@ -0,0 +1,61 @@
+-- Queries the scripts run to load their inputs. Like the questions in analysis.sql, each
+-- `-- name:` section is one statement that scripts/queries.py prepares once per connection
+-- and runs with its $parameters bound.
+
+-- name: top_states
+-- The $top_n states by $metric over their yearly averages, best first (ties by state name).
+-- metric: mean_index (mean of the yearly averages), latest_index (last year's average) or
+-- pct_growth (first to last year).
+SELECT statename
+FROM state_year_summary
+WHERE statename IS NOT NULL
+GROUP BY statename
+ORDER BY
+    CASE $metric
+        WHEN 'mean_index' THEN AVG(sum_index / count_index)
+        WHEN 'latest_index' THEN arg_max(sum_index / count_index, year)
+        WHEN 'pct_growth' THEN (arg_max(sum_index / count_index, year) / arg_min(sum_index / count_index, year) - 1) * 100
+    END DESC NULLS LAST,
+    statename
+LIMIT $top_n;
+
+-- name: geo_year_matrix
+-- Average index of every geo of $level (state, metro, county or city) in every year, the
+-- rows of growth.py's dense geo x year matrix.
+SELECT statename, geo, year, sum_index / count_index AS avg_index
+FROM geo_year_summary
+WHERE level = $level
+ORDER BY statename, geo, year;
+
+-- name: zip_year_matrix
+-- The same for zips, straight from the table (one row per zip and year).
+SELECT statename, regionname AS geo, year, AVG(yearlyindex) AS avg_index
+FROM home_values_yearly_clean
+WHERE yearlyindex IS NOT NULL AND regionname IS NOT NULL
+GROUP BY statename, regionname, year
+ORDER BY statename, regionname, year;
+
+-- name: zip_year_matrix_for_state
+-- The zips of one state ($state NULL: the zips without a state).
+SELECT statename, regionname AS geo, year, AVG(yearlyindex) AS avg_index
+FROM home_values_yearly_clean
+WHERE yearlyindex IS NOT NULL AND regionname IS NOT NULL AND statename IS NOT DISTINCT FROM $state
+GROUP BY statename, regionname, year
+ORDER BY statename, regionname, year;
+
+-- name: record_count
+-- Rows with an index, from the rollup cube's state level.
+SELECT COALESCE(SUM(count_index), 0) AS records
+FROM geo_year_summary
+WHERE level = 'state';
+
+-- name: state_coverage
+-- Distinct cities and counties per state (over all years), from the rollup cube's rows.
+SELECT
+    statename AS State,
+    COUNT(DISTINCT geo) FILTER (WHERE level = 'city') AS Unique_Cities,
+    COUNT(DISTINCT geo) FILTER (WHERE level = 'county') AS Unique_Counties
+FROM geo_year_summary
+WHERE level IN ('state', 'county', 'city')
+GROUP BY statename
+ORDER BY Unique_Cities DESC, State;